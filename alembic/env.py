@@ -9,9 +9,11 @@ from app.db import models
 
 from app.models.user import User
 from app.models.product import Product
+from app.models.product_stock_shard import ProductStockShard
 from app.models.order import Order
 from app.models.order_item import OrderItem
 from app.models.refresh_token import RefreshToken
+from app.models.bcrypt_calibration import BcryptCalibration
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
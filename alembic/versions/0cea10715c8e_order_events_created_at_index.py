@@ -0,0 +1,34 @@
+"""order_events (created_at, id) index
+
+Revision ID: 0cea10715c8e
+Revises: 7c20c846aec5
+Create Date: 2026-10-18 15:02:44.170962
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0cea10715c8e'
+down_revision: Union[str, Sequence[str], None] = '7c20c846aec5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    # Built CONCURRENTLY (outside a transaction) so transitions keep writing events.
+    # A failed build leaves an INVALID index: drop it and rerun the upgrade.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_order_events_created_at_id",
+            "order_events",
+            ["created_at", "id"],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_order_events_created_at_id", table_name="order_events", postgresql_concurrently=True)
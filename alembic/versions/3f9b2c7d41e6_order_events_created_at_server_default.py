@@ -0,0 +1,28 @@
+"""order_events.created_at defaults to now() in the database
+
+Revision ID: 3f9b2c7d41e6
+Revises: 0cea10715c8e
+Create Date: 2026-10-18 17:40:12.518204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9b2c7d41e6'
+down_revision: Union[str, Sequence[str], None] = '0cea10715c8e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    # The ORM no longer sets created_at (it used a naive datetime.utcnow(), read in
+    # the session TimeZone); every insert path now gets the transaction's now()
+    op.alter_column("order_events", "created_at", server_default=sa.text("now()"))
+
+
+def downgrade():
+    op.alter_column("order_events", "created_at", server_default=None)
@@ -0,0 +1,38 @@
+"""order listing indexes
+
+Revision ID: 7c20c846aec5
+Revises: abeee59ec11f
+Create Date: 2026-10-18 14:21:05.613087
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c20c846aec5'
+down_revision: Union[str, Sequence[str], None] = 'abeee59ec11f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (filter column, id) per GET /orders filter, for keyset pagination on id
+INDEXES = {
+    "ix_orders_status_id": ["status", "id"],
+    "ix_orders_customer_id_id": ["customer_id", "id"],
+    "ix_orders_reference_id": ["reference", "id"],
+}
+
+
+def upgrade():
+    # CONCURRENTLY doesn't block writes to orders but can't run in a transaction.
+    # A failed build leaves an INVALID index: drop it and rerun the upgrade.
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES.items():
+            op.create_index(name, "orders", columns, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name in INDEXES:
+            op.drop_index(name, table_name="orders", postgresql_concurrently=True)
@@ -0,0 +1,33 @@
+"""bcrypt calibration shared by all workers
+
+Revision ID: 8d1e5a0c6b27
+Revises: 3f9b2c7d41e6
+Create Date: 2026-10-18 19:12:44.302871
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d1e5a0c6b27'
+down_revision: Union[str, Sequence[str], None] = '3f9b2c7d41e6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    op.create_table(
+        "bcrypt_calibration",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("rounds", sa.Integer(), nullable=False),
+        sa.Column("calibrated_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.CheckConstraint("id = 1", name="ck_bcrypt_calibration_single_row"),
+    )
+
+
+def downgrade():
+    op.drop_table("bcrypt_calibration")
@@ -0,0 +1,44 @@
+"""sharded product stock
+
+Revision ID: 906b35cdb75b
+Revises: a4fd4f22873d
+Create Date: 2026-10-18 10:02:31.774410
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '906b35cdb75b'
+down_revision: Union[str, Sequence[str], None] = 'a4fd4f22873d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    op.add_column("products", sa.Column("stock_shards", sa.Integer(), nullable=False, server_default="0"))
+    op.create_table(
+        "product_stock_shards",
+        sa.Column("product_id", sa.Integer(), sa.ForeignKey("products.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("shard", sa.Integer(), nullable=False),
+        sa.Column("qty", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("product_id", "shard"),
+        sa.CheckConstraint("qty >= 0", name="ck_product_stock_shards_qty_non_negative"),
+    )
+
+
+def downgrade():
+    # Fold sharded stock back into products.stock_qty before dropping the shards
+    op.execute(
+        """
+        UPDATE products p
+        SET stock_qty = p.stock_qty + s.total
+        FROM (SELECT product_id, sum(qty) AS total FROM product_stock_shards GROUP BY product_id) s
+        WHERE p.id = s.product_id
+        """
+    )
+    op.drop_table("product_stock_shards")
+    op.drop_column("products", "stock_shards")
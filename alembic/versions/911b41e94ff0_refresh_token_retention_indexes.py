@@ -0,0 +1,33 @@
+"""refresh token retention indexes
+
+Revision ID: 911b41e94ff0
+Revises: a0fe1ee2884d
+Create Date: 2026-10-18 09:05:12.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '911b41e94ff0'
+down_revision: Union[str, Sequence[str], None] = 'a0fe1ee2884d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    op.create_index("ix_refresh_tokens_expires_at", "refresh_tokens", ["expires_at"])
+    op.create_index(
+        "ix_refresh_tokens_revoked_at",
+        "refresh_tokens",
+        ["revoked_at"],
+        postgresql_where=sa.text("revoked_at IS NOT NULL"),
+    )
+
+
+def downgrade():
+    op.drop_index("ix_refresh_tokens_revoked_at", table_name="refresh_tokens")
+    op.drop_index("ix_refresh_tokens_expires_at", table_name="refresh_tokens")
@@ -0,0 +1,156 @@
+"""partition refresh_tokens by expires_at (opt-in)
+
+Revision ID: a4fd4f22873d
+Revises: 911b41e94ff0
+Create Date: 2026-10-18 09:12:40.551873
+
+Opt-in: this revision is a no-op unless run with
+
+    alembic -x partition_refresh_tokens=true upgrade head
+
+It rebuilds refresh_tokens as a table RANGE-partitioned by expires_at with one
+partition per month (refresh_tokens_pYYYYMM) plus a default partition, so the
+retention sweeper can drop whole partitions instead of DELETEing rows.
+Partitions are created up to `-x partition_months_ahead=N` (default 3) months
+ahead; the sweeper keeps creating upcoming ones afterwards.
+
+Postgres requires unique constraints on a partitioned table to include the
+partition key, so uniqueness becomes (token_hash, expires_at). token_hash is a
+SHA-256 of 48 random bytes, so that is unique in practice. The primary key
+becomes (id, expires_at).
+
+The table is rewritten under an ACCESS EXCLUSIVE lock: run it in a maintenance
+window (or after a sweep, when the table is small).
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4fd4f22873d'
+down_revision: Union[str, Sequence[str], None] = '911b41e94ff0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+COLUMNS = "id, user_id, token_hash, created_at, expires_at, revoked_at"
+
+
+def _enabled() -> bool:
+    return context.get_x_argument(as_dictionary=True).get("partition_refresh_tokens", "").lower() in ("1", "true", "yes")
+
+
+def _is_partitioned() -> bool:
+    return bool(
+        op.get_bind().scalar(
+            sa.text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('refresh_tokens')")
+        )
+    )
+
+
+def _rename_indexes(table: str, suffix: str) -> None:
+    names = op.get_bind().scalars(
+        sa.text("SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = :t"),
+        {"t": table},
+    ).all()
+    for name in names:
+        op.execute(f'ALTER INDEX "{name}" RENAME TO "{name}{suffix}"')
+
+
+def _month_start(d: datetime) -> datetime:
+    return d.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_month(d: datetime) -> datetime:
+    return (d.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def upgrade():
+    if not _enabled() or _is_partitioned():
+        return
+
+    months_ahead = int(context.get_x_argument(as_dictionary=True).get("partition_months_ahead", "3"))
+    bind = op.get_bind()
+
+    op.execute("LOCK TABLE refresh_tokens IN ACCESS EXCLUSIVE MODE")
+    op.execute("ALTER SEQUENCE refresh_tokens_id_seq OWNED BY NONE")
+    op.execute("ALTER TABLE refresh_tokens RENAME TO refresh_tokens_legacy")
+    _rename_indexes("refresh_tokens_legacy", "_legacy")
+
+    op.execute(
+        """
+        CREATE TABLE refresh_tokens (
+            id integer NOT NULL DEFAULT nextval('refresh_tokens_id_seq'),
+            user_id integer NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            token_hash varchar(64) NOT NULL,
+            created_at timestamptz NOT NULL,
+            expires_at timestamptz NOT NULL,
+            revoked_at timestamptz,
+            CONSTRAINT refresh_tokens_pkey PRIMARY KEY (id, expires_at)
+        ) PARTITION BY RANGE (expires_at)
+        """
+    )
+    op.execute("CREATE UNIQUE INDEX ix_refresh_tokens_token_hash ON refresh_tokens (token_hash, expires_at)")
+    op.execute("CREATE INDEX ix_refresh_tokens_user_id ON refresh_tokens (user_id)")
+    op.execute("CREATE INDEX ix_refresh_tokens_user_active ON refresh_tokens (user_id, revoked_at)")
+    op.execute("CREATE INDEX ix_refresh_tokens_expires_at ON refresh_tokens (expires_at)")
+    op.execute(
+        "CREATE INDEX ix_refresh_tokens_revoked_at ON refresh_tokens (revoked_at) WHERE revoked_at IS NOT NULL"
+    )
+
+    now = datetime.now(timezone.utc)
+    oldest = bind.scalar(sa.text("SELECT min(expires_at) FROM refresh_tokens_legacy")) or now
+    month = _month_start(min(oldest, now))
+    last = _month_start(now)
+    for _ in range(months_ahead):
+        last = _next_month(last)
+
+    while month <= last:
+        end = _next_month(month)
+        op.execute(
+            f"CREATE TABLE refresh_tokens_p{month:%Y%m} PARTITION OF refresh_tokens "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{end.isoformat()}')"
+        )
+        month = end
+    op.execute("CREATE TABLE refresh_tokens_default PARTITION OF refresh_tokens DEFAULT")
+
+    op.execute(f"INSERT INTO refresh_tokens ({COLUMNS}) SELECT {COLUMNS} FROM refresh_tokens_legacy")
+    op.execute("DROP TABLE refresh_tokens_legacy")
+    op.execute("ALTER SEQUENCE refresh_tokens_id_seq OWNED BY refresh_tokens.id")
+
+
+def downgrade():
+    if not _is_partitioned():
+        return
+
+    op.execute("LOCK TABLE refresh_tokens IN ACCESS EXCLUSIVE MODE")
+    op.execute("ALTER SEQUENCE refresh_tokens_id_seq OWNED BY NONE")
+    op.execute("ALTER TABLE refresh_tokens RENAME TO refresh_tokens_partitioned")
+    _rename_indexes("refresh_tokens_partitioned", "_partitioned")
+
+    op.execute(
+        """
+        CREATE TABLE refresh_tokens (
+            id integer NOT NULL DEFAULT nextval('refresh_tokens_id_seq') PRIMARY KEY,
+            user_id integer NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            token_hash varchar(64) NOT NULL,
+            created_at timestamptz NOT NULL,
+            expires_at timestamptz NOT NULL,
+            revoked_at timestamptz
+        )
+        """
+    )
+    op.execute(f"INSERT INTO refresh_tokens ({COLUMNS}) SELECT {COLUMNS} FROM refresh_tokens_partitioned")
+    op.execute("DROP TABLE refresh_tokens_partitioned")
+    op.execute("ALTER SEQUENCE refresh_tokens_id_seq OWNED BY refresh_tokens.id")
+
+    op.execute("CREATE UNIQUE INDEX ix_refresh_tokens_token_hash ON refresh_tokens (token_hash)")
+    op.execute("CREATE INDEX ix_refresh_tokens_user_id ON refresh_tokens (user_id)")
+    op.execute("CREATE INDEX ix_refresh_tokens_user_active ON refresh_tokens (user_id, revoked_at)")
+    op.execute("CREATE INDEX ix_refresh_tokens_expires_at ON refresh_tokens (expires_at)")
+    op.execute(
+        "CREATE INDEX ix_refresh_tokens_revoked_at ON refresh_tokens (revoked_at) WHERE revoked_at IS NOT NULL"
+    )
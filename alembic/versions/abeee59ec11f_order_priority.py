@@ -0,0 +1,41 @@
+"""order priority and claim-next indexes
+
+Revision ID: abeee59ec11f
+Revises: 906b35cdb75b
+Create Date: 2026-10-18 13:40:12.208315
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'abeee59ec11f'
+down_revision: Union[str, Sequence[str], None] = '906b35cdb75b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    op.add_column("orders", sa.Column("priority", sa.Integer(), nullable=False, server_default="0"))
+    # Partial: only the RESERVED orders POST /orders/claim-next scans
+    op.create_index(
+        "ix_orders_reserved_priority",
+        "orders",
+        [sa.text("priority DESC"), "id"],
+        postgresql_where=sa.text("status = 'RESERVED'"),
+    )
+    op.create_index(
+        "ix_orders_reserved_id",
+        "orders",
+        ["id"],
+        postgresql_where=sa.text("status = 'RESERVED'"),
+    )
+
+
+def downgrade():
+    op.drop_index("ix_orders_reserved_id", table_name="orders")
+    op.drop_index("ix_orders_reserved_priority", table_name="orders")
+    op.drop_column("orders", "priority")
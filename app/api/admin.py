@@ -0,0 +1,38 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.rbac import require_roles
+from app.db.session import get_db
+from app.schemas.products import ProductStockOut, StockRebalanceOut, StockShardingUpdate
+from app.services.stock_shards import get_product_stock, rebalance_stock_shards, set_stock_shards
+
+router = APIRouter(
+    prefix="/admin/products",
+    tags=["Admin"],
+    dependencies=[Depends(require_roles("admin"))],
+)
+
+
+@router.get("/{product_id}/stock", response_model=ProductStockOut, summary="Product stock (shards aggregated)")
+async def product_stock(product_id: int, db: AsyncSession = Depends(get_db)):
+    return await db.run_sync(get_product_stock, product_id)
+
+
+@router.put("/{product_id}/stock-sharding", response_model=ProductStockOut, summary="Enable/disable sharded stock")
+async def update_stock_sharding(
+    product_id: int, payload: StockShardingUpdate, db: AsyncSession = Depends(get_db)
+):
+    try:
+        await db.run_sync(set_stock_shards, product_id, payload.shards)
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+    return await db.run_sync(get_product_stock, product_id)
+
+
+@router.post("/{product_id}/stock-sharding/rebalance", response_model=StockRebalanceOut, summary="Even out stock shards")
+async def rebalance_stock(product_id: int, db: AsyncSession = Depends(get_db)):
+    changed = await db.run_sync(rebalance_stock_shards, product_id)
+    await db.commit()
+    return {"product_id": product_id, "shards_changed": changed}
@@ -1,13 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import text
 from sqlalchemy.exc import IntegrityError
 
-from app.api.deps import get_db
+from app.db.queries import USER_BY_EMAIL
+from app.db.session import get_db
 from app.models.user import User
 from app.schemas.auth import RegisterRequest, LoginRequest, TokenResponse, RefreshRequest, LogoutRequest
-from app.services.auth import hash_password, verify_password, create_access_token
-from app.api.security import get_current_user
+from app.services.auth import hash_password_async, verify_and_update_password_async, create_access_token
+from app.api.security import get_current_db_user
 from app.services.refresh_tokens import issue_refresh_token, rotate_refresh_token, revoke_refresh_token
 from app.services.auth import create_access_token
 
@@ -15,9 +16,11 @@ from app.services.auth import create_access_token
 
 router = APIRouter(prefix="/auth", tags=["Login"])
 
+# bcrypt runs on the dedicated hashing executor instead of occupying a request thread.
+
 @router.post("/register", status_code=201)
-def register(payload: RegisterRequest, db: Session = Depends(get_db)):
-    existing = db.scalar(select(User).where(User.email == payload.email))
+async def register(payload: RegisterRequest, db: AsyncSession = Depends(get_db)):
+    existing = await db.scalar(USER_BY_EMAIL, {"email": payload.email})
     if existing:
         raise HTTPException(status_code=409, detail="Email already registered")
 
@@ -25,59 +28,60 @@ def register(payload: RegisterRequest, db: Session = Depends(get_db)):
 
     user = User(
         email=payload.email,
-        hashed_password=hash_password(password),
+        hashed_password=await hash_password_async(password),
         role="operator",
     )
 
     db.add(user)
     try:
-        db.commit()
-        db.refresh(user)
+        await db.commit()
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
     return {"message": "registered"}
 
 @router.post("/login", response_model=TokenResponse)
-def login(payload: LoginRequest, db: Session = Depends(get_db)):
-    user = db.scalar(select(User).where(User.email == payload.email))
+async def login(payload: LoginRequest, db: AsyncSession = Depends(get_db)):
+    user = await db.scalar(USER_BY_EMAIL, {"email": payload.email})
 
     password = payload.password.strip()
-    if not user or not verify_password(password, user.hashed_password):
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
+
+    valid, new_hash = await verify_and_update_password_async(password, user.hashed_password)
+    if not valid:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
 
-    access = create_access_token(subject=user.email)
+    # Stored hash uses a lower bcrypt cost than this deployment: persist the rehash
+    # in the same commit as the refresh token
+    if new_hash:
+        user.hashed_password = new_hash
+
+    access = create_access_token(subject=user.email, user_id=user.id, role=user.role)
 
     # create & store refresh in DB
-    refresh = issue_refresh_token(db, user_id=user.id)
-    db.commit()
+    refresh = await db.run_sync(issue_refresh_token, user_id=user.id)
+    await db.commit()
 
     return TokenResponse(access_token=access, refresh_token=refresh)
 
 @router.post("/refresh", response_model=TokenResponse)
-def refresh(payload: RefreshRequest, db: Session = Depends(get_db)):
-    user_id = rotate_refresh_token(db, payload.refresh_token)
-
-    # issue new refresh (rotation)
-    new_refresh = issue_refresh_token(db, user_id=user_id)
-
-    # fetch user email for access token
-    user = db.scalar(select(User).where(User.id == user_id))
-    if not user:
-        raise HTTPException(status_code=401, detail="User not found")
+async def refresh(payload: RefreshRequest, db: AsyncSession = Depends(get_db)):
+    # revoke old + insert new + fetch user claims: one statement
+    new_refresh, user = await db.run_sync(rotate_refresh_token, payload.refresh_token)
 
-    new_access = create_access_token(subject=user.email)
+    new_access = create_access_token(subject=user.email, user_id=user.id, role=user.role)
 
-    db.commit()
+    await db.commit()
     return TokenResponse(access_token=new_access, refresh_token=new_refresh)
 
 @router.post("/logout")
-def logout(payload: LogoutRequest, db: Session = Depends(get_db)):
-    revoke_refresh_token(db, payload.refresh_token)
-    db.commit()
+async def logout(payload: LogoutRequest, db: AsyncSession = Depends(get_db)):
+    await db.run_sync(revoke_refresh_token, payload.refresh_token)
+    await db.commit()
     return {"message": "logged out"}
 
 @router.get("/me")
-def me(current_user: User = Depends(get_current_user)):
+async def me(current_user: User = Depends(get_current_db_user)):
     return {"id": current_user.id, "email": current_user.email, "role": current_user.role}
\ No newline at end of file
@@ -1,8 +1,67 @@
-from app.db.session import SessionLocal
+import contextlib
 
-def get_db():
-    db = SessionLocal()
-    try:
+from fastapi import Depends, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.security import Principal, get_current_user
+from app.db.replica import REPLICA_ERRORS, mark_replica_down, use_replica
+from app.db.session import AsyncReplicaSessionLocal, ReplicaSessionLocal, request_session
+
+# Re-export the single per-request session provider. FastAPI caches dependencies
+# by callable identity, so every router and auth dependency must share this one
+# function to get one Session (and one pooled connection) per request.
+from app.db.session import get_db
+
+
+async def read_from_replica(
+    request: Request,
+    current_user: Principal = Depends(get_current_user),
+) -> bool:
+    """Routing decision for this request's reads (made once, cached by FastAPI)."""
+    return use_replica(request.headers.get("X-Read-Primary", "").lower() == "true", current_user.id)
+
+
+class ReplicaReads:
+    """
+    The read endpoints' session when they read from the replica. A read the
+    replica fails (REPLICA_ERRORS) marks it down and is retried on the
+    request's primary session, so the request still succeeds and the next
+    ones read from the primary until the lag monitor sees the replica healthy.
+    """
+
+    def __init__(self, replica, primary):
+        self.replica = replica
+        self.primary = primary
+
+    async def run_sync(self, fn, *args, **kwargs):
+        try:
+            return await self.replica.run_sync(fn, *args, **kwargs)
+        except REPLICA_ERRORS as e:
+            mark_replica_down(repr(e))
+            with contextlib.suppress(Exception):
+                await self.replica.rollback()
+        return await self.primary.run_sync(fn, *args, **kwargs)
+
+
+async def get_read_db(
+    replica: bool = Depends(read_from_replica),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Session for read-only endpoints: the replica (ReplicaReads, falling back
+    to the primary) when read_from_replica allows it, else the request's
+    primary session.
+    """
+    if not replica:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
+        return
+
+    # End the primary's transaction (the caller's lookup in AUTH_MODE=db) so it
+    # doesn't hold a pooled connection idle in transaction during the replica read;
+    # rollback, not commit: a commit would count as the caller's write
+    await db.rollback()
+    async with request_session(ReplicaSessionLocal, AsyncReplicaSessionLocal) as replica_db:
+        yield ReplicaReads(replica_db, db)
+
+
+__all__ = ["ReplicaReads", "get_db", "get_read_db", "read_from_replica"]
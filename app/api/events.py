@@ -0,0 +1,45 @@
+from datetime import datetime
+from typing import Literal
+
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.deps import get_read_db, read_from_replica
+from app.api.rbac import require_roles
+from app.core.config import settings
+from app.db.replica import stream_from_replica
+from app.db.session import ReplicaSessionLocal, SessionLocal
+from app.schemas.events import OrderEventPage
+from app.services.order_events import export_events_ndjson, list_events
+
+router = APIRouter(
+    prefix="/events",
+    tags=["Audit"],
+    dependencies=[Depends(require_roles("admin", "operator"))],
+)
+
+
+@router.get("", response_model=OrderEventPage, summary="Search order events")
+async def search_events(
+    request_id: str | None = Query(None),
+    since: datetime | None = Query(None, description="Inclusive"),
+    until: datetime | None = Query(None, description="Exclusive"),
+    cursor: str | None = Query(None, description="next_cursor of the previous page"),
+    limit: int = Query(settings.events_page_size, ge=1, le=settings.events_page_max_size),
+    format: Literal["json", "ndjson"] = Query("json", description="ndjson streams the whole window, unpaged"),
+    replica: bool = Depends(read_from_replica),
+    db: AsyncSession = Depends(get_read_db),
+):
+    if format == "ndjson":
+
+        def stream(session_factory):
+            return export_events_ndjson(request_id, since, until, session_factory=session_factory)
+
+        return StreamingResponse(
+            stream_from_replica(stream, ReplicaSessionLocal, SessionLocal) if replica else stream(SessionLocal),
+            media_type="application/x-ndjson",
+        )
+
+    events, next_cursor = await db.run_sync(list_events, request_id, since, until, cursor, limit)
+    return OrderEventPage(items=events, next_cursor=next_cursor)
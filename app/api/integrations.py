@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.rbac import require_roles
 from app.db.session import get_db
@@ -13,19 +13,18 @@ router = APIRouter(
 )
 
 @router.post("/orders/{order_id}/reserve")
-def integration_reserve(order_id: int, db: Session = Depends(get_db)):
-    order = get_order(db, order_id)
+async def integration_reserve(order_id: int, db: AsyncSession = Depends(get_db)):
+    order = await db.run_sync(get_order, order_id, for_update=True)
     if order.status == OrderStatus.RESERVED:
         return {"status": "RESERVED"}  # idempotent
 
-    reserve_stock_for_order(db, order_id)
-    transition(db, order, OrderStatus.RESERVED, actor=None, request_id=None)
-    db.commit()
+    await db.run_sync(reserve_stock_for_order, order_id)
+    await db.run_sync(transition, order, OrderStatus.RESERVED, actor=None, request_id=None, commit=True)
     return {"status": "RESERVED"}
 
 @router.post("/orders/{order_id}/release")
-def integration_release(order_id: int, db: Session = Depends(get_db)):
-    order = get_order(db, order_id)
+async def integration_release(order_id: int, db: AsyncSession = Depends(get_db)):
+    order = await db.run_sync(get_order, order_id, for_update=True)
     if order.status == OrderStatus.CANCELLED:
         return {"status": "CANCELLED"}  # idempotent
 
@@ -34,8 +33,7 @@ def integration_release(order_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=409, detail=f"Cannot release from {order.status}")
 
     if order.status in (OrderStatus.RESERVED, OrderStatus.PICKING, OrderStatus.PICKED):
-        restock_for_order(db, order_id)
+        await db.run_sync(restock_for_order, order_id)
 
-    transition(db, order, OrderStatus.CANCELLED, actor=None, request_id=None)
-    db.commit()
+    await db.run_sync(transition, order, OrderStatus.CANCELLED, actor=None, request_id=None, commit=True)
     return {"status": "CANCELLED"}
\ No newline at end of file
@@ -0,0 +1,96 @@
+import logging
+import time
+import uuid
+
+from jose import JWTError
+from starlette.datastructures import MutableHeaders
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.services.auth import decode_access_token
+
+logger = logging.getLogger("app")
+
+METRICS_PATH = "/metrics"
+
+
+def _header(scope: Scope, name: bytes) -> str | None:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+class RequestContextMiddleware:
+    """
+    Pure ASGI replacement for the former @app.middleware("http") function:
+    request-id propagation, the admin-only /metrics guard, timing and access log.
+    Unlike BaseHTTPMiddleware it doesn't wrap the response in a streaming
+    proxy; it only decorates the http.response.start message.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Use upstream request id if provided; otherwise generate one
+        rid = _header(scope, b"x-request-id") or str(uuid.uuid4())
+
+        # Make it available everywhere (endpoints + exception handlers via request.state)
+        scope.setdefault("state", {})["request_id"] = rid
+
+        path = scope["path"]
+        if path == METRICS_PATH:
+            denied = self._metrics_guard(scope, rid)
+            if denied is not None:
+                await denied(scope, receive, send)
+                return
+
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                # Propagate back to client
+                MutableHeaders(scope=message)["X-Request-ID"] = rid
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            logger.exception("unhandled_error", extra={"request_id": rid, "path": path})
+            raise
+
+        logger.info(
+            "request",
+            extra={
+                "request_id": rid,
+                "method": scope["method"],
+                "path": path,
+                "status_code": status_code,
+                "duration_ms": int((time.perf_counter() - start) * 1000),
+            },
+        )
+
+    @staticmethod
+    def _metrics_guard(scope: Scope, rid: str) -> JSONResponse | None:
+        # ADMIN-ONLY GUARD for /metrics (Prometheus Instrumentator exposes it publicly)
+        auth = _header(scope, b"authorization") or ""
+        if not auth.startswith("Bearer "):
+            return JSONResponse(status_code=401, content={"detail": "Missing Bearer token", "request_id": rid})
+
+        token = auth.split(" ", 1)[1].strip()
+        try:
+            payload = decode_access_token(token)
+        except JWTError:
+            return JSONResponse(status_code=401, content={"detail": "Invalid token", "request_id": rid})
+
+        if payload.get("role") != "admin":
+            return JSONResponse(status_code=403, content={"detail": "Forbidden", "request_id": rid})
+        return None
@@ -1,19 +1,41 @@
-from fastapi import APIRouter, Depends, Body, HTTPException, Request
+from dataclasses import dataclass, field
+from typing import Callable, List, Literal, Mapping
+
+from fastapi import APIRouter, Depends, Body, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
+from app.api.deps import get_read_db, read_from_replica
 from app.api.rbac import require_roles
-from app.api.security import get_current_user
-from app.db.session import get_db
+from app.api.security import Principal, get_current_user
+from app.core.config import settings
+from app.db.replica import note_write, stream_from_replica
+from app.db.session import ReplicaSessionLocal, SessionLocal, get_db
 from app.models.order import Order, OrderStatus
-from app.models.order_item import OrderItem
-from app.models.user import User
-from app.schemas.orders import OrderCreate, OrderOut
+from app.schemas.events import OrderEventPage
+from app.schemas.orders import (
+    OrderBulkCreate,
+    OrderBulkResponse,
+    OrderCreate,
+    OrderOut,
+    OrderPage,
+    OrderTransitionBulk,
+    OrderTransitionBulkResponse,
+)
 from app.services.orders_service import (
+    apply_reservation,
+    create_orders_bulk,
     get_order,
-    reserve_stock_for_order,
+    insert_order,
+    list_orders,
     restock_for_order,
-    transition,
+    transition_orders_bulk,
 )
+from app.services.order_events import list_order_events
+from app.services.order_export import export_csv, export_ndjson
+from app.services.reservation_batcher import reservation_coordinator
+from app.services.state_machine import TRANSITIONS, Transition, apply_transition, claim_orders, current_status
 
 router = APIRouter(
     prefix="/orders",
@@ -28,8 +50,19 @@ def _request_id(request: Request) -> str | None:
     return rid or request.headers.get("X-Request-ID")
 
 
+async def _reserve_batched(
+    db: AsyncSession, order_id: int, from_status: OrderStatus, current_user: Principal, rid: str | None
+) -> Order:
+    # Don't keep this request's transaction open while it waits for the batch
+    await db.rollback()
+    await reservation_coordinator.reserve(order_id, from_status, actor=current_user, request_id=rid)
+    # Committed by the coordinator's session, not this one
+    note_write(current_user.id)
+    return await db.run_sync(get_order, order_id)
+
+
 @router.post("", response_model=OrderOut, summary="Create order")
-def create_order(
+async def create_order(
     request: Request,
     payload: OrderCreate = Body(
         ...,
@@ -42,226 +75,303 @@ def create_order(
             ],
         },
     ),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    order = Order(customer_id=payload.customer_id, reference=payload.reference, status=OrderStatus.NEW)
-    db.add(order)
-    db.flush()
-
-    for it in payload.items:
-        db.add(OrderItem(order_id=order.id, product_id=it.product_id, qty=it.qty))
-
-    db.commit()
-    db.refresh(order)
+    order = await db.run_sync(insert_order, payload)
+    await db.commit()
     return order
 
 
-@router.get("/{order_id}", response_model=OrderOut, summary="Get order")
-def read_order(
-    order_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
-):
-    return get_order(db, order_id)
-
-
-@router.post("/{order_id}/reserve", response_model=OrderOut, summary="Reserve stock")
-def reserve(
-    order_id: int,
-    request: Request,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+@router.get("", response_model=OrderPage, summary="List orders")
+async def list_orders_page(
+    status: OrderStatus | None = Query(None),
+    customer_id: int | None = Query(None),
+    reference: str | None = Query(None),
+    after: int | None = Query(None, description="next_after of the previous page"),
+    limit: int = Query(settings.orders_page_size, ge=1, le=settings.orders_page_max_size),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    order = get_order(db, order_id)
+    orders, next_after = await db.run_sync(list_orders, status, customer_id, reference, after, limit)
+    return OrderPage(items=orders, next_after=next_after)
 
-    # Idempotency (only for the target state)
-    if order.status == OrderStatus.RESERVED:
-        return order
 
-    # Policy: retry explicitly via /retry-reserve
-    if order.status == OrderStatus.FAILED_RESERVATION:
-        raise HTTPException(status_code=409, detail="Order previously failed reservation")
+EXPORT_FORMATS = {
+    "ndjson": (export_ndjson, "application/x-ndjson"),
+    "csv": (export_csv, "text/csv"),
+}
 
-    rid = _request_id(request)
 
-    try:
-        reserve_stock_for_order(db, order_id)
-        transition(db, order, OrderStatus.RESERVED, actor=current_user, request_id=rid)
-        db.commit()
-        db.refresh(order)
-        return order
-
-    except HTTPException as e:
-        db.rollback()
-
-        # For insufficient stock (409), mark FAILED_RESERVATION + audit it
-        if e.status_code == 409:
-            order = get_order(db, order_id)
-            transition(db, order, OrderStatus.FAILED_RESERVATION, actor=current_user, request_id=rid)
-            db.commit()
-            db.refresh(order)
+@router.get("/export", summary="Export orders with their items (streamed)")
+async def export_orders(
+    format: Literal["ndjson", "csv"] = Query("ndjson"),
+    status: OrderStatus | None = Query(None),
+    min_id: int | None = Query(None, description="Inclusive"),
+    max_id: int | None = Query(None, description="Inclusive"),
+    replica: bool = Depends(read_from_replica),
+    current_user: Principal = Depends(get_current_user),
+):
+    render, media_type = EXPORT_FORMATS[format]
 
-        raise
+    def stream(session_factory):
+        return render(status, min_id, max_id, session_factory=session_factory)
 
-    except Exception:
-        db.rollback()
-        raise
+    return StreamingResponse(
+        stream_from_replica(stream, ReplicaSessionLocal, SessionLocal) if replica else stream(SessionLocal),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="orders.{format}"'},
+    )
 
 
-@router.post("/{order_id}/start-pick", response_model=OrderOut, summary="Start picking")
-def start_pick(
-    order_id: int,
-    request: Request,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+@router.post("/bulk", response_model=OrderBulkResponse, summary="Create orders in bulk")
+async def create_orders_in_bulk(
+    payload: OrderBulkCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    order = get_order(db, order_id)
-
-    # idempotent only if already in target state
-    if order.status == OrderStatus.PICKING:
-        return order
-
-    # strict: can only start picking from RESERVED
-    if order.status != OrderStatus.RESERVED:
+    if len(payload.orders) > settings.orders_bulk_max_batch:
         raise HTTPException(
-            status_code=409,
-            detail=f"Cannot start picking from {order.status}. Expected {OrderStatus.RESERVED}.",
+            status_code=413,
+            detail=f"Too many orders: {len(payload.orders)} > {settings.orders_bulk_max_batch}",
         )
 
-    transition(db, order, OrderStatus.PICKING, actor=current_user, request_id=_request_id(request))
-    db.commit()
-    db.refresh(order)
-    return order
+    try:
+        results = await db.run_sync(create_orders_bulk, payload.orders)
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
 
+    created = sum(1 for r in results if r["ok"])
+    return OrderBulkResponse(created=created, failed=len(results) - created, results=results)
 
-@router.post("/{order_id}/confirm-pick", response_model=OrderOut, summary="Confirm picked")
-def confirm_pick(
-    order_id: int,
+
+@router.post("/transitions", response_model=OrderTransitionBulkResponse, summary="Transition orders in bulk")
+async def transition_orders_in_bulk(
+    payload: OrderTransitionBulk,
     request: Request,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    order = get_order(db, order_id)
-
-    # idempotent only if already in target state
-    if order.status == OrderStatus.PICKED:
-        return order
-
-    # strict: can only confirm pick from PICKING
-    if order.status != OrderStatus.PICKING:
+    if len(payload.order_ids) > settings.orders_transitions_max_batch:
         raise HTTPException(
-            status_code=409,
-            detail=f"Cannot confirm pick from {order.status}. Expected {OrderStatus.PICKING}.",
+            status_code=413,
+            detail=f"Too many orders: {len(payload.order_ids)} > {settings.orders_transitions_max_batch}",
         )
 
-    transition(db, order, OrderStatus.PICKED, actor=current_user, request_id=_request_id(request))
-    db.commit()
-    db.refresh(order)
-    return order
-
-
-@router.post("/{order_id}/ship", response_model=OrderOut, summary="Ship order")
-def ship(
-    order_id: int,
-    request: Request,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
-):
-    order = get_order(db, order_id)
-
-    # idempotent only if already in target state
-    if order.status == OrderStatus.SHIPPED:
-        return order
-
-    # strict: can only ship from PICKED
-    if order.status != OrderStatus.PICKED:
-        raise HTTPException(
-            status_code=409,
-            detail=f"Cannot ship from {order.status}. Expected {OrderStatus.PICKED}.",
+    try:
+        results = await db.run_sync(
+            transition_orders_bulk,
+            payload.to_status,
+            payload.order_ids,
+            actor=current_user,
+            request_id=_request_id(request),
         )
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
 
-    transition(db, order, OrderStatus.SHIPPED, actor=current_user, request_id=_request_id(request))
-    db.commit()
-    db.refresh(order)
-    return order
+    applied = sum(1 for r in results if r["ok"])
+    return OrderTransitionBulkResponse(
+        to_status=payload.to_status, applied=applied, failed=len(results) - applied, results=results
+    )
 
 
-@router.post("/{order_id}/cancel", response_model=OrderOut, summary="Cancel order")
-def cancel(
-    order_id: int,
+@router.post("/claim-next", response_model=List[OrderOut], summary="Claim next orders to pick")
+async def claim_next(
     request: Request,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    limit: int = Query(1, ge=1),
+    order_by: Literal["priority", "age"] = Query("priority"),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    order = get_order(db, order_id)
-
-    # idempotent only if already in target state
-    if order.status == OrderStatus.CANCELLED:
-        return order
-
-    # strict rule: cannot cancel shipped
-    if order.status == OrderStatus.SHIPPED:
-        raise HTTPException(status_code=409, detail="Cannot cancel a shipped order")
-
-    rid = _request_id(request)
+    # Work queue: RESERVED -> PICKING for orders nobody else is claiming (SKIP LOCKED)
+    if limit > settings.orders_claim_max_limit:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many orders: {limit} > {settings.orders_claim_max_limit}",
+        )
 
     try:
-        # Restock only if stock was decremented earlier
-        if order.status in (OrderStatus.RESERVED, OrderStatus.PICKING, OrderStatus.PICKED):
-            restock_for_order(db, order_id)
-
-        transition(db, order, OrderStatus.CANCELLED, actor=current_user, request_id=rid)
-        db.commit()
-        db.refresh(order)
-        return order
-
+        claimed = await db.run_sync(claim_orders, order_by, limit, actor=current_user, request_id=_request_id(request))
+        await db.commit()
     except Exception:
-        db.rollback()
+        await db.rollback()
         raise
+    return claimed
 
 
-@router.post("/{order_id}/retry-reserve", response_model=OrderOut, summary="Retry reserve stock")
-def retry_reserve(
+@router.get("/{order_id}", response_model=OrderOut, summary="Get order")
+async def read_order(
     order_id: int,
-    request: Request,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    order = get_order(db, order_id)
+    return await db.run_sync(get_order, order_id)
 
-    # Idempotency (only for target state)
-    if order.status == OrderStatus.RESERVED:
-        return order
-
-    # strict: retry only from FAILED_RESERVATION
-    if order.status != OrderStatus.FAILED_RESERVATION:
-        raise HTTPException(
-            status_code=409,
-            detail=f"Retry reserve allowed only for FAILED_RESERVATION. Current: {order.status}",
-        )
-
-    rid = _request_id(request)
-
-    try:
-        reserve_stock_for_order(db, order_id)
-        transition(db, order, OrderStatus.RESERVED, actor=current_user, request_id=rid)
-        db.commit()
-        db.refresh(order)
-        return order
-
-    except HTTPException as e:
-        db.rollback()
 
+@router.get("/{order_id}/events", response_model=OrderEventPage, summary="Order audit trail")
+async def read_order_events(
+    order_id: int,
+    cursor: str | None = Query(None, description="next_cursor of the previous page"),
+    limit: int = Query(settings.events_page_size, ge=1, le=settings.events_page_max_size),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    events, next_cursor = await db.run_sync(list_order_events, order_id, cursor, limit)
+    return OrderEventPage(items=events, next_cursor=next_cursor)
+
+
+# Statuses in which the order holds reserved stock
+STOCK_HELD = (OrderStatus.RESERVED, OrderStatus.PICKING, OrderStatus.PICKED)
+
+
+def _restock_if_held(db: Session, order_id: int, from_status: OrderStatus) -> None:
+    # Restock only if stock was decremented earlier
+    if from_status in STOCK_HELD:
+        restock_for_order(db, order_id)
+
+
+@dataclass(frozen=True)
+class TransitionRoute:
+    path: str
+    summary: str
+    transition: Transition
+    # 409 detail when the order isn't in a status the transition starts from;
+    # {status} = current status, {expected} = the from status(es), {to} = target
+    conflict: str = "Invalid transition {status} -> {to}"
+    conflicts: Mapping[OrderStatus, str] = field(default_factory=dict)
+    # Runs after the status change, in the same transaction (gets the previous status)
+    effect: Callable[[Session, int, OrderStatus], None] | None = None
+    # Status change + stock reservation in one statement (apply_reservation)
+    reserves_stock: bool = False
+    # Recorded in a new transaction when the effect or the reservation fails with 409 (e.g. no stock)
+    on_conflict: Transition | None = None
+    # Goes through the reservation coordinator when batching is enabled
+    batched: bool = False
+
+    def conflict_detail(self, status: OrderStatus) -> str:
+        template = self.conflicts.get(status, self.conflict)
+        expected = ", ".join(str(s) for s in sorted(self.transition.from_statuses))
+        return template.format(status=status, expected=expected, to=self.transition.to_status)
+
+
+TRANSITION_ROUTES = (
+    TransitionRoute(
+        "reserve",
+        "Reserve stock",
+        TRANSITIONS["reserve"],
+        # Policy: retry explicitly via /retry-reserve
+        conflicts={OrderStatus.FAILED_RESERVATION: "Order previously failed reservation"},
+        reserves_stock=True,
+        on_conflict=TRANSITIONS["fail-reservation"],
+        batched=True,
+    ),
+    TransitionRoute(
+        "start-pick",
+        "Start picking",
+        TRANSITIONS["start-pick"],
+        # strict: only from the one preceding state
+        "Cannot start picking from {status}. Expected {expected}.",
+    ),
+    TransitionRoute(
+        "confirm-pick",
+        "Confirm picked",
+        TRANSITIONS["confirm-pick"],
+        # strict: only from the one preceding state
+        "Cannot confirm pick from {status}. Expected {expected}.",
+    ),
+    TransitionRoute(
+        "ship",
+        "Ship order",
+        TRANSITIONS["ship"],
+        # strict: only from the one preceding state
+        "Cannot ship from {status}. Expected {expected}.",
+    ),
+    TransitionRoute(
+        "cancel",
+        "Cancel order",
+        TRANSITIONS["cancel"],
+        conflicts={OrderStatus.SHIPPED: "Cannot cancel a shipped order"},
+        effect=_restock_if_held,
+    ),
+    TransitionRoute(
+        "retry-reserve",
+        "Retry reserve stock",
+        TRANSITIONS["retry-reserve"],
+        "Retry reserve allowed only for FAILED_RESERVATION. Current: {status}",
+        reserves_stock=True,
         # If still no stock, keep FAILED_RESERVATION but audit the re-failure
-        if e.status_code == 409:
-            order = get_order(db, order_id)
-            transition(db, order, OrderStatus.FAILED_RESERVATION, actor=current_user, request_id=rid)
-            db.commit()
-            db.refresh(order)
+        on_conflict=TRANSITIONS["fail-reservation"],
+        batched=True,
+    ),
+)
 
-        raise
 
-    except Exception:
-        db.rollback()
-        raise
\ No newline at end of file
+def _transition_endpoint(route: TransitionRoute):
+    t = route.transition
+
+    async def endpoint(
+        order_id: int,
+        request: Request,
+        db: AsyncSession = Depends(get_db),
+        current_user: Principal = Depends(get_current_user),
+    ):
+        rid = _request_id(request)
+
+        if route.batched and reservation_coordinator.enabled:
+            status = await db.run_sync(current_status, order_id)
+            if status == t.to_status:
+                return await db.run_sync(get_order, order_id)
+            if status not in t.from_statuses:
+                raise HTTPException(status_code=409, detail=route.conflict_detail(status))
+            return await _reserve_batched(db, order_id, status, current_user, rid)
+
+        try:
+            # Status check + update + audit event in one statement; committed right
+            # away when nothing else joins the transaction (one round-trip on psycopg 3)
+            if route.reserves_stock:
+                order = await db.run_sync(apply_reservation, t, order_id, actor=current_user, request_id=rid)
+            else:
+                order = await db.run_sync(
+                    apply_transition, t, order_id, actor=current_user, request_id=rid, commit=route.effect is None
+                )
+            if order is not None:
+                if route.effect is not None:
+                    await db.run_sync(route.effect, order_id, order.from_status)
+                await db.commit()
+                return order
+
+        except HTTPException as e:
+            await db.rollback()
+
+            if e.status_code == 409 and route.on_conflict is not None:
+                await db.run_sync(apply_transition, route.on_conflict, order_id, actor=current_user, request_id=rid)
+                await db.commit()
+
+            raise
+
+        except Exception:
+            await db.rollback()
+            raise
+
+        status = await db.run_sync(current_status, order_id)
+        # Idempotency (only for the target state)
+        if status == t.to_status:
+            return await db.run_sync(get_order, order_id)
+        raise HTTPException(status_code=409, detail=route.conflict_detail(status))
+
+    endpoint.__name__ = route.path.replace("-", "_")
+    return endpoint
+
+
+for _route in TRANSITION_ROUTES:
+    router.add_api_route(
+        f"/{{order_id}}/{_route.path}",
+        _transition_endpoint(_route),
+        methods=["POST"],
+        response_model=OrderOut,
+        summary=_route.summary,
+    )
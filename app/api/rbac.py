@@ -1,10 +1,9 @@
 from fastapi import Depends, HTTPException
-from app.api.security import get_current_user
-from app.models.user import User
+from app.api.security import Principal, get_current_user
 
 
 def require_roles(*roles: str):
-    def _dep(current_user: User = Depends(get_current_user)) -> User:
+    async def _dep(current_user: Principal = Depends(get_current_user)) -> Principal:
         if current_user.role not in roles:
             raise HTTPException(status_code=403, detail="Forbidden")
         return current_user
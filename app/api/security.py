@@ -1,31 +1,85 @@
+from dataclasses import dataclass
+
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from jose import JWTError, jwt
-from sqlalchemy import select
-from sqlalchemy.orm import Session
+from jose import JWTError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
-from app.api.deps import get_db
+from app.db.queries import USER_BY_EMAIL
+from app.db.session import get_db
 from app.models.user import User
+from app.services.auth import decode_access_token
+from app.services.principal_cache import principal_cache
 
 bearer = HTTPBearer(auto_error=False)
 
-def get_current_user(
+
+@dataclass(frozen=True)
+class Principal:
+    """
+    Authenticated caller as seen by RBAC and audit code (id, email, role).
+    Endpoints that need the ORM row depend on get_current_db_user instead.
+    """
+    id: int
+    email: str
+    role: str
+
+    @classmethod
+    def from_user(cls, user: User) -> "Principal":
+        return cls(id=user.id, email=user.email, role=user.role)
+
+
+async def get_current_user(
     creds: HTTPAuthorizationCredentials = Depends(bearer),
-    db: Session = Depends(get_db),
-) -> User:
+    db: AsyncSession = Depends(get_db),
+) -> Principal:
+    principal = await _resolve_principal(creds, db)
+    # Commits on this session count as the caller's writes (read-your-writes
+    # routing, app.db.replica)
+    db.info["user_id"] = principal.id
+    return principal
+
+
+async def _resolve_principal(creds: HTTPAuthorizationCredentials | None, db: AsyncSession) -> Principal:
     if not creds:
         raise HTTPException(status_code=401, detail="Missing token")
 
     try:
-        payload = jwt.decode(creds.credentials, settings.jwt_secret, algorithms=[settings.jwt_algorithm])
+        payload = decode_access_token(creds.credentials)
         email = payload.get("sub")
         if not email:
             raise HTTPException(status_code=401, detail="Invalid token")
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-    user = db.scalar(select(User).where(User.email == email))
+    # Stateless mode: the signed claims are the source of truth, no DB round-trip.
+    # Tokens issued before uid/role claims existed fall through to the lookup below.
+    if settings.auth_mode == "stateless":
+        uid, role = payload.get("uid"), payload.get("role")
+        if uid is not None and role:
+            return Principal(id=uid, email=email, role=role)
+
+    cached = principal_cache.get(email)
+    if cached is not None:
+        return cached
+
+    epoch = principal_cache.epoch
+    user = await db.scalar(USER_BY_EMAIL, {"email": email})
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+
+    principal = Principal.from_user(user)
+    principal_cache.set(email, principal, epoch=epoch)
+    return principal
+
+
+async def get_current_db_user(
+    principal: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+) -> User:
+    # In "db" mode on a cache miss the row is already in the identity map (no extra SELECT)
+    user = await db.get(User, principal.id)
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
     return user
@@ -0,0 +1,39 @@
+import logging
+import threading
+from typing import Callable
+
+logger = logging.getLogger("app")
+
+
+class PeriodicTask:
+    """
+    Runs `fn()` on a daemon thread every `interval_seconds` until stopped.
+    Errors are logged and the task keeps its schedule. An interval <= 0 disables it.
+    """
+
+    def __init__(self, name: str, interval_seconds: float, fn: Callable[[], object]):
+        self.name = name
+        self.interval_seconds = interval_seconds
+        self.fn = fn
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self.interval_seconds <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                self.fn()
+            except Exception:
+                logger.exception("periodic_task_error", extra={"task": self.name})
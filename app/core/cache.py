@@ -0,0 +1,92 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+from app.core.metrics import CACHE_ENTRIES, CACHE_EVICTIONS, CACHE_HITS, CACHE_MISSES
+
+
+class TTLCache:
+    """
+    Thread-safe, bounded LRU cache with per-entry expiry.
+    Hit/miss/eviction counts are exported on /metrics under cache=<name>.
+    A maxsize of 0 disables the cache (get always misses, set is a no-op).
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl_seconds: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped on every invalidation; lets readers detect a concurrent invalidation
+        self._epoch = 0
+
+        self._hits = CACHE_HITS.labels(name)
+        self._misses = CACHE_MISSES.labels(name)
+        self._evicted_lru = CACHE_EVICTIONS.labels(name, "lru")
+        self._evicted_expired = CACHE_EVICTIONS.labels(name, "expired")
+        self._evicted_invalidated = CACHE_EVICTIONS.labels(name, "invalidated")
+        CACHE_ENTRIES.labels(name).set_function(lambda: len(self._data))
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    @property
+    def epoch(self) -> int:
+        return self._epoch
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Any | None:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                expires_at, value = item
+                if expires_at > now:
+                    self._data.move_to_end(key)
+                    self._hits.inc()
+                    return value
+                del self._data[key]
+                self._evicted_expired.inc()
+        self._misses.inc()
+        return None
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: float | None = None, epoch: int | None = None) -> None:
+        """
+        Store value for min(ttl_seconds, cache ttl). When `epoch` is given (read
+        from .epoch before loading the value) the write is dropped if any
+        invalidation happened in between, so a stale load can't be re-cached.
+        """
+        if not self.enabled:
+            return
+        ttl = self.ttl_seconds if ttl_seconds is None else min(ttl_seconds, self.ttl_seconds)
+        if ttl <= 0:
+            return
+
+        with self._lock:
+            if epoch is not None and epoch != self._epoch:
+                return
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._evicted_lru.inc()
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._epoch += 1
+            if self._data.pop(key, None) is not None:
+                self._evicted_invalidated.inc()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._epoch += 1
+            n = len(self._data)
+            self._data.clear()
+        if n:
+            self._evicted_invalidated.inc(n)
@@ -1,16 +1,126 @@
+from typing import Literal
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
     app_name: str = "Warehouse Operations Service"
     database_url: str
+    # Request handlers on an AsyncEngine (asyncpg) instead of sync sessions on the
+    # threadpool. ASYNC_DATABASE_URL defaults to DATABASE_URL with the asyncpg driver.
+    db_async: bool = False
+    async_database_url: str | None = None
+    # Sync engine driver. psycopg (3) sends a transition's statements and its COMMIT
+    # in one round-trip (pipeline mode, app.db.pipeline); needs `psycopg` installed.
+    db_driver: Literal["psycopg2", "psycopg"] = "psycopg2"
+
+    # Connection pool (per engine: the sync engine, and the AsyncEngine with db_async).
+    # Checkouts wait up to timeout when pool_size + max_overflow connections are in use;
+    # recycle (-1 = never) replaces connections older than that on checkout.
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout_seconds: float = 30.0
+    db_pool_recycle_seconds: int = -1
+    db_pool_pre_ping: bool = True
+    # asyncpg: statements prepared server side and kept per connection (0 = prepare
+    # every execution anew, e.g. behind a transaction-pooling PgBouncer)
+    db_prepared_statement_cache_size: int = 100
+
+    # Optional read replica for read-only endpoints (unset = all reads on the primary).
+    # Reads go to the primary instead while the replica is down or more than
+    # max_lag behind (checked every check_interval), when the request sends
+    # X-Read-Primary: true, and for read_your_writes seconds after the caller's
+    # last commit in this process.
+    replica_database_url: str | None = None
+    replica_async_database_url: str | None = None
+    replica_max_lag_seconds: float = 5.0
+    replica_check_interval_seconds: float = 2.0
+    replica_read_your_writes_seconds: float = 5.0
+    replica_recent_writers_max: int = 100000
+
     jwt_secret: str
     jwt_algorithm: str = "HS256"
     jwt_exp_minutes: int = 60
+
+    # Cache of already-verified access tokens (0 = disabled); entries expire at
+    # min(ttl, token exp)
+    jwt_cache_size: int = 10000
+    jwt_cache_ttl_seconds: float = 300.0
+
+    # "db": resolve the user row on every request; "stateless": trust the
+    # uid/role claims of the verified access token (no DB hit)
+    auth_mode: Literal["db", "stateless"] = "db"
+
+    # In-process LRU+TTL cache of resolved principals for auth_mode=db (0 = disabled)
+    principal_cache_size: int = 0
+    principal_cache_ttl_seconds: float = 30.0
     
+    # Dedicated bcrypt executor: beyond workers + max_queue in-flight jobs,
+    # login/register answer 503 with Retry-After
+    password_hash_workers: int = 2
+    password_hash_max_queue: int = 32
+    password_hash_retry_after_seconds: int = 1
+
+    # bcrypt cost. With bcrypt_autotune the cost is calibrated once, by the first
+    # process to start, to the highest value whose hash time stays under
+    # bcrypt_target_ms, within [bcrypt_min_rounds, bcrypt_max_rounds], and stored
+    # in bcrypt_calibration for every other worker. Weaker hashes are upgraded on
+    # the next successful login; stronger ones are kept.
+    bcrypt_rounds: int = 12
+    bcrypt_autotune: bool = False
+    bcrypt_target_ms: float = 250.0
+    bcrypt_min_rounds: int = 10
+    bcrypt_max_rounds: int = 14
+
+    # Logging: records go through a bounded queue to a writer thread
+    log_level: str = "INFO"
+    log_format: Literal["json", "text"] = "json"
+    log_queue_size: int = 10000
+    log_drop_policy: Literal["drop_new", "drop_oldest", "block"] = "drop_new"
+    log_block_timeout_seconds: float = 0.05
+    # Fraction of 2xx access log lines kept (errors are always logged)
+    access_log_sample_rate: float = 1.0
+
+    # Max orders accepted by POST /orders/bulk and POST /orders/transitions
+    orders_bulk_max_batch: int = 1000
+    orders_transitions_max_batch: int = 2000
+    # Max orders one POST /orders/claim-next call may claim
+    orders_claim_max_limit: int = 100
+    # GET /orders page size (default / max)
+    orders_page_size: int = 50
+    orders_page_max_size: int = 500
+    # GET /events and GET /orders/{id}/events page size (default / max)
+    events_page_size: int = 100
+    events_page_max_size: int = 1000
+    # Rows per server-side cursor fetch (and per streamed chunk) in GET /orders/export
+    # and GET /events?format=ndjson
+    orders_export_batch_size: int = 1000
+
+    # Sharded stock for hot SKUs (enabled per product via the admin API).
+    # The rebalancer evens out shard counters every interval (0 = disabled).
+    stock_shards_max: int = 64
+    stock_shard_rebalance_interval_seconds: int = 60
+
+    # Group-commit reservations: /reserve and /retry-reserve requests are collected
+    # for up to window_ms (or batch_max requests) and reserved in one transaction.
+    # A request not resolved within timeout (or whose batch failed) gets 503 with
+    # Retry-After; reserving is idempotent, so the retry is safe
+    reservation_batching_enabled: bool = False
+    reservation_batch_window_ms: float = 5.0
+    reservation_batch_max: int = 200
+    reservation_batch_timeout_seconds: float = 10.0
+    reservation_batch_retry_after_seconds: int = 1
+
     # ✅ Refresh token settings
     refresh_token_ttl_days: int = 30
     refresh_token_salt: str
 
+    # Background sweeper: deletes tokens expired/revoked more than retention_days ago
+    # in batches (interval 0 = disabled)
+    refresh_token_retention_days: int = 7
+    refresh_token_sweep_interval_seconds: int = 3600
+    refresh_token_sweep_batch_size: int = 1000
+    refresh_token_sweep_max_batches: int = 100
+
 model_config = SettingsConfigDict(env_file=".env")
 
 settings = Settings()
\ No newline at end of file
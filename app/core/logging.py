@@ -0,0 +1,122 @@
+"""
+Non-blocking structured logging.
+
+Records from the "app" logger are put on a bounded in-memory queue by
+BoundedQueueHandler (cheap, never touches I/O) and written as one JSON object
+per line by a QueueListener thread. When the sink is slower than the producers
+the queue fills up and LOG_DROP_POLICY decides what gives:
+
+- drop_new:    discard the incoming record (default, never blocks)
+- drop_oldest: discard the oldest queued record to make room
+- block:       wait up to LOG_BLOCK_TIMEOUT_SECONDS, then discard
+
+Every discarded record is counted in app_log_records_dropped_total. Successful
+(2xx) access log lines can be sampled with ACCESS_LOG_SAMPLE_RATE.
+"""
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+
+from app.core.config import settings
+from app.core.metrics import LOG_RECORDS_DROPPED
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_RESERVED = set(logging.LogRecord("", 0, "", 0, "", None, None).__dict__) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        doc = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith("_"):
+                doc[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            doc["exc_info"] = record.exc_text
+        return json.dumps(doc, default=str)
+
+
+class AccessLogSampler(logging.Filter):
+    """Keep only `rate` of the 2xx "request" access records; everything else passes."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+        self._sampled_out = LOG_RECORDS_DROPPED.labels("sampled")
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate >= 1.0 or record.msg != "request":
+            return True
+        status = getattr(record, "status_code", 0)
+        if 200 <= status < 300 and random.random() >= self.rate:
+            self._sampled_out.inc()
+            return False
+        return True
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, q: queue.Queue, policy: str, block_timeout: float):
+        super().__init__(q)
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self._dropped = LOG_RECORDS_DROPPED.labels("queue_full")
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # JSON encoding happens on the listener thread; resolve what can't wait: the
+        # message (its args may be mutated once the call returns) and the traceback
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            if self.policy == "block":
+                self.queue.put(record, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+
+        if self.policy == "drop_oldest":
+            try:
+                self.queue.get_nowait()
+                self.queue.put_nowait(record)
+            except (queue.Empty, queue.Full):
+                pass
+        self._dropped.inc()
+
+
+def configure_logging() -> logging.handlers.QueueListener:
+    """Install the queue handler on the "app" logger and start the writer thread."""
+    sink = logging.StreamHandler(sys.stdout)
+    if settings.log_format == "json":
+        sink.setFormatter(JsonFormatter())
+    else:
+        sink.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+
+    q: queue.Queue = queue.Queue(maxsize=settings.log_queue_size)
+    handler = BoundedQueueHandler(q, settings.log_drop_policy, settings.log_block_timeout_seconds)
+    handler.addFilter(AccessLogSampler(settings.access_log_sample_rate))
+
+    logger = logging.getLogger("app")
+    logger.handlers = [handler]
+    logger.setLevel(settings.log_level.upper())
+    logger.propagate = False
+
+    listener = logging.handlers.QueueListener(q, sink, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -0,0 +1,65 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+# Application-level metrics. They are registered on the default registry, which
+# the Instrumentator already exposes on /metrics.
+
+CACHE_HITS = Counter("app_cache_hits_total", "In-process cache hits", ["cache"])
+CACHE_MISSES = Counter("app_cache_misses_total", "In-process cache misses", ["cache"])
+CACHE_EVICTIONS = Counter(
+    "app_cache_evictions_total",
+    "In-process cache evictions (reason: lru, expired, invalidated)",
+    ["cache", "reason"],
+)
+CACHE_ENTRIES = Gauge("app_cache_entries", "Current number of cached entries", ["cache"])
+
+PASSWORD_HASH_SECONDS = Histogram(
+    "app_password_hash_seconds",
+    "Time spent in bcrypt hash/verify on the hashing executor",
+    ["op"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+PASSWORD_HASH_QUEUE_DEPTH = Gauge(
+    "app_password_hash_queue_depth",
+    "Password hash/verify jobs queued or running on the hashing executor",
+)
+BCRYPT_ROUNDS = Gauge("app_bcrypt_rounds", "bcrypt cost used for new password hashes")
+
+REFRESH_TOKENS_SWEPT = Counter(
+    "app_refresh_tokens_swept_total",
+    "Expired/revoked refresh tokens deleted by the retention sweeper",
+)
+
+RESERVATION_BATCH_SIZE = Histogram(
+    "app_reservation_batch_size",
+    "Reservation requests handled per coordinator batch",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+
+DB_POOL_SIZE = Gauge("app_db_pool_size", "Configured connections kept open by the pool", ["pool"])
+DB_POOL_CHECKED_OUT = Gauge("app_db_pool_checked_out", "Pool connections currently in use", ["pool"])
+DB_POOL_OVERFLOW = Gauge("app_db_pool_overflow", "Connections open beyond the pool size", ["pool"])
+DB_POOL_CHECKOUT_WAIT_SECONDS = Histogram(
+    "app_db_pool_checkout_wait_seconds",
+    "Time a checkout waited for a pooled connection (or for a new overflow connection)",
+    ["pool"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+DB_POOL_CHECKOUT_TIMEOUTS = Counter(
+    "app_db_pool_checkout_timeouts_total",
+    "Checkouts that gave up after DB_POOL_TIMEOUT_SECONDS (pool exhausted)",
+    ["pool"],
+)
+
+DB_REPLICA_UP = Gauge("app_db_replica_up", "1 while reads may use the read replica (reachable, lag within limit)")
+DB_REPLICA_LAG_SECONDS = Gauge("app_db_replica_lag_seconds", "Replication lag of the read replica at the last check")
+DB_READS_ROUTED = Counter(
+    "app_db_reads_routed_total",
+    "Read-only requests by database (target: replica, primary) and why",
+    ["target", "reason"],
+)
+
+LOG_RECORDS_DROPPED = Counter(
+    "app_log_records_dropped_total",
+    "Log records not written (reason: queue_full, sampled)",
+    ["reason"],
+)
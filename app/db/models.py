@@ -2,3 +2,5 @@ from app.models.user import User
 from app.models.product import Product
 from app.models.order import Order
 from app.models.order_item import OrderItem
+from app.models.product_stock_shard import ProductStockShard
+from app.models.bcrypt_calibration import BcryptCalibration
@@ -0,0 +1,121 @@
+"""
+psycopg 3 pipeline mode for short write transactions (DB_DRIVER=psycopg).
+
+On psycopg2 every statement is a round-trip of its own, and so are the BEGIN
+sent before the first one and the COMMIT: a status change costs three
+round-trips (BEGIN, compare-and-swap, COMMIT). In
+pipeline mode psycopg 3 sends statements without waiting for the previous
+result, so the statements of a unit of work that don't depend on each
+other's results reach Postgres together and cost one round-trip.
+
+SQLAlchemy reads a statement's result right after sending it, which pipeline
+mode defers, so run_pipelined executes on the raw psycopg cursor: each
+statement is compiled once for the engine's dialect, then bound (bind
+processors, expanding IN) and its rows converted (result processors) the way
+SQLAlchemy would. With any other driver run_pipelined returns None and the
+caller takes its regular path.
+
+psycopg waits for the reply to the BEGIN it sends before a transaction's
+first statement, and for the COMMIT of Connection.commit(). So BEGIN and
+COMMIT are sent as plain statements inside the pipeline instead (BEGIN only
+when the unit of work also commits: the connection is switched to autocommit
+for the duration, which psycopg allows only outside a transaction).
+"""
+from collections import namedtuple
+from typing import Any, Sequence
+
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+try:
+    import psycopg
+except ImportError:  # optional: only needed with DB_DRIVER=psycopg
+    psycopg = None
+
+
+class _Compiled:
+    def __init__(self, statement, dialect):
+        self.statement = statement  # keeps id(statement) from being reused while cached
+        self.compiled = statement.compile(dialect=dialect)
+        self.bind_processors = {
+            key: processor
+            for key, bind in self.compiled.binds.items()
+            if (processor := bind.type.bind_processor(dialect)) is not None
+        }
+        columns = list(getattr(statement, "selected_columns", ()))
+        self.row = namedtuple("Row", [c.key for c in columns]) if columns else None
+        self.result_processors = [c.type.result_processor(dialect, None) for c in columns]
+
+    def bind(self, params: dict[str, Any]) -> tuple[str, dict[str, Any]]:
+        state = self.compiled.construct_expanded_state(params)
+        processors = {**self.bind_processors, **state.processors}
+        values = {key: processors[key](v) if key in processors else v for key, v in state.parameters.items()}
+        return state.statement, values
+
+    def rows(self, cursor) -> list:
+        if self.row is None or cursor.description is None:
+            return []
+        return [
+            self.row(*(p(v) if p is not None else v for p, v in zip(self.result_processors, r)))
+            for r in cursor.fetchall()
+        ]
+
+
+_compiled: dict[tuple[int, str], _Compiled] = {}
+
+
+def _compile(statement, dialect) -> _Compiled:
+    key = (id(statement), dialect.name)
+    compiled = _compiled.get(key)
+    if compiled is None:
+        compiled = _compiled[key] = _Compiled(statement, dialect)
+    return compiled
+
+
+def pipeline_supported(db: Session) -> bool:
+    """Whether the session's connection is a (sync) psycopg 3 connection."""
+    dialect = db.get_bind().dialect
+    return psycopg is not None and dialect.driver == "psycopg" and not dialect.is_async
+
+
+def run_pipelined(db: Session, steps: Sequence[tuple[Any, dict[str, Any]]], commit: bool = False) -> list[list] | None:
+    """
+    Execute `steps` ((statement, params) pairs) in order in the session's
+    transaction, followed by COMMIT when `commit`, in one round-trip. Returns
+    each statement's rows (namedtuples; [] for statements without rows), or
+    None when the session isn't on psycopg 3. On a database error nothing
+    after the failing statement runs; it is raised as a SQLAlchemy DBAPIError
+    and the caller rolls back. With commit the caller still calls
+    db.commit() to end the session's transaction (no round-trip).
+    """
+    if not pipeline_supported(db):
+        return None
+
+    db.flush()  # pending ORM changes go out first, in order
+    conn = db.connection().connection.dbapi_connection
+    dialect = db.get_bind().dialect
+    compiled = [_compile(statement, dialect) for statement, _ in steps]
+
+    begin = commit and conn.info.transaction_status == psycopg.pq.TransactionStatus.IDLE
+    if begin:
+        conn.autocommit = True
+    statement, values = None, None
+    try:
+        with conn.pipeline():
+            if begin:
+                conn.execute("BEGIN")
+            cursors = []
+            for c, (_, params) in zip(compiled, steps):
+                statement, values = c.bind(params)
+                cursors.append(conn.execute(statement, values))
+            if commit:
+                statement, values = "COMMIT", None
+                conn.execute(statement)
+        return [c.rows(cursor) for c, cursor in zip(compiled, cursors)]
+    except psycopg.Error as e:
+        if begin:
+            conn.rollback()  # our own BEGIN left an aborted transaction block open
+        raise DBAPIError.instance(statement, values, e, psycopg.Error) from e
+    finally:
+        if begin:
+            conn.autocommit = False
@@ -0,0 +1,161 @@
+"""
+Hot-path statements, built once at import.
+
+Every request runs a few of these. Constructing a statement and computing its
+cache key costs more Python time than SQLAlchemy spends on everything else for
+a point lookup (about 80 us for the user lookup, over 1 ms for the stock-change
+CTE), so they are built here once with bind parameters and callers only pass
+values; the compiled SQL then comes straight out of SQLAlchemy's compiled
+cache. On asyncpg the SQL is also prepared server side once per connection
+(DB_PREPARED_STATEMENT_CACHE_SIZE). psycopg2 has no server-side prepared
+statements: on the sync engine only the Python work is saved.
+
+    python -m benchmarks.bench_queries
+"""
+from sqlalchemy import DateTime, String, bindparam, exists, func, insert, select, update
+
+from app.models.order import Order
+from app.models.order_event import OrderEvent
+from app.models.order_item import OrderItem
+from app.models.product import Product
+from app.models.refresh_token import RefreshToken
+from app.models.user import User
+
+# get_current_user, /auth/register, /auth/login: {"email"}
+USER_BY_EMAIL = select(User).where(User.email == bindparam("email"))
+
+# get_order: {"order_id"}
+ORDER_BY_ID = select(Order).where(Order.id == bindparam("order_id"))
+ORDER_BY_ID_FOR_UPDATE = ORDER_BY_ID.with_for_update()
+
+# transition() on psycopg 3 (pipelined, app.db.pipeline); the ORM flush issues the same.
+# {"order_id", "to_status"}
+ORDER_STATUS_UPDATE = (
+    update(Order).where(Order.id == bindparam("order_id")).values(status=bindparam("to_status", type_=Order.status.type))
+)
+# {"order_id", "from_status", "to_status", "actor_user_id", "actor_role", "request_id"}
+INSERT_ORDER_EVENT = insert(OrderEvent).values(
+    order_id=bindparam("order_id"),
+    action="STATUS_CHANGE",
+    from_status=bindparam("from_status"),
+    to_status=bindparam("to_status"),
+    actor_user_id=bindparam("actor_user_id"),
+    actor_role=bindparam("actor_role"),
+    request_id=bindparam("request_id"),
+    created_at=func.now(),
+)
+
+# revoke_refresh_token and rotation failures: {"token_hash"}
+REFRESH_TOKEN_BY_HASH = select(RefreshToken).where(RefreshToken.token_hash == bindparam("token_hash"))
+
+
+def _stock_change(sign: int, check_stock: bool, gate=None):
+    """
+    Aggregate the order's items, lock the products, apply
+    stock_qty += sign * qty (only where stock suffices when check_stock) and
+    return (product_id, qty, changed_id, stock_shards) per needed product;
+    changed_id is NULL for products that were not updated, stock_shards is NULL
+    for products that don't exist. Parameter: order_id. With `gate` (a CTE of
+    the enclosing statement) nothing is locked or changed unless it has rows.
+    """
+    items = [OrderItem.order_id == bindparam("order_id")]
+    if gate is not None:
+        items.append(exists(gate.select()))
+    need = (
+        select(OrderItem.product_id, func.sum(OrderItem.qty).label("qty"))
+        .where(*items)
+        .group_by(OrderItem.product_id)
+        .cte("need")
+    )
+    # Pin every needed product against resharding (set_stock_shards locks the row
+    # FOR UPDATE) and read stock_shards from the row version that was locked, not
+    # from the statement's snapshot: a reshard that commits while this waits
+    # changes where the stock lives. KEY SHARE is what foreign key checks take, so
+    # reservations of a sharded product don't queue on each other here.
+    pinned = (
+        select(Product.id, Product.stock_shards)
+        .join(need, Product.id == need.c.product_id)
+        .order_by(Product.id)
+        .with_for_update(read=True, key_share=True)
+        .cte("pinned")
+    )
+    # Lock the unsharded products in id order so overlapping orders can't deadlock.
+    # Sharded products are left alone here: their stock lives in product_stock_shards.
+    # The stock check reads the locked row too (the UPDATE's scan sees the snapshot).
+    locked = (
+        select(Product.id, Product.stock_qty)
+        .join(pinned, Product.id == pinned.c.id)
+        .where(pinned.c.stock_shards == 0)
+        .order_by(Product.id)
+        .with_for_update(of=Product, key_share=True)
+        .cte("locked")
+    )
+
+    conditions = [Product.id == locked.c.id, Product.id == need.c.product_id]
+    if check_stock:
+        conditions.append(locked.c.stock_qty >= need.c.qty)
+
+    changed = (
+        update(Product)
+        .where(*conditions)
+        .values(stock_qty=Product.stock_qty + sign * need.c.qty)
+        .returning(Product.id)
+        .cte("changed")
+    )
+    return (
+        select(need.c.product_id, need.c.qty, changed.c.id.label("changed_id"), pinned.c.stock_shards)
+        .select_from(
+            need.outerjoin(changed, changed.c.id == need.c.product_id).outerjoin(
+                pinned, pinned.c.id == need.c.product_id
+            )
+        )
+        .order_by(need.c.product_id)
+    )
+
+
+# reserve_stock_for_order / restock_for_order: {"order_id"}
+RESERVE_STOCK = _stock_change(sign=-1, check_stock=True)
+RESTOCK = _stock_change(sign=1, check_stock=False)
+
+
+def reserve_stock_after(gate):
+    """RESERVE_STOCK for use inside another statement, only run when `gate` has rows."""
+    return _stock_change(sign=-1, check_stock=True, gate=gate)
+
+
+def _rotate_refresh_token():
+    """
+    Conditional UPDATE ... RETURNING user_id -> INSERT of the new token -> user
+    (id, email, role). Parameters: old_hash, new_hash, now, new_expires_at (not
+    named after refresh_tokens columns: in an UPDATE those would become SET values).
+    """
+    now = bindparam("now", type_=DateTime(timezone=True))
+    rotated = (
+        update(RefreshToken)
+        .where(
+            RefreshToken.token_hash == bindparam("old_hash", type_=String),
+            RefreshToken.revoked_at.is_(None),
+            RefreshToken.expires_at > now,
+        )
+        .values(revoked_at=now)
+        .returning(RefreshToken.user_id)
+        .cte("rotated")
+    )
+    issued = (
+        insert(RefreshToken)
+        .from_select(
+            ["user_id", "token_hash", "created_at", "expires_at"],
+            select(
+                rotated.c.user_id,
+                bindparam("new_hash", type_=String),
+                now,
+                bindparam("new_expires_at", type_=DateTime(timezone=True)),
+            ),
+        )
+        .returning(RefreshToken.user_id)
+        .cte("issued")
+    )
+    return select(User.id, User.email, User.role).join(issued, issued.c.user_id == User.id)
+
+
+ROTATE_REFRESH_TOKEN = _rotate_refresh_token()
@@ -0,0 +1,145 @@
+"""
+Read-replica routing (REPLICA_DATABASE_URL).
+
+Read-only endpoints depend on get_read_db, which asks use_replica() whether
+this request may read from the replica. It may not when:
+
+  - no replica is configured,
+  - the client sent X-Read-Primary: true (read-after-write across workers),
+  - the caller committed on the primary in the last
+    REPLICA_READ_YOUR_WRITES_SECONDS (tracked per process),
+  - the replica is unreachable or more than REPLICA_MAX_LAG_SECONDS behind
+    at the last check (replica_monitor, every REPLICA_CHECK_INTERVAL_SECONDS).
+
+A read that fails on the replica marks it down and is retried on the primary
+(get_read_db; stream_from_replica for the streamed exports, as long as
+nothing was sent yet).
+
+Every decision is counted in app_db_reads_routed_total{target, reason}.
+"""
+import logging
+from typing import Callable, Iterator
+
+from sqlalchemy import event, text
+from sqlalchemy.exc import InterfaceError, OperationalError
+from sqlalchemy.orm import Session
+
+from app.core.background import PeriodicTask
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.metrics import DB_READS_ROUTED, DB_REPLICA_LAG_SECONDS, DB_REPLICA_UP
+from app.db.session import replica_engine
+
+logger = logging.getLogger("app")
+
+# 0 on a replica that has replayed everything it received (an idle primary
+# writes nothing, so replay timestamps alone would read as growing lag)
+REPLICA_LAG = text(
+    """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+    """
+)
+
+# Failures that say the replica can't serve the read (connection lost or refused,
+# query canceled by recovery conflicts) rather than that the read itself is wrong
+REPLICA_ERRORS = (OperationalError, InterfaceError, OSError)
+
+# None until the first check; reads stay on the primary until then
+_healthy: bool | None = None
+
+# user id -> True for read_your_writes seconds after their last commit
+recent_writers = TTLCache(
+    "recent_writers",
+    maxsize=settings.replica_recent_writers_max,
+    ttl_seconds=settings.replica_read_your_writes_seconds,
+)
+
+
+def _set_healthy(healthy: bool, lag: float | None = None, error: str | None = None) -> None:
+    global _healthy
+    # Log transitions only: the monitor keeps failing every interval while the replica is down
+    if healthy != _healthy:
+        if healthy:
+            logger.info("replica_up", extra={"lag_seconds": lag})
+        else:
+            logger.warning("replica_down", extra={"lag_seconds": lag, "error": error})
+    _healthy = healthy
+    DB_REPLICA_UP.set(1 if healthy else 0)
+
+
+def check_replica() -> None:
+    """Measure replication lag and mark the replica (un)healthy."""
+    if replica_engine is None:
+        return
+    try:
+        with replica_engine.connect() as conn:
+            lag = float(conn.execute(REPLICA_LAG).scalar_one())
+    except Exception as e:
+        _set_healthy(False, error=repr(e))
+        return
+    DB_REPLICA_LAG_SECONDS.set(lag)
+    _set_healthy(lag <= settings.replica_max_lag_seconds, lag)
+
+
+def mark_replica_down(error: str | None = None) -> None:
+    """A routed read failed on the replica: use the primary until the next good check."""
+    _set_healthy(False, error=error)
+
+
+replica_monitor = PeriodicTask(
+    "replica-lag-monitor",
+    settings.replica_check_interval_seconds if replica_engine is not None else 0,
+    check_replica,
+)
+
+
+def note_write(user_id: int | None) -> None:
+    if user_id is not None:
+        recent_writers.set(user_id, True)
+
+
+@event.listens_for(Session, "after_commit")
+def _note_commit(session: Session) -> None:
+    # get_current_user tags the request's session with the caller
+    note_write(session.info.get("user_id"))
+
+
+def use_replica(read_primary: bool, user_id: int | None) -> bool:
+    """Whether this read may go to the replica; the reason is counted either way."""
+    if replica_engine is None:
+        target, reason = "primary", "not_configured"
+    elif read_primary:
+        target, reason = "primary", "header"
+    elif user_id is not None and recent_writers.get(user_id):
+        target, reason = "primary", "recent_write"
+    elif not _healthy:
+        target, reason = "primary", "replica_unhealthy"
+    else:
+        target, reason = "replica", "replica"
+    DB_READS_ROUTED.labels(target, reason).inc()
+    return target == "replica"
+
+
+def stream_from_replica(
+    stream: Callable[[Callable], Iterator[str]], replica_factory: Callable, primary_factory: Callable
+) -> Iterator[str]:
+    """
+    Iterate stream(replica_factory); if the replica fails before the first
+    chunk, mark it down and stream(primary_factory) instead. After that the
+    response has started and a failure can only end it.
+    """
+    started = False
+    try:
+        for chunk in stream(replica_factory):
+            started = True
+            yield chunk
+        return
+    except REPLICA_ERRORS as e:
+        mark_replica_down(repr(e))
+        if started:
+            raise
+    yield from stream(primary_factory)
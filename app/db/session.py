@@ -1,13 +1,150 @@
-from sqlalchemy import create_engine
+from contextlib import asynccontextmanager
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import create_engine, make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
+from app.db.pool import (
+    InstrumentedAsyncQueuePool,
+    InstrumentedQueuePool,
+    InstrumentedReplicaAsyncQueuePool,
+    InstrumentedReplicaQueuePool,
+    instrument_pool,
+)
+
+POOL_OPTIONS = {
+    "pool_size": settings.db_pool_size,
+    "max_overflow": settings.db_max_overflow,
+    "pool_timeout": settings.db_pool_timeout_seconds,
+    "pool_recycle": settings.db_pool_recycle_seconds,
+    "pool_pre_ping": settings.db_pool_pre_ping,
+}
+
+
+def sync_database_url(url: str) -> str:
+    # `url` with the driver swapped for DB_DRIVER
+    return make_url(url).set(drivername=f"postgresql+{settings.db_driver}").render_as_string(hide_password=False)
 
-engine = create_engine(settings.database_url, pool_pre_ping=True)
+
+engine = create_engine(sync_database_url(settings.database_url), poolclass=InstrumentedQueuePool, **POOL_OPTIONS)
+instrument_pool(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-def get_db():
-    db = SessionLocal()
+
+def async_database_url(url: str, async_url: str | None = None) -> str:
+    # `url` with the driver swapped for asyncpg, unless an explicit async URL is set;
+    # the prepared statement cache size comes from settings unless the URL sets it
+    parsed = make_url(async_url) if async_url else make_url(url).set(drivername="postgresql+asyncpg")
+    if "prepared_statement_cache_size" not in parsed.query:
+        parsed = parsed.update_query_dict(
+            {"prepared_statement_cache_size": str(settings.db_prepared_statement_cache_size)}
+        )
+    return parsed.render_as_string(hide_password=False)
+
+
+# DB_ASYNC: request handlers use an AsyncEngine (asyncpg) on the event loop. Background
+# threads (sweeper, rebalancer, reservation coordinator, exports) keep the sync engine.
+async_engine = (
+    create_async_engine(
+        async_database_url(settings.database_url, settings.async_database_url),
+        poolclass=InstrumentedAsyncQueuePool,
+        **POOL_OPTIONS,
+    )
+    if settings.db_async
+    else None
+)
+if async_engine is not None:
+    instrument_pool(async_engine.sync_engine)
+AsyncSessionLocal = (
+    async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False) if async_engine is not None else None
+)
+
+# REPLICA_DATABASE_URL: a second engine (pair) for read-only endpoints; app.db.replica
+# decides per request whether it may be used. Read-only at the connection level.
+replica_engine = None
+ReplicaSessionLocal = None
+replica_async_engine = None
+AsyncReplicaSessionLocal = None
+if settings.replica_database_url:
+    replica_engine = create_engine(
+        sync_database_url(settings.replica_database_url),
+        poolclass=InstrumentedReplicaQueuePool,
+        execution_options={"postgresql_readonly": True},
+        **POOL_OPTIONS,
+    )
+    instrument_pool(replica_engine)
+    ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+    if settings.db_async:
+        replica_async_engine = create_async_engine(
+            async_database_url(settings.replica_database_url, settings.replica_async_database_url),
+            poolclass=InstrumentedReplicaAsyncQueuePool,
+            execution_options={"postgresql_readonly": True},
+            **POOL_OPTIONS,
+        )
+        instrument_pool(replica_async_engine.sync_engine)
+        AsyncReplicaSessionLocal = async_sessionmaker(replica_async_engine, autoflush=False, expire_on_commit=False)
+
+
+class ThreadedSession:
+    """
+    The part of the AsyncSession API the routes use, over a plain Session whose
+    calls run on AnyIO's threadpool (DB_ASYNC off). Routes are written once,
+    against AsyncSession, and run on either stack; service functions stay
+    sync and are called through run_sync.
+    """
+
+    def __init__(self, session):
+        self.sync_session = session
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return await run_in_threadpool(fn, self.sync_session, *args, **kwargs)
+
+    async def scalar(self, statement, *args, **kwargs):
+        return await run_in_threadpool(self.sync_session.scalar, statement, *args, **kwargs)
+
+    async def get(self, entity, ident, **kwargs):
+        return await run_in_threadpool(self.sync_session.get, entity, ident, **kwargs)
+
+    def add(self, instance) -> None:
+        self.sync_session.add(instance)
+
+    async def commit(self) -> None:
+        await run_in_threadpool(self.sync_session.commit)
+
+    async def rollback(self) -> None:
+        await run_in_threadpool(self.sync_session.rollback)
+
+    async def close(self) -> None:
+        await run_in_threadpool(self.sync_session.close)
+
+    @property
+    def info(self) -> dict:
+        return self.sync_session.info
+
+
+@asynccontextmanager
+async def request_session(sync_factory, async_factory=None):
+    """An AsyncSession from async_factory if there is one, else a ThreadedSession over sync_factory."""
+    if async_factory is not None:
+        async with async_factory() as db:
+            yield db
+        return
+
+    db = ThreadedSession(sync_factory(expire_on_commit=False))
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        await db.close()
+
+
+async def get_db():
+    """
+    Per-request unit of work: an AsyncSession with DB_ASYNC, else a
+    ThreadedSession. Routers, require_roles and get_current_user all depend on
+    this exact callable, so FastAPI resolves it once per request. Objects stay
+    loaded after commit (expire_on_commit=False): responses are serialized on
+    the event loop, where a lazy refresh can't do I/O.
+    """
+    async with request_session(SessionLocal, AsyncSessionLocal) as db:
+        yield db
@@ -1,73 +1,67 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.exceptions import RequestValidationError
-from jose import jwt, JWTError
 
 
 from prometheus_fastapi_instrumentator import Instrumentator
 
 from app.core.config import settings
+from app.core.logging import configure_logging
+from app.api.admin import router as admin_router
 from app.api.auth import router as auth_router
+from app.api.events import router as events_router
+from app.api.middleware import RequestContextMiddleware
 from app.api.ops import ops_router
 from app.api.orders import router as orders_router
 from app.api.integrations import router as integrations_router
+from app.db.replica import check_replica, replica_monitor
+from app.db.session import async_engine, replica_async_engine
+from app.services.auth import configure_password_hashing, shutdown_hashing_executor
+from app.services.principal_cache import invalidation_listener
+from app.services.refresh_tokens import refresh_token_sweeper
+from app.services.reservation_batcher import reservation_coordinator
+from app.services.stock_shards import stock_shard_rebalancer
 
-import time
-import uuid
 import logging
 
-app = FastAPI(title=settings.app_name)
 logger = logging.getLogger("app")
 
 
-@app.middleware("http")
-async def request_id_middleware(request: Request, call_next):
-    # Use upstream request id if provided; otherwise generate one
-    rid = request.headers.get("X-Request-ID") or str(uuid.uuid4())
-
-    # Make it available everywhere (endpoints + exception handlers)
-    request.state.request_id = rid
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    log_listener = configure_logging()
+    await run_in_threadpool(configure_password_hashing)
+    invalidation_listener.start()
+    # Reads stay on the primary until the replica has passed a lag check
+    await run_in_threadpool(check_replica)
+    replica_monitor.start()
+    refresh_token_sweeper.start()
+    stock_shard_rebalancer.start()
+    reservation_coordinator.start()
+    try:
+        yield
+    finally:
+        reservation_coordinator.stop()
+        stock_shard_rebalancer.stop()
+        refresh_token_sweeper.stop()
+        replica_monitor.stop()
+        invalidation_listener.stop()
+        shutdown_hashing_executor()
+        if async_engine is not None:
+            await async_engine.dispose()
+        if replica_async_engine is not None:
+            await replica_async_engine.dispose()
+        log_listener.stop()  # flushes queued records
 
-        # ---- ADMIN-ONLY GUARD for /metrics (Prometheus Instrumentator exposes it publicly) ----
-    if request.url.path == "/metrics":
-        auth = request.headers.get("Authorization", "")
-        if not auth.startswith("Bearer "):
-            return JSONResponse(status_code=401, content={"detail": "Missing Bearer token", "request_id": rid})
 
-        token = auth.split(" ", 1)[1].strip()
-        try:
-            payload = jwt.decode(token, settings.jwt_secret, algorithms=[settings.jwt_algorithm])
-        except JWTError:
-            return JSONResponse(status_code=401, content={"detail": "Invalid token", "request_id": rid})
+app = FastAPI(title=settings.app_name, lifespan=lifespan)
 
-        role = payload.get("role")
-        if role != "admin":
-            return JSONResponse(status_code=403, content={"detail": "Forbidden", "request_id": rid})
-    # -----------------------------------------------------------------------
 
-    start = time.time()
-    try:
-        response = await call_next(request)
-    except Exception:
-        logger.exception("unhandled_error", extra={"request_id": rid, "path": request.url.path})
-        raise
-
-    duration_ms = int((time.time() - start) * 1000)
-
-    # Propagate back to client
-    response.headers["X-Request-ID"] = rid
-
-    logger.info(
-        "request",
-        extra={
-            "request_id": rid,
-            "method": request.method,
-            "path": request.url.path,
-            "status_code": response.status_code,
-            "duration_ms": duration_ms,
-        },
-    )
-    return response
+# Pure ASGI (no BaseHTTPMiddleware): request id, /metrics admin guard, timing, access log
+app.add_middleware(RequestContextMiddleware)
 
 
 def _rid(request: Request) -> str | None:
@@ -79,6 +73,7 @@ async def http_exception_handler(request: Request, exc: HTTPException):
     return JSONResponse(
         status_code=exc.status_code,
         content={"detail": exc.detail, "request_id": _rid(request)},
+        headers=exc.headers,
     )
 
 
@@ -110,4 +105,6 @@ app.include_router(ops_router)
 app.include_router(auth_router)
 app.include_router(orders_router)
 app.include_router(integrations_router)
+app.include_router(admin_router)
+app.include_router(events_router)
 
@@ -0,0 +1,12 @@
+from sqlalchemy import CheckConstraint, Column, DateTime, Integer, func
+from app.db.base import Base
+
+class BcryptCalibration(Base):
+    """The deployment's calibrated bcrypt cost (BCRYPT_AUTOTUNE); a single row."""
+    __tablename__ = "bcrypt_calibration"
+
+    id = Column(Integer, primary_key=True, default=1)
+    rounds = Column(Integer, nullable=False)
+    calibrated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    __table_args__ = (CheckConstraint("id = 1", name="ck_bcrypt_calibration_single_row"),)
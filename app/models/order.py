@@ -1,5 +1,5 @@
 import enum
-from sqlalchemy import Column, Integer, String, Enum
+from sqlalchemy import Column, Integer, String, Enum, Index
 from app.db.base import Base
 
 
@@ -21,5 +21,22 @@ class Order(Base):
     status = Column(Enum(OrderStatus), nullable=False, default=OrderStatus.NEW)
     customer_id = Column(Integer, nullable=False)
     reference = Column(String(50), nullable=True)
+    # Higher is picked first by POST /orders/claim-next
+    priority = Column(Integer, nullable=False, default=0, server_default="0")
+
+
+# GET /orders: each filter plus the id keyset cursor
+Index("ix_orders_status_id", Order.status, Order.id)
+Index("ix_orders_customer_id_id", Order.customer_id, Order.id)
+Index("ix_orders_reference_id", Order.reference, Order.id)
+
+# Work queue for claim-next: only RESERVED orders, in priority or age (id) order
+Index(
+    "ix_orders_reserved_priority",
+    Order.priority.desc(),
+    Order.id,
+    postgresql_where=Order.status == OrderStatus.RESERVED,
+)
+Index("ix_orders_reserved_id", Order.id, postgresql_where=Order.status == OrderStatus.RESERVED)
     
 
@@ -1,5 +1,4 @@
-from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index, func
 from app.db.base import Base
 
 class OrderEvent(Base):
@@ -17,4 +16,11 @@ class OrderEvent(Base):
 
     request_id = Column(String(64), nullable=True, index=True)
 
-    created_at = Column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
\ No newline at end of file
+    # Set by the database (transaction start) on every write path: the ORM, the
+    # compare-and-swap statements and the pipelined INSERT share one clock
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    __table_args__ = (
+        # GET /events: time windows and the (created_at, id) keyset cursor
+        Index("ix_order_events_created_at_id", "created_at", "id"),
+    )
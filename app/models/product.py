@@ -8,3 +8,6 @@ class Product(Base):
     sku = Column(String(50), unique=True, nullable=False, index=True)
     name = Column(String(200), nullable=False)
     stock_qty = Column(Integer, nullable=False, default=0)
+    # 0 = stock lives in stock_qty; N > 0 = stock is split over N product_stock_shards
+    # rows and stock_qty stays 0
+    stock_shards = Column(Integer, nullable=False, default=0, server_default="0")
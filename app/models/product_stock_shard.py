@@ -0,0 +1,12 @@
+from sqlalchemy import CheckConstraint, Column, ForeignKey, Integer
+from app.db.base import Base
+
+class ProductStockShard(Base):
+    """One sub-counter of a sharded product's stock (see products.stock_shards)."""
+    __tablename__ = "product_stock_shards"
+
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    shard = Column(Integer, primary_key=True)
+    qty = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (CheckConstraint("qty >= 0", name="ck_product_stock_shards_qty_non_negative"),)
@@ -17,4 +17,11 @@ class RefreshToken(Base):
 
     user = relationship("User", backref="refresh_tokens")
 
-Index("ix_refresh_tokens_user_active", RefreshToken.user_id, RefreshToken.revoked_at)
\ No newline at end of file
+Index("ix_refresh_tokens_user_active", RefreshToken.user_id, RefreshToken.revoked_at)
+# Retention sweeper predicates (expires_at < cutoff OR revoked_at < cutoff)
+Index("ix_refresh_tokens_expires_at", RefreshToken.expires_at)
+Index(
+    "ix_refresh_tokens_revoked_at",
+    RefreshToken.revoked_at,
+    postgresql_where=RefreshToken.revoked_at.isnot(None),
+)
@@ -0,0 +1,24 @@
+from datetime import datetime
+from pydantic import BaseModel
+from typing import List, Optional
+
+
+class OrderEventOut(BaseModel):
+    id: int
+    order_id: int
+    action: str
+    from_status: Optional[str]
+    to_status: Optional[str]
+    actor_user_id: Optional[int]
+    actor_role: Optional[str]
+    request_id: Optional[str]
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class OrderEventPage(BaseModel):
+    items: List[OrderEventOut]
+    # Pass back as ?cursor= for the next page; None on the last page
+    next_cursor: Optional[str] = None
@@ -9,6 +9,7 @@ class OrderItemCreate(BaseModel):
 class OrderCreate(BaseModel):
     customer_id: int = Field(..., example=1)
     reference: Optional[str] = Field(None, example="NL-ORDER-001")
+    priority: int = Field(0, example=0, description="Higher is claimed first by /orders/claim-next")
     items: List[OrderItemCreate]
 
     class Config:
@@ -28,6 +29,49 @@ class OrderOut(BaseModel):
     customer_id: int
     reference: Optional[str]
     status: OrderStatus
+    priority: int = 0
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+
+class OrderPage(BaseModel):
+    items: List[OrderOut]
+    # Pass as ?after= to get the next page; None on the last page
+    next_after: Optional[int] = None
+
+
+class OrderBulkCreate(BaseModel):
+    orders: List[OrderCreate] = Field(..., min_length=1)
+
+
+class OrderBulkResult(BaseModel):
+    index: int
+    ok: bool
+    order: Optional[OrderOut] = None
+    error: Optional[str] = None
+
+
+class OrderBulkResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[OrderBulkResult]
+
+
+class OrderTransitionBulk(BaseModel):
+    to_status: OrderStatus = Field(..., example="PICKING")
+    order_ids: List[int] = Field(..., min_length=1, example=[101, 102, 103])
+
+
+class OrderTransitionResult(BaseModel):
+    order_id: int
+    ok: bool
+    status: Optional[OrderStatus] = None  # status after the call (None if not found)
+    error: Optional[str] = None
+
+
+class OrderTransitionBulkResponse(BaseModel):
+    to_status: OrderStatus
+    applied: int  # orders now in to_status (moved by this call or already there)
+    failed: int
+    results: List[OrderTransitionResult]
@@ -0,0 +1,19 @@
+from pydantic import BaseModel, Field
+from typing import List
+
+
+class StockShardingUpdate(BaseModel):
+    shards: int = Field(..., example=8, ge=0, description="Number of stock shards; 0 turns sharding off")
+
+
+class ProductStockOut(BaseModel):
+    product_id: int
+    sku: str
+    stock_qty: int  # total available, shards included
+    stock_shards: int
+    shards: List[int]  # per-shard quantities, in shard order
+
+
+class StockRebalanceOut(BaseModel):
+    product_id: int
+    shards_changed: int
@@ -1,11 +1,89 @@
+import asyncio
+import hashlib
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
+from types import MappingProxyType
+from typing import Any, Mapping
+from fastapi import HTTPException
 from jose import jwt
 from passlib.context import CryptContext
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
 
+from app.core.cache import TTLCache
 from app.core.config import settings
+from app.core.metrics import BCRYPT_ROUNDS, PASSWORD_HASH_QUEUE_DEPTH, PASSWORD_HASH_SECONDS
+from app.db.session import SessionLocal
+from app.models.bcrypt_calibration import BcryptCalibration
+
+logger = logging.getLogger("app")
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# Verified access-token payloads keyed by sha256(token); entries never outlive `exp`
+_verified_tokens = TTLCache(
+    "jwt",
+    maxsize=settings.jwt_cache_size,
+    ttl_seconds=settings.jwt_cache_ttl_seconds,
+)
+
+def calibrate_bcrypt_rounds(target_ms: float, min_rounds: int, max_rounds: int) -> int:
+    """
+    Highest bcrypt cost in [min_rounds, max_rounds] whose hash time on this CPU
+    stays within target_ms. Each extra round doubles the work, so one timing at
+    min_rounds is enough to extrapolate.
+    """
+    handler = pwd_context.handler("bcrypt").using(rounds=min_rounds)
+    elapsed_ms = float("inf")
+    for _ in range(2):  # best of 2 to skip one-off warmup cost
+        start = time.perf_counter()
+        handler.hash("calibration-password")
+        elapsed_ms = min(elapsed_ms, (time.perf_counter() - start) * 1000)
+
+    rounds = min_rounds
+    while rounds < max_rounds and elapsed_ms * 2 <= target_ms:
+        rounds += 1
+        elapsed_ms *= 2
+    return rounds
+
+
+def stored_bcrypt_rounds() -> int:
+    """
+    The deployment's calibrated bcrypt cost (BCRYPT_AUTOTUNE). The first process
+    to start calibrates and stores it in bcrypt_calibration; every other worker
+    and pod reads it from there, so they all hash at one cost however their
+    startup timings differ. Delete the row to recalibrate (new hardware).
+    """
+    with SessionLocal() as db:
+        rounds = db.scalar(select(BcryptCalibration.rounds))
+        if rounds is None:
+            calibrated = calibrate_bcrypt_rounds(
+                settings.bcrypt_target_ms, settings.bcrypt_min_rounds, settings.bcrypt_max_rounds
+            )
+            # Two processes calibrating at once: the first insert wins
+            db.execute(insert(BcryptCalibration).values(id=1, rounds=calibrated).on_conflict_do_nothing())
+            db.commit()
+            rounds = db.scalar(select(BcryptCalibration.rounds))
+    return min(max(rounds, settings.bcrypt_min_rounds), settings.bcrypt_max_rounds)
+
+
+def configure_password_hashing() -> int:
+    """
+    Apply the bcrypt cost for this process (the stored calibration or the fixed
+    setting). Only the default and the minimum are set: stored hashes below the
+    cost are flagged by pwd_context.needs_update and rehashed on the next
+    successful login, stronger ones are kept.
+    """
+    rounds = stored_bcrypt_rounds() if settings.bcrypt_autotune else settings.bcrypt_rounds
+
+    pwd_context.update(bcrypt__default_rounds=rounds, bcrypt__min_rounds=rounds)
+    BCRYPT_ROUNDS.set(rounds)
+    logger.info("bcrypt_rounds", extra={"rounds": rounds, "autotune": settings.bcrypt_autotune})
+    return rounds
+
+
 def hash_password(password: str) -> str:
     # bcrypt limit: 72 bytes → validat deja de Pydantic
     return pwd_context.hash(password)
@@ -13,8 +91,87 @@ def hash_password(password: str) -> str:
 def verify_password(password: str, hashed: str) -> bool:
     return pwd_context.verify(password, hashed)
 
-def create_access_token(subject: str) -> str:
+
+# bcrypt releases the GIL, so a small dedicated thread pool gives real parallelism
+# while keeping ~250ms hashes off AnyIO's shared request threadpool.
+_hash_executor = ThreadPoolExecutor(
+    max_workers=settings.password_hash_workers,
+    thread_name_prefix="password-hash",
+)
+_hash_inflight = 0  # queued + running; only touched from the event loop
+
+
+def _timed(op: str, fn, *args):
+    start = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        PASSWORD_HASH_SECONDS.labels(op).observe(time.perf_counter() - start)
+
+
+async def _run_hashing(op: str, fn, *args):
+    global _hash_inflight
+    if _hash_inflight >= settings.password_hash_workers + settings.password_hash_max_queue:
+        raise HTTPException(
+            status_code=503,
+            detail="Authentication is busy, retry shortly",
+            headers={"Retry-After": str(settings.password_hash_retry_after_seconds)},
+        )
+
+    _hash_inflight += 1
+    PASSWORD_HASH_QUEUE_DEPTH.set(_hash_inflight)
+    try:
+        return await asyncio.wrap_future(_hash_executor.submit(_timed, op, fn, *args))
+    finally:
+        _hash_inflight -= 1
+        PASSWORD_HASH_QUEUE_DEPTH.set(_hash_inflight)
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run_hashing("hash", pwd_context.hash, password)
+
+
+async def verify_password_async(password: str, hashed: str) -> bool:
+    return await _run_hashing("verify", pwd_context.verify, password, hashed)
+
+
+async def verify_and_update_password_async(password: str, hashed: str) -> tuple[bool, str | None]:
+    """(valid, new_hash); new_hash is set when the stored cost is below the current one."""
+    return await _run_hashing("verify", pwd_context.verify_and_update, password, hashed)
+
+
+def shutdown_hashing_executor() -> None:
+    _hash_executor.shutdown(wait=False, cancel_futures=True)
+
+def create_access_token(subject: str, user_id: int | None = None, role: str | None = None) -> str:
     now = datetime.now(timezone.utc)
     exp = now + timedelta(minutes=settings.jwt_exp_minutes)
     payload = {"sub": subject, "iat": int(now.timestamp()), "exp": exp}
+
+    # Optional identity claims: let stateless auth build the principal without a DB lookup
+    if user_id is not None:
+        payload["uid"] = user_id
+    if role is not None:
+        payload["role"] = role
+
     return jwt.encode(payload, settings.jwt_secret, algorithm=settings.jwt_algorithm)
+
+
+def decode_access_token(token: str) -> Mapping[str, Any]:
+    """
+    Verify signature + claims and return the payload (raises JWTError).
+    Repeated presentations of the same token are served from the cache, so the
+    payload is read-only: every request holding that token shares it.
+    """
+    key = hashlib.sha256(token.encode("utf-8")).digest()
+    payload = _verified_tokens.get(key)
+    if payload is not None:
+        return payload
+
+    payload = MappingProxyType(jwt.decode(token, settings.jwt_secret, algorithms=[settings.jwt_algorithm]))
+
+    # Tokens without exp are never cached
+    exp = payload.get("exp")
+    if isinstance(exp, (int, float)):
+        _verified_tokens.set(key, payload, ttl_seconds=exp - time.time())
+    return payload
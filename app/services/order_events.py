@@ -0,0 +1,102 @@
+"""
+Audit trail reads (OrderEvent rows written by the status transitions).
+
+Events are read in (created_at, id) order with keyset pagination: the cursor
+is the (created_at, id) of the last event returned and the next page is
+`WHERE (created_at, id) > cursor ORDER BY created_at, id LIMIT n`, a range
+scan of ix_order_events_created_at_id from the cursor on. Windows too large
+to page through are streamed as NDJSON from a server-side cursor.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Iterator
+
+from fastapi import HTTPException
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.order import Order
+from app.models.order_event import OrderEvent
+
+
+def encode_cursor(event: OrderEvent) -> str:
+    raw = f"{event.created_at.isoformat()}|{event.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        created_at, event_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(event_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _events_query(
+    request_id: str | None, since: datetime | None, until: datetime | None, order_id: int | None = None
+):
+    query = select(OrderEvent)
+    if order_id is not None:
+        query = query.where(OrderEvent.order_id == order_id)
+    if request_id is not None:
+        query = query.where(OrderEvent.request_id == request_id)
+    if since is not None:
+        query = query.where(OrderEvent.created_at >= since)
+    if until is not None:
+        query = query.where(OrderEvent.created_at < until)
+    return query.order_by(OrderEvent.created_at, OrderEvent.id)
+
+
+def list_events(
+    db: Session,
+    request_id: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    cursor: str | None = None,
+    limit: int = 100,
+    order_id: int | None = None,
+) -> tuple[list[OrderEvent], str | None]:
+    """
+    One page of events in [since, until), optionally only those of one request
+    id and/or one order. Returns (events, next cursor or None).
+    """
+    query = _events_query(request_id, since, until, order_id)
+    if cursor is not None:
+        query = query.where(tuple_(OrderEvent.created_at, OrderEvent.id) > decode_cursor(cursor))
+
+    # One extra row tells whether there is a next page
+    events = db.scalars(query.limit(limit + 1)).all()
+    if len(events) > limit:
+        return list(events[:limit]), encode_cursor(events[limit - 1])
+    return list(events), None
+
+
+def list_order_events(
+    db: Session, order_id: int, cursor: str | None = None, limit: int = 100
+) -> tuple[list[OrderEvent], str | None]:
+    """An order's events, oldest first (list_events for one order). 404 if the order doesn't exist."""
+    if db.get(Order, order_id) is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return list_events(db, cursor=cursor, limit=limit, order_id=order_id)
+
+
+def export_events_ndjson(
+    request_id: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    session_factory=SessionLocal,
+) -> Iterator[str]:
+    """All matching events, one JSON object per line, one chunk per server-side cursor batch."""
+    columns = [c.name for c in OrderEvent.__table__.columns]
+    with session_factory() as db:
+        result = db.execute(
+            _events_query(request_id, since, until)
+            .with_only_columns(*OrderEvent.__table__.columns)
+            .execution_options(stream_results=True, yield_per=settings.orders_export_batch_size)
+        )
+        for rows in result.partitions():
+            yield "".join(json.dumps(dict(zip(columns, r)), default=str) + "\n" for r in rows)
@@ -0,0 +1,113 @@
+"""
+Streaming order export (GET /orders/export).
+
+Orders LEFT JOIN order_items are read through a server-side cursor
+(stream_results + yield_per), so only one batch of rows is in memory at a
+time, and each batch is rendered into one chunk of NDJSON or CSV. The
+generators open their own session: the request's session is closed before
+the response body is streamed. StreamingResponse pulls the next chunk only
+after the previous one was handed to the client connection, so a slow
+reader slows the cursor down instead of buffering the export.
+"""
+import csv
+import io
+import json
+from typing import Iterator
+
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.order import Order, OrderStatus
+from app.models.order_item import OrderItem
+
+CSV_COLUMNS = ["order_id", "customer_id", "reference", "status", "priority", "item_id", "product_id", "qty"]
+
+
+def _export_query(status: OrderStatus | None, min_id: int | None, max_id: int | None):
+    query = (
+        select(
+            Order.id.label("order_id"),
+            Order.customer_id,
+            Order.reference,
+            Order.status,
+            Order.priority,
+            OrderItem.id.label("item_id"),
+            OrderItem.product_id,
+            OrderItem.qty,
+        )
+        .outerjoin(OrderItem, OrderItem.order_id == Order.id)
+        .order_by(Order.id, OrderItem.id)
+    )
+    if status is not None:
+        query = query.where(Order.status == status)
+    if min_id is not None:
+        query = query.where(Order.id >= min_id)
+    if max_id is not None:
+        query = query.where(Order.id <= max_id)
+    return query
+
+
+def _batches(status: OrderStatus | None, min_id: int | None, max_id: int | None, session_factory):
+    batch_size = settings.orders_export_batch_size
+    with session_factory() as db:
+        result = db.execute(
+            _export_query(status, min_id, max_id).execution_options(stream_results=True, yield_per=batch_size)
+        )
+        yield from result.partitions()
+
+
+def export_ndjson(
+    status: OrderStatus | None = None,
+    min_id: int | None = None,
+    max_id: int | None = None,
+    session_factory=SessionLocal,
+) -> Iterator[str]:
+    """One JSON object per order, with its items nested."""
+    current = None
+    for rows in _batches(status, min_id, max_id, session_factory):
+        lines = []
+        for r in rows:
+            if current is None or current["id"] != r.order_id:
+                if current is not None:
+                    lines.append(json.dumps(current))
+                current = {
+                    "id": r.order_id,
+                    "customer_id": r.customer_id,
+                    "reference": r.reference,
+                    "status": r.status.value,
+                    "priority": r.priority,
+                    "items": [],
+                }
+            if r.item_id is not None:
+                current["items"].append({"id": r.item_id, "product_id": r.product_id, "qty": r.qty})
+        if lines:
+            yield "\n".join(lines) + "\n"
+    # An order's items can span two batches, so the last order is only complete now
+    if current is not None:
+        yield json.dumps(current) + "\n"
+
+
+def export_csv(
+    status: OrderStatus | None = None,
+    min_id: int | None = None,
+    max_id: int | None = None,
+    session_factory=SessionLocal,
+) -> Iterator[str]:
+    """One row per order item (orders without items get one row with empty item columns)."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    # The header goes out with the first batch: nothing is sent before the query
+    # runs (app.db.replica.stream_from_replica can still switch to the primary)
+    writer.writerow(CSV_COLUMNS)
+
+    for rows in _batches(status, min_id, max_id, session_factory):
+        writer.writerows(
+            (r.order_id, r.customer_id, r.reference, r.status.value, r.priority, r.item_id, r.product_id, r.qty)
+            for r in rows
+        )
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()  # no rows: the header alone
@@ -1,77 +1,290 @@
 from __future__ import annotations
 
+from typing import Any, NoReturn, Sequence
+
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.engine import Row
 from sqlalchemy.orm import Session
-from sqlalchemy import select
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy import insert, select
 from fastapi import HTTPException
 
+from app.db.pipeline import run_pipelined
+from app.db.queries import (
+    INSERT_ORDER_EVENT,
+    ORDER_BY_ID,
+    ORDER_BY_ID_FOR_UPDATE,
+    ORDER_STATUS_UPDATE,
+    RESERVE_STOCK,
+    RESTOCK,
+    reserve_stock_after,
+)
 from app.models.order_item import OrderItem
 from app.models.product import Product
 from app.models.order import Order, OrderStatus
 from app.models.order_event import OrderEvent
+from app.schemas.orders import OrderCreate
+from app.services.state_machine import (
+    ALLOWED,
+    BULK_TRANSITIONS,
+    TRANSITIONS,
+    Transition,
+    apply_bulk_transition,
+    compile_with,
+    transition_params,
+)
+from app.services.stock_shards import product_stock, return_to_shards, take_from_shards
+
+
+def _apply_stock_change(db: Session, statement, order_id: int) -> list:
+    """
+    One round-trip (queries.RESERVE_STOCK / RESTOCK): aggregate the order's
+    items, lock the products and apply the stock change; one
+    (product_id, qty, changed_id, stock_shards) row per needed product.
+    """
+    return db.execute(statement, {"order_id": order_id}).all()
 
 
 def reserve_stock_for_order(db: Session, order_id: int) -> None:
     """
-    Lock products rows (FOR UPDATE), validate stock, decrement stock_qty.
-    Caller owns the transaction + commit/rollback.
+    Check and decrement stock for all items of the order in a single
+    UPDATE products ... WHERE stock_qty >= needed RETURNING statement; product
+    row locks are taken and released with the transaction, not held across
+    round-trips. A shortfall is detected from the rows that were not updated.
+    Products with sharded stock are then taken from their shards, in product id
+    order (see app.services.stock_shards).
+    Caller owns the transaction + commit/rollback (rollback on error undoes the
+    decrements that did succeed).
     """
-    items = db.query(OrderItem).filter(OrderItem.order_id == order_id).all()
-    if not items:
+    _take_reserved(db, _apply_stock_change(db, RESERVE_STOCK, order_id))
+
+
+def _take_reserved(db: Session, rows: list) -> None:
+    # RESERVE_STOCK's rows: raise on a shortfall, take sharded products from their shards
+    if not rows:
         raise HTTPException(status_code=400, detail="Order has no items")
 
-    product_ids = sorted({it.product_id for it in items})
+    short = next((r for r in rows if r.changed_id is None and not r.stock_shards), None)
+    if short is not None:
+        _raise_shortfall(db, short.product_id, short.qty)
 
-    # LOCK products to avoid race conditions
-    products = (
-        db.execute(select(Product).where(Product.id.in_(product_ids)).with_for_update())
-        .scalars()
-        .all()
-    )
-    products_map = {p.id: p for p in products}
+    for r in rows:
+        if r.changed_id is None and not take_from_shards(db, r.product_id, r.stock_shards, r.qty):
+            _raise_shortfall(db, r.product_id, r.qty)
+
+
+# apply_reservation: the reserve transitions' compare-and-swap and RESERVE_STOCK in one statement
+_RESERVE_WITH_TRANSITION = {
+    name: compile_with(TRANSITIONS[name], reserve_stock_after) for name in ("reserve", "retry-reserve")
+}
+
+
+def apply_reservation(
+    db: Session,
+    t: Transition,
+    order_id: int,
+    actor=None,
+    request_id: str | None = None,
+) -> Row | None:
+    """
+    apply_transition(t) followed by reserve_stock_for_order, for the reserve
+    transitions, in one statement (one round-trip). The stock change runs only
+    when the status compare-and-swap matched: None (nothing locked or changed)
+    otherwise. Caller owns the commit and the rollback on error.
+    """
+    rows = db.execute(_RESERVE_WITH_TRANSITION[t.name], transition_params(order_id, actor, request_id)).all()
+    if not rows:
+        return None
+    _take_reserved(db, [r for r in rows if r.product_id is not None])
+    return rows[0]
 
-    # Validate: products exist + sufficient stock
-    for it in items:
-        p = products_map.get(it.product_id)
-        if not p:
-            raise HTTPException(status_code=400, detail=f"Product {it.product_id} not found")
-        if p.stock_qty < it.qty:
-            raise HTTPException(
-                status_code=409,
-                detail=f"Insufficient stock for product {p.id}: have {p.stock_qty}, need {it.qty}",
-            )
 
-    # Decrement stock (persisted on commit)
-    for it in items:
-        products_map[it.product_id].stock_qty -= it.qty
+def _raise_shortfall(db: Session, product_id: int, qty: int) -> NoReturn:
+    # Failure path only: read the current stock to explain the shortfall
+    have = product_stock(db, product_id)
+    if have is None:
+        raise HTTPException(status_code=400, detail=f"Product {product_id} not found")
+    raise HTTPException(
+        status_code=409,
+        detail=f"Insufficient stock for product {product_id}: have {have}, need {qty}",
+    )
 
 
 def restock_for_order(db: Session, order_id: int) -> None:
     """
-    Lock products rows (FOR UPDATE), increment stock_qty based on order items.
+    Increment stock_qty by the order's item quantities in one set-based UPDATE
+    (sharded products: add to one of their shards).
     Caller owns the transaction + commit/rollback.
     """
-    items = db.query(OrderItem).filter(OrderItem.order_id == order_id).all()
-    if not items:
-        return
+    rows = _apply_stock_change(db, RESTOCK, order_id)
+    missing = next((r for r in rows if r.stock_shards is None), None)
+    if missing is not None:
+        raise HTTPException(status_code=400, detail=f"Product {missing.product_id} not found")
+
+    for r in rows:
+        if r.changed_id is None:
+            return_to_shards(db, r.product_id, r.stock_shards, r.qty)
 
-    product_ids = sorted({it.product_id for it in items})
 
-    products = (
-        db.execute(select(Product).where(Product.id.in_(product_ids)).with_for_update())
-        .scalars()
-        .all()
+def insert_order(db: Session, payload: OrderCreate) -> Order:
+    """Add one NEW order and its items. Caller owns the commit."""
+    order = Order(
+        customer_id=payload.customer_id,
+        reference=payload.reference,
+        priority=payload.priority,
+        status=OrderStatus.NEW,
     )
-    products_map = {p.id: p for p in products}
+    db.add(order)
+    db.flush()
+
+    for it in payload.items:
+        db.add(OrderItem(order_id=order.id, product_id=it.product_id, qty=it.qty))
+    return order
+
+
+def create_orders_bulk(db: Session, payloads: Sequence[OrderCreate]) -> list[dict[str, Any]]:
+    """
+    Insert many orders + their items with multi-row INSERT ... RETURNING (one
+    statement per table, batched by SQLAlchemy's insertmanyvalues).
+    Orders referencing unknown products are rejected individually; if the set
+    insert still fails at the DB level, orders are retried one by one in
+    savepoints so only the offending ones fail.
+    Returns one {"index", "ok", "order", "error"} dict per payload, in order.
+    Caller owns the commit.
+    """
+    results: list[dict[str, Any]] = [{"index": i, "ok": False, "order": None, "error": None} for i in range(len(payloads))]
+
+    product_ids = {it.product_id for p in payloads for it in p.items}
+    known = set(db.scalars(select(Product.id).where(Product.id.in_(product_ids)))) if product_ids else set()
+
+    valid: list[int] = []
+    for i, p in enumerate(payloads):
+        missing = sorted({it.product_id for it in p.items} - known)
+        if missing:
+            results[i]["error"] = f"Product {missing[0]} not found"
+        else:
+            valid.append(i)
 
-    for it in items:
-        p = products_map.get(it.product_id)
-        if not p:
-            raise HTTPException(status_code=400, detail=f"Product {it.product_id} not found")
-        p.stock_qty += it.qty
+    if not valid:
+        return results
 
+    try:
+        with db.begin_nested():
+            _insert_orders(db, payloads, valid, results)
+    except DBAPIError:
+        # Isolate the failing order(s); the rest still go in
+        for i in valid:
+            try:
+                with db.begin_nested():
+                    _insert_orders(db, payloads, [i], results)
+            except DBAPIError as e:
+                results[i]["error"] = str(e.orig).strip().splitlines()[0]
 
-def get_order(db: Session, order_id: int) -> Order:
-    order = db.query(Order).filter(Order.id == order_id).first()
+    return results
+
+
+def _insert_orders(db: Session, payloads: Sequence[OrderCreate], indexes: list[int], results: list[dict[str, Any]]) -> None:
+    orders = [
+        {
+            "customer_id": payloads[i].customer_id,
+            "reference": payloads[i].reference,
+            "priority": payloads[i].priority,
+            "status": OrderStatus.NEW,
+        }
+        for i in indexes
+    ]
+    ids = db.scalars(
+        insert(Order).returning(Order.id, sort_by_parameter_order=True),
+        orders,
+    ).all()
+
+    items = [
+        {"order_id": order_id, "product_id": it.product_id, "qty": it.qty}
+        for order_id, i in zip(ids, indexes)
+        for it in payloads[i].items
+    ]
+    if items:
+        db.execute(insert(OrderItem), items)
+
+    for order_id, i, row in zip(ids, indexes, orders):
+        results[i].update(ok=True, order={"id": order_id, **row})
+
+
+def transition_orders_bulk(
+    db: Session,
+    to_status: OrderStatus,
+    order_ids: Sequence[int],
+    actor=None,
+    request_id: str | None = None,
+) -> list[dict[str, Any]]:
+    """
+    Move many orders to `to_status` with one set-based compare-and-swap (plus
+    one multi-row OrderEvent insert). Orders already in `to_status` count as
+    ok without a new event; the rest get a per-order 404/409-style error.
+    Returns one {"order_id", "ok", "status", "error"} dict per distinct id, in
+    request order. Caller owns the commit.
+    """
+    t = BULK_TRANSITIONS.get(to_status)
+    if t is None:
+        allowed = ", ".join(str(s) for s in BULK_TRANSITIONS)
+        raise HTTPException(status_code=400, detail=f"Bulk transitions to {to_status} are not supported ({allowed})")
+
+    ids = list(dict.fromkeys(order_ids))
+    changed = apply_bulk_transition(db, t, ids, actor=actor, request_id=request_id)
+
+    # Failure path only: explain the ids that didn't move
+    rest = [i for i in ids if i not in changed]
+    current = dict(db.execute(select(Order.id, Order.status).where(Order.id.in_(rest))).all()) if rest else {}
+
+    results = []
+    for order_id in ids:
+        if order_id in changed:
+            results.append({"order_id": order_id, "ok": True, "status": to_status, "error": None})
+            continue
+        status = current.get(order_id)
+        if status is None:
+            results.append({"order_id": order_id, "ok": False, "status": None, "error": "Order not found"})
+        elif status == to_status:
+            results.append({"order_id": order_id, "ok": True, "status": status, "error": None})
+        else:
+            error = f"Invalid transition {status} -> {to_status}"
+            results.append({"order_id": order_id, "ok": False, "status": status, "error": error})
+    return results
+
+
+def list_orders(
+    db: Session,
+    status: OrderStatus | None = None,
+    customer_id: int | None = None,
+    reference: str | None = None,
+    after: int | None = None,
+    limit: int = 50,
+) -> tuple[list[Order], int | None]:
+    """
+    One page of orders matching the filters, in id order, starting after the
+    `after` cursor. Returns (orders, next cursor or None). Keyset pagination:
+    every page is an index range scan from the cursor, however deep it is.
+    """
+    query = select(Order)
+    if status is not None:
+        query = query.where(Order.status == status)
+    if customer_id is not None:
+        query = query.where(Order.customer_id == customer_id)
+    if reference is not None:
+        query = query.where(Order.reference == reference)
+    if after is not None:
+        query = query.where(Order.id > after)
+
+    # One extra row tells whether there is a next page
+    orders = db.scalars(query.order_by(Order.id).limit(limit + 1)).all()
+    if len(orders) > limit:
+        return list(orders[:limit]), orders[limit - 1].id
+    return list(orders), None
+
+
+def get_order(db: Session, order_id: int, for_update: bool = False) -> Order:
+    # Order row first, then products/shards: the lock order every reservation path uses
+    order = db.scalar(ORDER_BY_ID_FOR_UPDATE if for_update else ORDER_BY_ID, {"order_id": order_id})
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     return order
@@ -83,30 +296,38 @@ def transition(
     to_status: OrderStatus,
     actor=None,
     request_id: str | None = None,
+    commit: bool = False,
 ) -> None:
     """
-    Validates status machine transitions, updates order.status,
-    and writes an OrderEvent audit row (same transaction).
+    Validates status machine transitions (app.services.state_machine.ALLOWED),
+    updates order.status, and writes an OrderEvent audit row (same transaction).
+    ORM variant of apply_transition for callers that already hold the order.
+    With `commit` the transaction is committed here; on psycopg 3 the UPDATE,
+    the INSERT and the COMMIT then go out in one round-trip (app.db.pipeline).
     """
-    allowed = {
-        OrderStatus.NEW: {OrderStatus.RESERVED, OrderStatus.CANCELLED, OrderStatus.FAILED_RESERVATION},
-        OrderStatus.RESERVED: {OrderStatus.PICKING, OrderStatus.CANCELLED},
-        OrderStatus.PICKING: {OrderStatus.PICKED},
-        OrderStatus.PICKED: {OrderStatus.SHIPPED},
-        OrderStatus.SHIPPED: set(),
-        OrderStatus.CANCELLED: set(),
-        OrderStatus.FAILED_RESERVATION: {OrderStatus.RESERVED, OrderStatus.CANCELLED},
-    }
-
-    if to_status not in allowed[order.status]:
+    if to_status not in ALLOWED[order.status]:
         raise HTTPException(
             status_code=409,
             detail=f"Invalid transition {order.status} -> {to_status}",
         )
 
     old = order.status
-    order.status = to_status
+    if commit:
+        event = transition_params(order.id, actor, request_id)
+        results = run_pipelined(
+            db,
+            [
+                (ORDER_STATUS_UPDATE, {"order_id": order.id, "to_status": to_status}),
+                (INSERT_ORDER_EVENT, {**event, "from_status": str(old), "to_status": str(to_status)}),
+            ],
+            commit=True,
+        )
+        if results is not None:
+            set_committed_value(order, "status", to_status)
+            db.commit()
+            return
 
+    order.status = to_status
     db.add(
         OrderEvent(
             order_id=order.id,
@@ -117,4 +338,6 @@ def transition(
             actor_role=getattr(actor, "role", None),
             request_id=request_id,
         )
-    )
\ No newline at end of file
+    )
+    if commit:
+        db.commit()
@@ -0,0 +1,123 @@
+"""
+In-process cache of resolved principals for AUTH_MODE=db, keyed by the token `sub`.
+
+Entries are dropped when a user's role, password or email changes:
+- locally, from ORM events on User;
+- in every other worker process, through Postgres LISTEN/NOTIFY (the NOTIFY is
+  sent in the same transaction, so it is delivered only if the change commits).
+The TTL bounds staleness for writes that bypass the ORM (call
+invalidate_principal() after raw SQL updates) or happen while a listener is
+reconnecting; the listener also clears the cache whenever it (re)connects.
+"""
+import logging
+import select
+import threading
+
+from sqlalchemy import event, func, inspect
+from sqlalchemy import select as sa_select
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.db.session import engine
+from app.models.user import User
+
+logger = logging.getLogger("app")
+
+INVALIDATION_CHANNEL = "principal_invalidate"
+_TRACKED_ATTRS = ("role", "hashed_password", "email")
+
+principal_cache = TTLCache(
+    "principal",
+    maxsize=settings.principal_cache_size,
+    ttl_seconds=settings.principal_cache_ttl_seconds,
+)
+
+
+def invalidate_principal(email: str) -> None:
+    """Drop the cached principal of `email` in this process."""
+    principal_cache.invalidate(email)
+
+
+def _changed_emails(target: User) -> set[str]:
+    state = inspect(target)
+    if not any(state.attrs[attr].history.has_changes() for attr in _TRACKED_ATTRS):
+        return set()
+    # Include the previous email too when the email itself changed
+    return {e for e in (target.email, *state.attrs.email.history.deleted) if e}
+
+
+def _notify(connection, emails: set[str]) -> None:
+    for email in emails:
+        invalidate_principal(email)
+        if connection.dialect.name == "postgresql":
+            connection.execute(sa_select(func.pg_notify(INVALIDATION_CHANNEL, email)))
+
+
+# Always notify, even if this process runs without a cache: other workers may have one
+@event.listens_for(User, "after_update")
+def _user_updated(mapper, connection, target: User) -> None:
+    _notify(connection, _changed_emails(target))
+
+
+@event.listens_for(User, "after_delete")
+def _user_deleted(mapper, connection, target: User) -> None:
+    _notify(connection, {target.email})
+
+
+class InvalidationListener:
+    """Background thread applying NOTIFYs from other workers to the local cache."""
+
+    def __init__(self, poll_seconds: float = 1.0, retry_seconds: float = 2.0):
+        self.poll_seconds = poll_seconds
+        self.retry_seconds = retry_seconds
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if not principal_cache.enabled or engine.dialect.name != "postgresql":
+            return
+        self._thread = threading.Thread(target=self._run, name="principal-invalidation", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_seconds * 2)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self._listen()
+            except Exception:
+                logger.exception("principal_invalidation_listener_error")
+            # Notifications may have been missed while disconnected
+            principal_cache.clear()
+            self._stop.wait(self.retry_seconds)
+
+    def _listen(self) -> None:
+        # Dedicated connection, detached so it never holds a pool slot
+        raw = engine.raw_connection()
+        conn = raw.driver_connection
+        raw.detach()
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {INVALIDATION_CHANNEL}")
+            principal_cache.clear()
+
+            while not self._stop.is_set():
+                if engine.dialect.driver == "psycopg":
+                    # psycopg 3: a generator of the notifications received within the timeout
+                    for notify in conn.notifies(timeout=self.poll_seconds):
+                        invalidate_principal(notify.payload)
+                    continue
+                if select.select([conn], [], [], self.poll_seconds) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    invalidate_principal(conn.notifies.pop(0).payload)
+        finally:
+            raw.close()
+
+
+invalidation_listener = InvalidationListener()
@@ -1,14 +1,24 @@
 import hashlib
+import logging
+import re
 import secrets
 from datetime import datetime, timedelta, timezone
 
 from fastapi import HTTPException
-from sqlalchemy import select
+from sqlalchemy import delete, or_, select, text
+from sqlalchemy.engine import Row
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.orm import Session
 
+from app.core.background import PeriodicTask
 from app.core.config import settings
+from app.core.metrics import REFRESH_TOKENS_SWEPT
+from app.db.queries import REFRESH_TOKEN_BY_HASH, ROTATE_REFRESH_TOKEN
+from app.db.session import SessionLocal
 from app.models.refresh_token import RefreshToken
 
+logger = logging.getLogger("app")
+
 
 def _hash_token(raw: str) -> str:
     data = (raw + settings.refresh_token_salt).encode("utf-8")
@@ -34,25 +44,186 @@ def issue_refresh_token(db: Session, user_id: int) -> str:
     return raw
 
 
-def rotate_refresh_token(db: Session, raw_token: str) -> int:
+def rotate_refresh_token(db: Session, raw_token: str) -> tuple[str, Row]:
+    """
+    Revoke `raw_token` and issue its successor in a single statement
+    (queries.ROTATE_REFRESH_TOKEN): conditional UPDATE ... RETURNING user_id -> INSERT of the new token -> user
+    (id, email, role). The revoked_at IS NULL guard makes concurrent rotations of
+    the same token race on the row lock: exactly one of them gets a row back.
+    Returns (new raw token, user row). Caller owns the commit.
+    """
     token_hash = _hash_token(raw_token)
-    rt = db.scalar(select(RefreshToken).where(RefreshToken.token_hash == token_hash))
+    new_raw = secrets.token_urlsafe(48)
+
+    now = datetime.now(timezone.utc)
+    expires = now + timedelta(days=settings.refresh_token_ttl_days)
+
+    user = db.execute(
+        ROTATE_REFRESH_TOKEN,
+        {"old_hash": token_hash, "new_hash": _hash_token(new_raw), "now": now, "new_expires_at": expires},
+    ).first()
+
+    if user is None:
+        _raise_rotation_error(db, token_hash, now)
+    return new_raw, user
 
+
+def _raise_rotation_error(db: Session, token_hash: str, now: datetime) -> None:
+    # Failure path only: one extra read to report why the token was rejected
+    rt = db.scalar(REFRESH_TOKEN_BY_HASH, {"token_hash": token_hash})
     if not rt:
         raise HTTPException(status_code=401, detail="Invalid refresh token")
-
-    now = datetime.now(timezone.utc)
     if rt.revoked_at is not None:
         raise HTTPException(status_code=401, detail="Refresh token revoked")
-    if rt.expires_at < now:
+    if rt.expires_at <= now:
         raise HTTPException(status_code=401, detail="Refresh token expired")
-
-    rt.revoked_at = now
-    return rt.user_id
+    raise HTTPException(status_code=401, detail="User not found")
 
 
 def revoke_refresh_token(db: Session, raw_token: str) -> None:
     token_hash = _hash_token(raw_token)
-    rt = db.scalar(select(RefreshToken).where(RefreshToken.token_hash == token_hash))
+    rt = db.scalar(REFRESH_TOKEN_BY_HASH, {"token_hash": token_hash})
     if rt and rt.revoked_at is None:
         rt.revoked_at = datetime.now(timezone.utc)
+
+
+# ---- Retention -----------------------------------------------------------------
+
+_PARTITION_NAME = re.compile(r"^refresh_tokens_p(\d{4})(\d{2})$")
+
+
+def sweep_refresh_tokens(db: Session, cutoff: datetime, batch_size: int) -> int:
+    """
+    Delete up to `batch_size` tokens that expired or were revoked before `cutoff`.
+    SKIP LOCKED lets several workers sweep side by side without waiting on each
+    other or on in-flight rotations. Caller owns the commit.
+    """
+    doomed = (
+        select(RefreshToken.id)
+        .where(or_(RefreshToken.expires_at < cutoff, RefreshToken.revoked_at < cutoff))
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    result = db.execute(delete(RefreshToken).where(RefreshToken.id.in_(doomed.scalar_subquery())))
+    return result.rowcount
+
+
+def _is_partitioned(db: Session) -> bool:
+    if db.get_bind().dialect.name != "postgresql":
+        return False
+    return bool(
+        db.scalar(text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('refresh_tokens')"))
+    )
+
+
+def _month_start(d: datetime) -> datetime:
+    return d.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_month(d: datetime) -> datetime:
+    return (d.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def maintain_refresh_token_partitions(db: Session, cutoff: datetime, until: datetime) -> list[str]:
+    """
+    For a refresh_tokens table range-partitioned by expires_at (see the
+    partition_refresh_tokens migration): drop monthly partitions that end
+    before `cutoff` and create the ones needed up to `until`.
+    Returns the dropped partition names. Caller owns the commit.
+    """
+    db.execute(text("SET LOCAL lock_timeout = '2s'"))
+    partitions = db.execute(
+        text(
+            "SELECT c.relname, c.oid = p.partdefid AS is_default FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_partitioned_table p ON p.partrelid = i.inhparent "
+            "WHERE i.inhparent = 'refresh_tokens'::regclass"
+        )
+    ).all()
+    default = next((p.relname for p in partitions if p.is_default), None)
+
+    dropped = []
+    for p in partitions:
+        m = _PARTITION_NAME.match(p.relname)
+        if not m:
+            continue  # default partition
+        start = datetime(int(m.group(1)), int(m.group(2)), 1, tzinfo=timezone.utc)
+        if _next_month(start) <= cutoff:
+            db.execute(text(f'DROP TABLE "{p.relname}"'))
+            dropped.append(p.relname)
+
+    existing = {p.relname for p in partitions}
+    month = _month_start(datetime.now(timezone.utc))
+    while month <= until:
+        end = _next_month(month)
+        name = f"refresh_tokens_p{month:%Y%m}"
+        if name not in existing:
+            _create_partition(db, name, month, end, default)
+        month = end
+    return dropped
+
+
+def _create_partition(db: Session, name: str, start: datetime, end: datetime, default: str | None) -> None:
+    bounds = f"FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    in_range = {"start": start, "end": end}
+    stray = default is not None and db.scalar(
+        text(f'SELECT EXISTS (SELECT 1 FROM "{default}" WHERE expires_at >= :start AND expires_at < :end)'),
+        in_range,
+    )
+    if not stray:
+        db.execute(text(f"CREATE TABLE {name} PARTITION OF refresh_tokens FOR VALUES {bounds}"))
+        return
+
+    # Tokens for this month already landed in the default partition (the sweeper
+    # was down): Postgres refuses to create the partition over them, so build it
+    # as a plain table, move them in and attach it
+    db.execute(text(f"CREATE TABLE {name} (LIKE refresh_tokens INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    db.execute(
+        text(
+            f'WITH moved AS (DELETE FROM "{default}" WHERE expires_at >= :start AND expires_at < :end '
+            f"RETURNING *) INSERT INTO {name} SELECT * FROM moved"
+        ),
+        in_range,
+    )
+    db.execute(text(f"ALTER TABLE refresh_tokens ATTACH PARTITION {name} FOR VALUES {bounds}"))
+    logger.info("refresh_token_partition_backfilled", extra={"partition": name})
+
+
+def run_refresh_token_retention() -> int:
+    """
+    One retention pass: partition maintenance (if partitioned), then bounded
+    DELETE batches, each in its own short transaction.
+    """
+    now = datetime.now(timezone.utc)
+    cutoff = now - timedelta(days=settings.refresh_token_retention_days)
+    total = 0
+
+    with SessionLocal() as db:
+        if _is_partitioned(db):
+            until = now + timedelta(days=settings.refresh_token_ttl_days + 31)
+            try:
+                dropped = maintain_refresh_token_partitions(db, cutoff, until)
+                db.commit()
+            except DBAPIError:
+                # e.g. lock_timeout: retried next pass, and the DELETE sweep below still runs
+                db.rollback()
+                logger.exception("refresh_token_partition_maintenance_failed")
+                dropped = []
+            if dropped:
+                logger.info("refresh_token_partitions_dropped", extra={"partitions": dropped})
+
+        for _ in range(settings.refresh_token_sweep_max_batches):
+            deleted = sweep_refresh_tokens(db, cutoff, settings.refresh_token_sweep_batch_size)
+            db.commit()
+            total += deleted
+            if deleted < settings.refresh_token_sweep_batch_size:
+                break
+
+    REFRESH_TOKENS_SWEPT.inc(total)
+    return total
+
+
+refresh_token_sweeper = PeriodicTask(
+    "refresh-token-sweeper",
+    settings.refresh_token_sweep_interval_seconds,
+    run_refresh_token_retention,
+)
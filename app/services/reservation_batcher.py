@@ -0,0 +1,283 @@
+"""
+Micro-batched stock reservation (group commit).
+
+With RESERVATION_BATCHING_ENABLED the reserve endpoints hand their order to the
+ReservationCoordinator instead of running their own transaction. Its thread
+collects requests for up to RESERVATION_BATCH_WINDOW_MS (or
+RESERVATION_BATCH_MAX requests), then, in one transaction:
+
+1. locks the orders, in id order, then every product the batch needs once,
+   in id order (and the shards of sharded products, in shard order); the same
+   order as the single-request path, so the two can run side by side;
+2. allocates stock to the orders in order id order; an order gets everything
+   it needs or nothing;
+3. moves each order to RESERVED or FAILED_RESERVATION through transition(), so
+   every change still gets its OrderEvent with the requesting actor and
+   request id;
+4. commits once and resolves each waiting request's future.
+
+If the batch transaction fails (e.g. a deadlock), its orders are retried one
+transaction each, so one bad order doesn't fail the others.
+"""
+import asyncio
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+
+from fastapi import HTTPException
+from sqlalchemy import func, select, update
+
+from app.core.config import settings
+from app.core.metrics import RESERVATION_BATCH_SIZE
+from app.db.session import SessionLocal
+from app.models.order import Order, OrderStatus
+from app.models.order_item import OrderItem
+from app.models.product import Product
+from app.models.product_stock_shard import ProductStockShard
+from app.services.orders_service import transition
+
+logger = logging.getLogger("app")
+
+
+def _unavailable() -> HTTPException:
+    # The outcome is unknown or the reservation wasn't made: the client retries
+    return HTTPException(
+        status_code=503,
+        detail="Reservation is still being processed, retry shortly",
+        headers={"Retry-After": str(settings.reservation_batch_retry_after_seconds)},
+    )
+
+
+@dataclass
+class _PendingReservation:
+    order_id: int
+    from_status: OrderStatus  # NEW for /reserve, FAILED_RESERVATION for /retry-reserve
+    actor: object
+    request_id: str | None
+    future: Future = field(default_factory=Future)
+
+
+class ReservationCoordinator:
+    def __init__(self, enabled: bool, window_ms: float, max_batch: int):
+        self.enabled = enabled
+        self.window_seconds = window_ms / 1000
+        self.max_batch = max_batch
+        self._queue: queue.Queue[_PendingReservation] = queue.Queue()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if not self.enabled or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="reservation-coordinator", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        # Requests already queued are still processed before the thread exits
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    async def reserve(
+        self, order_id: int, from_status: OrderStatus, actor=None, request_id: str | None = None
+    ) -> OrderStatus:
+        """
+        Queue the order for the next batch and await its outcome. Returns
+        RESERVED; raises HTTPException like the single-request path does (409
+        with the shortfall after FAILED_RESERVATION was recorded, 400/404/409
+        when the order can't be reserved at all), or 503 when the outcome isn't
+        known within reservation_batch_timeout_seconds (the batch may still
+        reserve the order; a retry then returns it as RESERVED).
+        """
+        pending = _PendingReservation(order_id, from_status, actor, request_id)
+        self._queue.put(pending)
+        try:
+            # shield: a timeout or client disconnect must not cancel the future the batch will resolve
+            return await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(pending.future)),
+                timeout=settings.reservation_batch_timeout_seconds,
+            )
+        except asyncio.TimeoutError:
+            raise _unavailable() from None
+
+    def _run(self) -> None:
+        while True:
+            try:
+                first = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return
+                continue
+
+            batch = [first]
+            deadline = time.monotonic() + self.window_seconds
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            RESERVATION_BATCH_SIZE.observe(len(batch))
+            try:
+                outcomes = process_reservation_batch(batch)
+            except Exception:
+                logger.exception("reservation_batch_error", extra={"batch_size": len(batch)})
+                outcomes = _process_one_by_one(batch)
+
+            for pending in batch:
+                outcome = outcomes[pending.order_id]
+                if outcome is None:
+                    pending.future.set_exception(_unavailable())
+                elif isinstance(outcome, Exception):
+                    pending.future.set_exception(outcome)
+                else:
+                    pending.future.set_result(outcome)
+
+
+def _process_one_by_one(batch: list[_PendingReservation]) -> dict[int, OrderStatus | Exception | None]:
+    """After a failed batch: each order in a transaction of its own; None where that fails too."""
+    outcomes: dict[int, OrderStatus | Exception | None] = {}
+    for order_id in dict.fromkeys(p.order_id for p in batch):
+        try:
+            outcomes.update(process_reservation_batch([p for p in batch if p.order_id == order_id]))
+        except Exception:
+            logger.exception("reservation_error", extra={"order_id": order_id})
+            outcomes[order_id] = None
+    return outcomes
+
+
+def _lock_stock(db, product_ids: list[int]) -> tuple[dict[int, int], dict[int, list]]:
+    """Lock the batch's products (and shards) once; return available stock and shard rows."""
+    products = db.execute(
+        select(Product.id, Product.stock_qty, Product.stock_shards)
+        .where(Product.id.in_(product_ids))
+        .order_by(Product.id)
+        .with_for_update()
+    ).all()
+    available = {p.id: p.stock_qty for p in products}
+
+    shards: dict[int, list] = defaultdict(list)
+    sharded = [p.id for p in products if p.stock_shards]
+    if sharded:
+        rows = db.execute(
+            select(ProductStockShard.product_id, ProductStockShard.shard, ProductStockShard.qty)
+            .where(ProductStockShard.product_id.in_(sharded))
+            .order_by(ProductStockShard.product_id, ProductStockShard.shard)
+            .with_for_update()
+        ).all()
+        for r in rows:
+            shards[r.product_id].append(r)
+            available[r.product_id] += r.qty
+    return available, shards
+
+
+def _write_stock(db, before: dict[int, int], after: dict[int, int], shards: dict[int, list]) -> None:
+    product_rows = []
+    shard_rows = []
+    for product_id, qty in after.items():
+        taken = before[product_id] - qty
+        if not taken:
+            continue
+        if product_id not in shards:
+            product_rows.append({"id": product_id, "stock_qty": qty})
+            continue
+        # Take from the fullest shards first to keep them level
+        for s in sorted(shards[product_id], key=lambda s: s.qty, reverse=True):
+            part = min(s.qty, taken)
+            if part:
+                shard_rows.append({"product_id": product_id, "shard": s.shard, "qty": s.qty - part})
+                taken -= part
+            if not taken:
+                break
+    if product_rows:
+        db.execute(update(Product), product_rows)
+    if shard_rows:
+        db.execute(update(ProductStockShard), shard_rows)
+
+
+def process_reservation_batch(batch: list[_PendingReservation]) -> dict[int, OrderStatus | Exception]:
+    """Reserve a batch of orders in one transaction; returns the outcome per order id."""
+    first: dict[int, _PendingReservation] = {}
+    for pending in batch:
+        first.setdefault(pending.order_id, pending)
+    order_ids = sorted(first)
+
+    outcomes: dict[int, OrderStatus | Exception] = {}
+    with SessionLocal() as db:
+        orders = {
+            o.id: o
+            for o in db.scalars(select(Order).where(Order.id.in_(order_ids)).order_by(Order.id).with_for_update())
+        }
+
+        lines: dict[int, dict[int, int]] = defaultdict(dict)
+        for r in db.execute(
+            select(OrderItem.order_id, OrderItem.product_id, func.sum(OrderItem.qty).label("qty"))
+            .where(OrderItem.order_id.in_(order_ids))
+            .group_by(OrderItem.order_id, OrderItem.product_id)
+        ):
+            lines[r.order_id][r.product_id] = r.qty
+
+        product_ids = sorted({pid for need in lines.values() for pid in need})
+        before, shards = _lock_stock(db, product_ids) if product_ids else ({}, {})
+        available = dict(before)
+
+        for order_id in order_ids:
+            pending = first[order_id]
+            order = orders.get(order_id)
+            if order is None:
+                outcomes[order_id] = HTTPException(status_code=404, detail="Order not found")
+                continue
+            if order.status == OrderStatus.RESERVED:
+                outcomes[order_id] = OrderStatus.RESERVED  # idempotent
+                continue
+            if order.status != pending.from_status:
+                outcomes[order_id] = HTTPException(status_code=409, detail=f"Cannot reserve from {order.status}")
+                continue
+
+            need = lines.get(order_id)
+            if not need:
+                outcomes[order_id] = HTTPException(status_code=400, detail="Order has no items")
+                continue
+            missing = next((pid for pid in sorted(need) if pid not in available), None)
+            if missing is not None:
+                outcomes[order_id] = HTTPException(status_code=400, detail=f"Product {missing} not found")
+                continue
+
+            short = next((pid for pid in sorted(need) if available[pid] < need[pid]), None)
+            to_status = OrderStatus.RESERVED if short is None else OrderStatus.FAILED_RESERVATION
+            try:
+                transition(db, order, to_status, actor=pending.actor, request_id=pending.request_id)
+            except HTTPException as e:
+                outcomes[order_id] = e
+                continue
+
+            if short is None:
+                for pid, qty in need.items():
+                    available[pid] -= qty
+                outcomes[order_id] = OrderStatus.RESERVED
+            else:
+                outcomes[order_id] = HTTPException(
+                    status_code=409,
+                    detail=f"Insufficient stock for product {short}: have {available[short]}, need {need[short]}",
+                )
+
+        _write_stock(db, before, available, shards)
+        db.commit()
+
+    return outcomes
+
+
+reservation_coordinator = ReservationCoordinator(
+    settings.reservation_batching_enabled,
+    settings.reservation_batch_window_ms,
+    settings.reservation_batch_max,
+)
@@ -0,0 +1,275 @@
+"""
+Declarative order state machine.
+
+TRANSITIONS is the single source of truth for which status changes exist; the
+per-status ALLOWED map and one compare-and-swap statement per transition are
+built from it once, at import:
+
+    WITH old AS (SELECT id, status FROM orders
+                 WHERE id = :order_id AND status IN (<from>) FOR UPDATE),
+         upd AS (UPDATE orders SET status = <to> FROM old WHERE orders.id = old.id
+                 RETURNING orders.*, old.status AS from_status),
+         ev  AS (INSERT INTO order_events (...) SELECT ... FROM upd)
+    SELECT * FROM upd
+
+so checking the current status, changing it and writing the audit event is a
+single round-trip with no read-then-write race. Zero rows means the order is
+missing or in a status the transition doesn't start from. Transitions marked
+`bulk` (no side effects beyond the status) also get a variant matching
+`id = ANY(:order_ids)`, which locks the orders in id order.
+"""
+from dataclasses import dataclass, field
+
+from fastapi import HTTPException
+from sqlalchemy import ARRAY, Integer, String, any_, bindparam, cast, func, insert, literal, select, true, update
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session
+
+from app.db.pipeline import run_pipelined
+from app.models.order import Order, OrderStatus
+from app.models.order_event import OrderEvent
+
+
+# order_events.{from,to}_status hold str(OrderStatus.X), e.g. "OrderStatus.NEW"
+_EVENT_STATUS_PREFIX = f"{OrderStatus.__name__}."
+
+
+@dataclass(frozen=True)
+class Transition:
+    name: str
+    to_status: OrderStatus
+    from_statuses: frozenset[OrderStatus]
+    # No side effects beyond the status change (e.g. stock): may run in bulk
+    bulk: bool = False
+    statement: object = field(init=False, compare=False, repr=False)
+    bulk_statement: object = field(init=False, compare=False, repr=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "statement", _compile(self, _candidates(self, Order.id == bindparam("order_id"))))
+        if self.bulk:
+            # Many orders at once, locked in id order
+            ids = Order.id == any_(bindparam("order_ids", type_=ARRAY(Integer)))
+            object.__setattr__(self, "bulk_statement", _compile(self, _candidates(self, ids)))
+
+
+def _candidates(t: Transition, which):
+    return (
+        select(Order.id, Order.status)
+        .where(which, Order.status.in_(sorted(t.from_statuses)))
+        .order_by(Order.id)
+        .with_for_update()
+    )
+
+
+def _compile(t: Transition, candidates):
+    upd, ev = _compare_and_swap(t, candidates)
+    return select(
+        upd.c.id, upd.c.customer_id, upd.c.reference, upd.c.status, upd.c.priority, upd.c.from_status
+    ).add_cte(ev)
+
+
+def compile_with(t: Transition, effect):
+    """
+    t's compare-and-swap for one order (parameter order_id) and `effect` in a
+    single statement. effect(upd) builds a select whose CTEs only act when
+    the compare-and-swap CTE `upd` has rows. Each effect row is returned
+    after the updated order's columns (effect columns NULL if it has no rows),
+    ordered by the effect's columns; no rows at all means the compare-and-swap
+    missed and the effect did nothing.
+    """
+    upd, ev = _compare_and_swap(t, _candidates(t, Order.id == bindparam("order_id")))
+    result = effect(upd).subquery("effect")
+    return (
+        select(
+            upd.c.id,
+            upd.c.customer_id,
+            upd.c.reference,
+            upd.c.status,
+            upd.c.priority,
+            upd.c.from_status,
+            *result.c,
+        )
+        .select_from(upd.outerjoin(result, true()))
+        .order_by(*result.c)
+        .add_cte(ev)
+    )
+
+
+def _compare_and_swap(t: Transition, candidates):
+    old = candidates.cte("old")
+    upd = (
+        update(Order)
+        .where(Order.id == old.c.id)
+        .values(status=t.to_status)
+        .returning(
+            Order.id,
+            Order.customer_id,
+            Order.reference,
+            Order.status,
+            Order.priority,
+            old.c.status.label("from_status"),
+        )
+        .cte("upd")
+    )
+    ev = insert(OrderEvent).from_select(
+        ["order_id", "action", "from_status", "to_status", "actor_user_id", "actor_role", "request_id", "created_at"],
+        select(
+            upd.c.id,
+            literal("STATUS_CHANGE"),
+            func.concat(_EVENT_STATUS_PREFIX, cast(upd.c.from_status, String)),
+            literal(str(t.to_status)),
+            bindparam("actor_user_id", type_=OrderEvent.actor_user_id.type),
+            bindparam("actor_role", type_=OrderEvent.actor_role.type),
+            bindparam("request_id", type_=OrderEvent.request_id.type),
+            func.now(),
+        ),
+    ).cte("ev")
+    return upd, ev
+
+
+TRANSITIONS: dict[str, Transition] = {
+    t.name: t
+    for t in (
+        Transition("reserve", OrderStatus.RESERVED, frozenset({OrderStatus.NEW})),
+        Transition("retry-reserve", OrderStatus.RESERVED, frozenset({OrderStatus.FAILED_RESERVATION})),
+        # FAILED_RESERVATION -> FAILED_RESERVATION audits a failed retry
+        Transition(
+            "fail-reservation",
+            OrderStatus.FAILED_RESERVATION,
+            frozenset({OrderStatus.NEW, OrderStatus.FAILED_RESERVATION}),
+        ),
+        Transition("start-pick", OrderStatus.PICKING, frozenset({OrderStatus.RESERVED}), bulk=True),
+        Transition("confirm-pick", OrderStatus.PICKED, frozenset({OrderStatus.PICKING}), bulk=True),
+        Transition("ship", OrderStatus.SHIPPED, frozenset({OrderStatus.PICKED}), bulk=True),
+        Transition(
+            "cancel",
+            OrderStatus.CANCELLED,
+            frozenset({OrderStatus.NEW, OrderStatus.RESERVED, OrderStatus.FAILED_RESERVATION}),
+        ),
+    )
+}
+
+ALLOWED: dict[OrderStatus, frozenset[OrderStatus]] = {
+    status: frozenset(t.to_status for t in TRANSITIONS.values() if status in t.from_statuses)
+    for status in OrderStatus
+}
+
+# Target status -> transition, for POST /orders/transitions
+BULK_TRANSITIONS: dict[OrderStatus, Transition] = {t.to_status: t for t in TRANSITIONS.values() if t.bulk}
+
+
+def transition_params(order_id: int, actor=None, request_id: str | None = None) -> dict:
+    return {
+        "order_id": order_id,
+        "actor_user_id": getattr(actor, "id", None),
+        "actor_role": getattr(actor, "role", None),
+        "request_id": request_id,
+    }
+
+
+def apply_transition(
+    db: Session,
+    t: Transition,
+    order_id: int,
+    actor=None,
+    request_id: str | None = None,
+    commit: bool = False,
+) -> Row | None:
+    """
+    Run the transition's compare-and-swap. Returns the updated order
+    (id, customer_id, reference, status, from_status) or None if the order
+    doesn't exist or isn't in one of t.from_statuses. Caller owns the commit,
+    unless `commit`: then the transaction is committed here, and on psycopg 3
+    the statement and the COMMIT go out in one round-trip (app.db.pipeline).
+    """
+    params = transition_params(order_id, actor, request_id)
+    if commit:
+        results = run_pipelined(db, [(t.statement, params)], commit=True)
+        if results is not None:
+            db.commit()
+            return next(iter(results[0]), None)
+
+    row = db.execute(t.statement, params).first()
+    if commit:
+        db.commit()
+    return row
+
+
+def _claim_statement(t: Transition, order_by):
+    # Skip orders another picker is claiming right now instead of waiting for them
+    candidates = (
+        select(Order.id, Order.status)
+        .where(Order.status.in_(sorted(t.from_statuses)))
+        .order_by(*order_by)
+        .limit(bindparam("limit"))
+        .with_for_update(skip_locked=True)
+    )
+    return _compile(t, candidates)
+
+
+# POST /orders/claim-next: RESERVED -> PICKING for the next N unclaimed orders
+CLAIM_ORDER = {
+    "priority": (Order.priority.desc(), Order.id),
+    "age": (Order.id,),
+}
+CLAIM_STATEMENTS = {
+    name: _claim_statement(TRANSITIONS["start-pick"], order_by) for name, order_by in CLAIM_ORDER.items()
+}
+
+
+def claim_orders(
+    db: Session,
+    order_by: str,
+    limit: int,
+    actor=None,
+    request_id: str | None = None,
+) -> list[Row]:
+    """
+    Atomically move up to `limit` RESERVED orders to PICKING, highest priority
+    (or oldest) first, skipping rows locked by concurrent claims. Returns the
+    claimed orders in claim order. Caller owns the commit.
+    """
+    rows = db.execute(
+        CLAIM_STATEMENTS[order_by],
+        {
+            "limit": limit,
+            "actor_user_id": getattr(actor, "id", None),
+            "actor_role": getattr(actor, "role", None),
+            "request_id": request_id,
+        },
+    ).all()
+    if order_by == "priority":
+        return sorted(rows, key=lambda r: (-r.priority, r.id))
+    return sorted(rows, key=lambda r: r.id)
+
+
+def apply_bulk_transition(
+    db: Session,
+    t: Transition,
+    order_ids: list[int],
+    actor=None,
+    request_id: str | None = None,
+) -> dict[int, Row]:
+    """
+    Set-based apply_transition (t.bulk only): one statement moves every listed
+    order that is in one of t.from_statuses and inserts all their events.
+    Returns the updated rows by order id. Caller owns the commit.
+    """
+    rows = db.execute(
+        t.bulk_statement,
+        {
+            "order_ids": order_ids,
+            "actor_user_id": getattr(actor, "id", None),
+            "actor_role": getattr(actor, "role", None),
+            "request_id": request_id,
+        },
+    ).all()
+    return {r.id: r for r in rows}
+
+
+def current_status(db: Session, order_id: int) -> OrderStatus:
+    """Failure path of apply_transition: the order's status now, 404 if it doesn't exist."""
+    status = db.scalar(select(Order.status).where(Order.id == order_id))
+    if status is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return status
@@ -0,0 +1,233 @@
+"""
+Sharded stock counters for hot SKUs.
+
+A product with stock_shards = N keeps its stock in N product_stock_shards rows
+instead of products.stock_qty, so concurrent reservations of the same SKU lock
+different rows instead of queueing on one. Reservations start at a random shard
+and skip shards that are locked by someone else (FOR UPDATE SKIP LOCKED); only
+when every shard that could cover the quantity is busy do they wait for one,
+and only when no single shard holds enough are all shards locked, in shard
+order. Reads aggregate the shards (product_stock). Shards drift apart as they
+are drained unevenly; the rebalancer evens them out periodically.
+"""
+import logging
+import random
+
+from fastapi import HTTPException
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from app.core.background import PeriodicTask
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.product import Product
+from app.models.product_stock_shard import ProductStockShard as Shard
+
+logger = logging.getLogger("app")
+
+DEADLOCK_DETECTED = "40P01"
+
+
+def _split(total: int, shards: int) -> list[int]:
+    base, extra = divmod(total, shards)
+    return [base + (1 if i < extra else 0) for i in range(shards)]
+
+
+def _from(start: int):
+    # Visit shards start, start+1, ..., n-1, 0, ..., start-1
+    return (Shard.shard >= start).desc(), Shard.shard
+
+
+def product_stock(db: Session, product_id: int) -> int | None:
+    """Available stock of a product (stock_qty plus all shards); None if it doesn't exist."""
+    sharded = (
+        select(func.coalesce(func.sum(Shard.qty), 0))
+        .where(Shard.product_id == product_id)
+        .scalar_subquery()
+    )
+    return db.scalar(select(Product.stock_qty + sharded).where(Product.id == product_id))
+
+
+def get_product_stock(db: Session, product_id: int) -> dict:
+    """Aggregated stock plus the per-shard breakdown (admin view)."""
+    product = db.get(Product, product_id)
+    if product is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    shards = db.scalars(select(Shard.qty).where(Shard.product_id == product_id).order_by(Shard.shard)).all()
+    return {
+        "product_id": product.id,
+        "sku": product.sku,
+        "stock_qty": product.stock_qty + sum(shards),
+        "stock_shards": product.stock_shards,
+        "shards": list(shards),
+    }
+
+
+def take_from_shards(db: Session, product_id: int, shards: int, qty: int) -> bool:
+    """
+    Decrement `qty` from a sharded product's counters. Returns False (and
+    changes nothing) if the shards together hold less than `qty`.
+
+    1. Take everything from the first unlocked shard that holds enough.
+    2. All such shards are busy: wait for one (the qty >= needed condition is
+       rechecked once the lock is granted).
+    3. No single shard holds enough: lock all shards in shard order and spread
+       the decrement over them.
+
+    Postgres keeps the row lock on a shard whose recheck failed, so 1-2 run in
+    a savepoint that is rolled back (dropping those locks) before 3 waits for
+    the shards in order; a deadlock between two waiters in 2 ends up in 3 too.
+    """
+    start = random.randrange(shards)
+
+    savepoint = db.begin_nested()
+    try:
+        for skip_locked in (True, False):
+            pick = (
+                select(Shard.shard)
+                .where(Shard.product_id == product_id, Shard.qty >= qty)
+                .order_by(*_from(start))
+                .limit(1)
+                .with_for_update(skip_locked=skip_locked)
+                .scalar_subquery()
+            )
+            taken = db.execute(
+                update(Shard)
+                .where(Shard.product_id == product_id, Shard.shard == pick)
+                .values(qty=Shard.qty - qty)
+                .returning(Shard.shard)
+            ).first()
+            if taken is not None:
+                savepoint.commit()
+                return True
+    except DBAPIError as e:
+        # psycopg 3 names it sqlstate, psycopg2 pgcode (asyncpg's adapter has both)
+        if (getattr(e.orig, "sqlstate", None) or getattr(e.orig, "pgcode", None)) != DEADLOCK_DETECTED:
+            raise
+    savepoint.rollback()
+
+    rows = db.execute(
+        select(Shard.shard, Shard.qty)
+        .where(Shard.product_id == product_id)
+        .order_by(Shard.shard)
+        .with_for_update()
+    ).all()
+    if sum(r.qty for r in rows) < qty:
+        return False
+
+    remaining = qty
+    changes = []
+    for r in rows:
+        part = min(r.qty, remaining)
+        if part:
+            changes.append({"product_id": product_id, "shard": r.shard, "qty": r.qty - part})
+            remaining -= part
+        if remaining == 0:
+            break
+    db.execute(update(Shard), changes)
+    return True
+
+
+def return_to_shards(db: Session, product_id: int, shards: int, qty: int) -> None:
+    """Add `qty` back to one shard: an unlocked one if there is any, else wait for a random one."""
+    start = random.randrange(shards)
+    pick = (
+        select(Shard.shard)
+        .where(Shard.product_id == product_id)
+        .order_by(*_from(start))
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    returned = db.execute(
+        update(Shard)
+        .where(Shard.product_id == product_id, Shard.shard == pick)
+        .values(qty=Shard.qty + qty)
+        .returning(Shard.shard)
+    ).first()
+    if returned is None:
+        db.execute(
+            update(Shard)
+            .where(Shard.product_id == product_id, Shard.shard == start)
+            .values(qty=Shard.qty + qty)
+        )
+
+
+def set_stock_shards(db: Session, product_id: int, shards: int) -> Product:
+    """
+    Switch a product to `shards` counters (0 = back to the single
+    products.stock_qty row), redistributing its current stock evenly. Locks the
+    product row and every shard, so it waits for in-flight reservations.
+    Caller owns the commit.
+    """
+    if not 0 <= shards <= settings.stock_shards_max:
+        raise HTTPException(status_code=400, detail=f"shards must be between 0 and {settings.stock_shards_max}")
+
+    product = db.scalar(select(Product).where(Product.id == product_id).with_for_update())
+    if product is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+
+    current = db.scalars(
+        select(Shard.qty).where(Shard.product_id == product_id).order_by(Shard.shard).with_for_update()
+    ).all()
+    total = product.stock_qty + sum(current)
+
+    db.execute(delete(Shard).where(Shard.product_id == product_id))
+    if shards:
+        db.execute(
+            insert(Shard),
+            [{"product_id": product_id, "shard": i, "qty": q} for i, q in enumerate(_split(total, shards))],
+        )
+        product.stock_qty = 0
+    else:
+        product.stock_qty = total
+    product.stock_shards = shards
+    db.flush()
+    return product
+
+
+def rebalance_stock_shards(db: Session, product_id: int) -> int:
+    """
+    Even out the shards of one product that aren't locked right now (SKIP
+    LOCKED: reservations in flight are never waited for). Returns the number of
+    shards changed. Caller owns the commit.
+    """
+    rows = db.execute(
+        select(Shard.shard, Shard.qty)
+        .where(Shard.product_id == product_id)
+        .order_by(Shard.shard)
+        .with_for_update(skip_locked=True)
+    ).all()
+    if len(rows) < 2:
+        return 0
+
+    target = _split(sum(r.qty for r in rows), len(rows))
+    changes = [
+        {"product_id": product_id, "shard": r.shard, "qty": q}
+        for r, q in zip(rows, target)
+        if r.qty != q
+    ]
+    if changes:
+        db.execute(update(Shard), changes)
+    return len(changes)
+
+
+def run_stock_rebalance() -> int:
+    """One rebalancer pass over all sharded products, one short transaction each."""
+    total = 0
+    with SessionLocal() as db:
+        product_ids = db.scalars(select(Product.id).where(Product.stock_shards > 0).order_by(Product.id)).all()
+        for product_id in product_ids:
+            total += rebalance_stock_shards(db, product_id)
+            db.commit()
+    if total:
+        logger.info("stock_shards_rebalanced", extra={"shards_changed": total})
+    return total
+
+
+stock_shard_rebalancer = PeriodicTask(
+    "stock-shard-rebalancer",
+    settings.stock_shard_rebalance_interval_seconds,
+    run_stock_rebalance,
+)
@@ -0,0 +1,197 @@
+"""
+Write-path latency over a slow network: psycopg2 vs. psycopg 3 with pipeline
+mode (DB_DRIVER=psycopg, app.db.pipeline).
+
+    python -m benchmarks.bench_pipeline [rtt_ms] [iterations]
+
+Needs a migrated database (DATABASE_URL) and psycopg installed. Connections go
+through a local TCP proxy that delays every packet by rtt_ms / 2 in each
+direction (default 5 ms, roughly a cross-zone round-trip). Creates a throw-away
+product and one-item order and times, per driver, starting from an idle
+connection:
+
+  - status change: apply_transition(commit=True)
+    psycopg2: BEGIN, compare-and-swap, COMMIT; psycopg: one pipeline
+  - transition(): get_order(for_update) + transition(commit=True), as the
+    /integrations routes do. psycopg2: BEGIN, SELECT, UPDATE, INSERT, COMMIT;
+    psycopg: BEGIN, SELECT, then UPDATE + INSERT + COMMIT in one pipeline
+  - reservation: apply_reservation + commit, for reference: one statement on
+    either driver (BEGIN, compare-and-swap + stock change, COMMIT, which
+    depends on the stock result, so it isn't pipelined).
+
+In a request the transaction is usually open already (the caller's user
+lookup), saving the BEGIN.
+
+The order is reset outside the timed part, over a direct connection.
+"""
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+import uuid
+
+os.environ.setdefault("JWT_SECRET", "bench-secret")
+os.environ.setdefault("REFRESH_TOKEN_SALT", "bench-salt")
+
+from sqlalchemy import create_engine, delete, insert, make_url, update  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.db.session import SessionLocal  # noqa: E402
+from app.models.order import Order, OrderStatus  # noqa: E402
+from app.models.order_item import OrderItem  # noqa: E402
+from app.models.product import Product  # noqa: E402
+from app.services.orders_service import apply_reservation, get_order, transition  # noqa: E402
+from app.services.state_machine import TRANSITIONS, apply_transition  # noqa: E402
+
+
+class LatencyProxy:
+    """
+    TCP proxy on 127.0.0.1 that delivers every chunk `delay` seconds late, per
+    direction. Runs in its own process, so the benchmark's threads don't
+    compete with it for the GIL.
+    """
+
+    def __init__(self, upstream, delay: float):
+        self.upstream = upstream  # unix socket path, or (host, port)
+        self.delay = delay
+        self.port = None
+
+    async def _forward(self, reader, writer) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            data = await reader.read(65536)
+            # Callbacks due at the same time run in the order they were scheduled
+            loop.call_at(loop.time() + self.delay, writer.write if data else writer.close, *([data] if data else []))
+            if not data:
+                return
+
+    async def _handle(self, client_reader, client_writer) -> None:
+        if isinstance(self.upstream, str):
+            server_reader, server_writer = await asyncio.open_unix_connection(self.upstream)
+        else:
+            server_reader, server_writer = await asyncio.open_connection(*self.upstream)
+        await asyncio.gather(
+            self._forward(client_reader, server_writer),
+            self._forward(server_reader, client_writer),
+            return_exceptions=True,
+        )
+
+    def _run(self, ports) -> None:
+        loop = asyncio.new_event_loop()
+        server = loop.run_until_complete(asyncio.start_server(self._handle, "127.0.0.1", 0))
+        ports.send(server.sockets[0].getsockname()[1])
+        loop.run_forever()
+
+    def start(self) -> None:
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        multiprocessing.Process(target=self._run, args=(sender,), name="latency-proxy", daemon=True).start()
+        self.port = receiver.recv()
+
+
+def _proxied(rtt_ms: float) -> tuple[LatencyProxy, object]:
+    url = make_url(settings.database_url)
+    socket_dir = url.query.get("host")
+    if socket_dir:
+        upstream = f"{socket_dir}/.s.PGSQL.{url.port or 5432}"
+    else:
+        upstream = (url.host or "localhost", url.port or 5432)
+    proxy = LatencyProxy(upstream, rtt_ms / 2000)
+    proxy.start()
+    return proxy, url.difference_update_query(["host"]).set(host="127.0.0.1", port=proxy.port)
+
+
+def _setup() -> tuple[int, int]:
+    with SessionLocal() as db:
+        product = Product(sku=f"BENCH-{uuid.uuid4().hex[:12]}", name="bench pipeline", stock_qty=1_000_000)
+        db.add(product)
+        db.flush()
+        order_id = db.scalar(
+            insert(Order).returning(Order.id), {"customer_id": 1, "status": OrderStatus.FAILED_RESERVATION}
+        )
+        db.execute(insert(OrderItem), {"order_id": order_id, "product_id": product.id, "qty": 1})
+        db.commit()
+        return product.id, order_id
+
+
+def _reset(order_id: int) -> None:
+    with SessionLocal() as db:
+        db.execute(update(Order).where(Order.id == order_id).values(status=OrderStatus.FAILED_RESERVATION))
+        db.commit()
+
+
+def _cleanup(product_id: int, order_id: int) -> None:
+    with SessionLocal() as db:
+        db.execute(delete(Order).where(Order.id == order_id))
+        db.execute(delete(Product).where(Product.id == product_id))
+        db.commit()
+
+
+def _cases(order_id: int) -> list[tuple[str, object]]:
+    # FAILED_RESERVATION -> FAILED_RESERVATION (an audited failed retry) can repeat forever
+    def status_change(db):
+        assert apply_transition(db, TRANSITIONS["fail-reservation"], order_id, commit=True) is not None
+
+    def orm_transition(db):
+        order = get_order(db, order_id, for_update=True)
+        transition(db, order, OrderStatus.RESERVED, commit=True)
+
+    def reservation(db):
+        assert apply_reservation(db, TRANSITIONS["retry-reserve"], order_id) is not None
+        db.commit()
+
+    return [("status change", status_change), ("transition()", orm_transition), ("reservation", reservation)]
+
+
+def _round_trip(engine, iterations: int) -> float:
+    # Effective round-trip through the proxy (timer granularity adds to rtt_ms)
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("SELECT 1")
+        start = time.perf_counter()
+        for _ in range(iterations):
+            conn.exec_driver_sql("SELECT 1").all()
+        return (time.perf_counter() - start) / iterations * 1000
+
+
+def _time(session_factory, fn, order_id: int, iterations: int) -> float:
+    total = 0.0
+    with session_factory() as db:
+        fn(db)  # warm up: connection, compiled statements
+        for _ in range(iterations):
+            _reset(order_id)
+            start = time.perf_counter()
+            fn(db)
+            total += time.perf_counter() - start
+            db.expunge_all()
+    _reset(order_id)
+    return total / iterations * 1000
+
+
+def main() -> None:
+    rtt_ms = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    _, url = _proxied(rtt_ms)
+    engines = {
+        driver: create_engine(url.set(drivername=f"postgresql+{driver}"), pool_pre_ping=False)
+        for driver in ("psycopg2", "psycopg")
+    }
+    product_id, order_id = _setup()
+    try:
+        rtt = _round_trip(engines["psycopg2"], iterations)
+        print(f"simulated rtt {rtt_ms:g} ms (measured {rtt:.1f} ms), iterations {iterations}")
+        print(f"{'':16s} {'psycopg2':>22s} {'psycopg':>22s}")
+        for name, fn in _cases(order_id):
+            results = [
+                _time(sessionmaker(bind=engine, autoflush=False), fn, order_id, iterations)
+                for engine in engines.values()
+            ]
+            print(f"{name:16s} " + " ".join(f"{ms:7.1f} ms ({ms / rtt:4.1f} rtt)" for ms in results))
+    finally:
+        _cleanup(product_id, order_id)
+        for engine in engines.values():
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
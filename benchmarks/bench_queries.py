@@ -0,0 +1,155 @@
+"""
+Per-call overhead of the hot-path queries: statements built on every call vs.
+the prebuilt statements in app.db.queries, and asyncpg with and without its
+prepared statement cache.
+
+    python -m benchmarks.bench_queries [iterations]
+
+Needs a migrated database (DATABASE_URL). Creates a throw-away user, product
+and one-item order. For each query prints the client's CPU time per call
+(statement construction, compilation-cache lookup, driver, result handling)
+and the wall time per call; the difference is mostly the round-trip and the
+server's parse/plan/execute. Stock changes are rolled back after every call.
+"""
+import asyncio
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+os.environ.setdefault("JWT_SECRET", "bench-secret")
+os.environ.setdefault("REFRESH_TOKEN_SALT", "bench-salt")
+
+from sqlalchemy import delete, insert, make_url, select  # noqa: E402
+from sqlalchemy.ext.asyncio import create_async_engine  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.db import queries  # noqa: E402
+from app.db.session import SessionLocal, async_database_url  # noqa: E402
+from app.models.order import Order, OrderStatus  # noqa: E402
+from app.models.order_item import OrderItem  # noqa: E402
+from app.models.product import Product  # noqa: E402
+from app.models.user import User  # noqa: E402
+
+
+def _setup() -> tuple[str, int, int]:
+    with SessionLocal() as db:
+        email = f"bench-{uuid.uuid4().hex[:12]}@example.com"
+        user = User(email=email, hashed_password="!", role="operator")
+        product = Product(sku=f"BENCH-{uuid.uuid4().hex[:12]}", name="bench queries", stock_qty=1_000_000)
+        db.add_all([user, product])
+        db.flush()
+        order_id = db.scalar(insert(Order).returning(Order.id), {"customer_id": 1, "status": OrderStatus.NEW})
+        db.execute(insert(OrderItem), {"order_id": order_id, "product_id": product.id, "qty": 1})
+        db.commit()
+        return email, product.id, order_id
+
+
+def _cleanup(email: str, product_id: int, order_id: int) -> None:
+    with SessionLocal() as db:
+        db.execute(delete(Order).where(Order.id == order_id))
+        db.execute(delete(Product).where(Product.id == product_id))
+        db.execute(delete(User).where(User.email == email))
+        db.commit()
+
+
+def _sync_cases(email: str, order_id: int) -> list[tuple[str, object, object]]:
+    # (query, before: built per call, after: app.db.queries); each takes a Session
+    def reserve(statement_factory):
+        def run(db):
+            db.execute(statement_factory(), {"order_id": order_id}).all()
+            db.rollback()
+        return run
+
+    # An unknown token: the statement runs in full but rotates nothing
+    now = datetime.now(timezone.utc)
+    rotate_params = {"old_hash": "bench-unknown", "new_hash": "bench-new", "now": now, "new_expires_at": now}
+    return [
+        (
+            "user by email",
+            lambda db: db.scalar(select(User).where(User.email == email)),
+            lambda db: db.scalar(queries.USER_BY_EMAIL, {"email": email}),
+        ),
+        (
+            "get_order",
+            lambda db: db.query(Order).filter(Order.id == order_id).first(),
+            lambda db: db.scalar(queries.ORDER_BY_ID, {"order_id": order_id}),
+        ),
+        (
+            "reserve stock",
+            reserve(lambda: queries._stock_change(sign=-1, check_stock=True)),
+            reserve(lambda: queries.RESERVE_STOCK),
+        ),
+        (
+            "rotate refresh token",
+            lambda db: db.execute(queries._rotate_refresh_token(), rotate_params).first(),
+            lambda db: db.execute(queries.ROTATE_REFRESH_TOKEN, rotate_params).first(),
+        ),
+    ]
+
+
+def _time_sync(fn, iterations: int) -> tuple[float, float]:
+    with SessionLocal() as db:
+        fn(db)  # warm up: connection, compiled cache
+        wall, cpu = time.perf_counter(), time.process_time()
+        for _ in range(iterations):
+            fn(db)
+            db.expunge_all()  # don't let the identity map answer for the database
+        return (time.perf_counter() - wall) / iterations * 1e6, (time.process_time() - cpu) / iterations * 1e6
+
+
+async def _time_async(cache_size: int, email: str, order_id: int, iterations: int) -> dict[str, tuple[float, float]]:
+    url = make_url(async_database_url(settings.database_url, settings.async_database_url))
+    engine = create_async_engine(url.update_query_dict({"prepared_statement_cache_size": str(cache_size)}))
+    cases = {
+        "user by email": (queries.USER_BY_EMAIL, {"email": email}),
+        "get_order": (queries.ORDER_BY_ID, {"order_id": order_id}),
+    }
+    results = {}
+    try:
+        async with engine.connect() as conn:
+            for name, (statement, params) in cases.items():
+                await conn.execute(statement, params)
+                wall, cpu = time.perf_counter(), time.process_time()
+                for _ in range(iterations):
+                    (await conn.execute(statement, params)).first()
+                results[name] = (
+                    (time.perf_counter() - wall) / iterations * 1e6,
+                    (time.process_time() - cpu) / iterations * 1e6,
+                )
+    finally:
+        await engine.dispose()
+    return results
+
+
+def main() -> None:
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    email, product_id, order_id = _setup()
+    try:
+        print(f"iterations {iterations}, psycopg2 (sync engine)")
+        print(f"{'':22s} {'built per call':>24s} {'app.db.queries':>24s}")
+        for name, before, after in _sync_cases(email, order_id):
+            b_wall, b_cpu = _time_sync(before, iterations)
+            a_wall, a_cpu = _time_sync(after, iterations)
+            print(
+                f"{name:22s} {b_cpu:7.0f} us cpu {b_wall:7.0f} us wall"
+                f"  {a_cpu:7.0f} us cpu {a_wall:7.0f} us wall"
+            )
+
+        print("\nasyncpg, app.db.queries statements")
+        print(f"{'':22s} {'no prepared cache':>24s} {'prepared cache':>24s}")
+        unprepared = asyncio.run(_time_async(0, email, order_id, iterations))
+        prepared = asyncio.run(_time_async(100, email, order_id, iterations))
+        for name in unprepared:
+            (b_wall, b_cpu), (a_wall, a_cpu) = unprepared[name], prepared[name]
+            print(
+                f"{name:22s} {b_cpu:7.0f} us cpu {b_wall:7.0f} us wall"
+                f"  {a_cpu:7.0f} us cpu {a_wall:7.0f} us wall"
+            )
+    finally:
+        _cleanup(email, product_id, order_id)
+
+
+if __name__ == "__main__":
+    main()
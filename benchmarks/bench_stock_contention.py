@@ -0,0 +1,89 @@
+"""
+Reservation throughput on one hot SKU: single products.stock_qty row vs.
+sharded stock counters.
+
+    python -m benchmarks.bench_stock_contention [threads] [orders] [shards] [hold_ms]
+
+Needs a migrated database (DATABASE_URL). Creates a throw-away product and
+`orders` single-item orders for it, then reserves them from `threads` worker
+threads, once with the product unsharded and once with `shards` shards.
+Each worker keeps its transaction open for `hold_ms` after reserving, to stand
+in for the rest of the request (status transition, audit event, commit latency).
+"""
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("JWT_SECRET", "bench-secret")
+os.environ.setdefault("REFRESH_TOKEN_SALT", "bench-salt")
+
+from sqlalchemy import delete, insert  # noqa: E402
+
+from app.db.session import SessionLocal  # noqa: E402
+from app.models.order import Order, OrderStatus  # noqa: E402
+from app.models.order_item import OrderItem  # noqa: E402
+from app.models.product import Product  # noqa: E402
+from app.services.orders_service import reserve_stock_for_order  # noqa: E402
+from app.services.stock_shards import set_stock_shards  # noqa: E402
+
+
+def _setup(n_orders: int, shards: int) -> tuple[int, list[int]]:
+    with SessionLocal() as db:
+        product = Product(sku=f"BENCH-{uuid.uuid4().hex[:12]}", name="bench hot SKU", stock_qty=n_orders)
+        db.add(product)
+        db.flush()
+        if shards:
+            set_stock_shards(db, product.id, shards)
+        order_ids = db.scalars(
+            insert(Order).returning(Order.id),
+            [{"customer_id": 1, "reference": None, "status": OrderStatus.NEW} for _ in range(n_orders)],
+        ).all()
+        db.execute(insert(OrderItem), [{"order_id": oid, "product_id": product.id, "qty": 1} for oid in order_ids])
+        db.commit()
+        return product.id, list(order_ids)
+
+
+def _cleanup(product_id: int, order_ids: list[int]) -> None:
+    with SessionLocal() as db:
+        db.execute(delete(Order).where(Order.id.in_(order_ids)))
+        db.execute(delete(Product).where(Product.id == product_id))
+        db.commit()
+
+
+def _reserve(order_id: int, hold: float) -> None:
+    with SessionLocal() as db:
+        reserve_stock_for_order(db, order_id)
+        if hold:
+            time.sleep(hold)
+        db.commit()
+
+
+def _run(threads: int, n_orders: int, shards: int, hold: float) -> float:
+    product_id, order_ids = _setup(n_orders, shards)
+    try:
+        with ThreadPoolExecutor(threads) as pool:
+            start = time.perf_counter()
+            list(pool.map(lambda oid: _reserve(oid, hold), order_ids))
+            return n_orders / (time.perf_counter() - start)
+    finally:
+        _cleanup(product_id, order_ids)
+
+
+def main() -> None:
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    n_orders = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    shards = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+    hold = (float(sys.argv[4]) if len(sys.argv) > 4 else 20.0) / 1000
+
+    single = _run(threads, n_orders, 0, hold)
+    sharded = _run(threads, n_orders, shards, hold)
+
+    print(f"threads / orders / hold  {threads} / {n_orders} / {hold * 1000:.1f} ms")
+    print(f"single stock row         {single:8.0f} reservations/s")
+    print(f"{shards:2d} stock shards          {sharded:8.0f} reservations/s  (x{sharded / single:.1f})")
+
+
+if __name__ == "__main__":
+    main()
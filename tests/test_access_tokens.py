@@ -0,0 +1,14 @@
+import pytest
+
+from app.services.auth import create_access_token, decode_access_token
+
+
+def test_cached_token_payload_is_read_only():
+    token = create_access_token("reader@example.com", 1, "operator")
+    payload = decode_access_token(token)
+    with pytest.raises(TypeError):
+        payload["role"] = "admin"  # type: ignore[index]
+
+    cached = decode_access_token(token)
+    assert cached is payload
+    assert cached["role"] == "operator"
@@ -1,11 +1,17 @@
+import csv
+import io
+import json
 import os
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 import httpx
 from sqlalchemy import select
 
 from app.db.session import SessionLocal
+from app.models.order_event import OrderEvent
+from app.models.product import Product
 from app.models.user import User
 
 BASE_URL = os.getenv("BASE_URL", "http://localhost:8000")
@@ -18,6 +24,9 @@ OP_PASS = os.getenv("TEST_OPERATOR_PASS", "pass1234")
 SVC_EMAIL = os.getenv("TEST_SERVICE_EMAIL", "svc_test@example.com")
 SVC_PASS = os.getenv("TEST_SERVICE_PASS", "pass1234")
 
+ADMIN_EMAIL = os.getenv("TEST_ADMIN_EMAIL", "admin_test@example.com")
+ADMIN_PASS = os.getenv("TEST_ADMIN_PASS", "pass1234")
+
 
 def wait_api():
     for _ in range(30):
@@ -171,4 +180,434 @@ def test_service_cannot_access_orders_but_can_use_integrations():
     # service CAN access /integrations/*
     # Depending on data/order state, business result may vary
     r = httpx.post(f"{BASE_URL}/integrations/orders/1/reserve", headers=auth_headers(svc_token), timeout=10)
-    assert r.status_code in (200, 404, 409), r.text
\ No newline at end of file
+    assert r.status_code in (200, 404, 409), r.text
+
+
+def test_refresh_rotation_is_single_use_under_concurrency():
+    wait_api()
+    ensure_user_with_role(OP_EMAIL, OP_PASS, "operator")
+
+    r = httpx.post(f"{BASE_URL}/auth/login", json={"email": OP_EMAIL, "password": OP_PASS}, timeout=10)
+    assert r.status_code == 200, r.text
+    refresh_token = r.json()["refresh_token"]
+
+    def do_refresh(_):
+        return httpx.post(f"{BASE_URL}/auth/refresh", json={"refresh_token": refresh_token}, timeout=10)
+
+    # Concurrent rotations of the same token: exactly one may win
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        results = list(pool.map(do_refresh, range(5)))
+
+    codes = sorted(r.status_code for r in results)
+    assert codes == [200, 401, 401, 401, 401], codes
+
+    winner = next(r for r in results if r.status_code == 200).json()
+    r = httpx.get(f"{BASE_URL}/auth/me", headers=auth_headers(winner["access_token"]), timeout=10)
+    assert r.status_code == 200, r.text
+    assert r.json()["email"] == OP_EMAIL
+
+
+def test_bulk_create_reports_partial_failures():
+    wait_api()
+    ensure_user_with_role(OP_EMAIL, OP_PASS, "operator")
+    token = login_access_token(OP_EMAIL, OP_PASS)
+
+    reference = f"NL-BULK-TEST-{uuid.uuid4().hex[:8]}"
+    orders = [
+        {"customer_id": CUSTOMER_ID, "reference": f"{reference}-{i}", "items": [{"product_id": PRODUCT_ID, "qty": 1}]}
+        for i in range(3)
+    ]
+    orders.insert(1, {"customer_id": CUSTOMER_ID, "reference": reference, "items": [{"product_id": 987654321, "qty": 1}]})
+
+    r = httpx.post(f"{BASE_URL}/orders/bulk", headers=auth_headers(token), json={"orders": orders}, timeout=10)
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert (body["created"], body["failed"]) == (3, 1), body
+    assert [res["ok"] for res in body["results"]] == [True, False, True, True]
+
+    created = body["results"][2]["order"]
+    r = httpx.get(f"{BASE_URL}/orders/{created['id']}", headers=auth_headers(token), timeout=10)
+    assert r.status_code == 200, r.text
+    assert r.json()["reference"] == f"{reference}-1"
+    assert r.json()["status"] == "NEW"
+
+
+def test_insufficient_stock_reserves_nothing():
+    wait_api()
+    ensure_user_with_role(OP_EMAIL, OP_PASS, "operator")
+    token = login_access_token(OP_EMAIL, OP_PASS)
+
+    db = SessionLocal()
+    try:
+        stock_before = db.scalar(select(Product.stock_qty).where(Product.id == PRODUCT_ID))
+    finally:
+        db.close()
+
+    # Two lines for the same product: each fits on its own, together they don't
+    r = httpx.post(
+        f"{BASE_URL}/orders",
+        headers=auth_headers(token),
+        json={
+            "customer_id": CUSTOMER_ID,
+            "reference": f"NL-SHORT-TEST-{uuid.uuid4().hex[:8]}",
+            "items": [{"product_id": PRODUCT_ID, "qty": 1}, {"product_id": PRODUCT_ID, "qty": stock_before}],
+        },
+        timeout=10,
+    )
+    assert r.status_code == 200, r.text
+    order_id = r.json()["id"]
+
+    r = httpx.post(f"{BASE_URL}/orders/{order_id}/reserve", headers=auth_headers(token), timeout=10)
+    assert r.status_code == 409, r.text
+    assert "Insufficient stock" in r.json()["detail"]
+
+    r = httpx.get(f"{BASE_URL}/orders/{order_id}", headers=auth_headers(token), timeout=10)
+    assert r.json()["status"] == "FAILED_RESERVATION"
+
+    db = SessionLocal()
+    try:
+        assert db.scalar(select(Product.stock_qty).where(Product.id == PRODUCT_ID)) == stock_before
+    finally:
+        db.close()
+
+
+def test_sharded_stock_reserve_and_unshard():
+    wait_api()
+    ensure_user_with_role(ADMIN_EMAIL, ADMIN_PASS, "admin")
+    token = login_access_token(ADMIN_EMAIL, ADMIN_PASS)
+
+    db = SessionLocal()
+    try:
+        product = Product(sku=f"HOT-TEST-{uuid.uuid4().hex[:8]}", name="hot test SKU", stock_qty=10)
+        db.add(product)
+        db.commit()
+        product_id = product.id
+    finally:
+        db.close()
+
+    r = httpx.put(
+        f"{BASE_URL}/admin/products/{product_id}/stock-sharding",
+        headers=auth_headers(token),
+        json={"shards": 4},
+        timeout=10,
+    )
+    assert r.status_code == 200, r.text
+    assert r.json()["shards"] == [3, 3, 2, 2]
+    assert r.json()["stock_qty"] == 10
+
+    # 7 is more than any single shard holds: taken from several
+    r = httpx.post(
+        f"{BASE_URL}/orders",
+        headers=auth_headers(token),
+        json={"customer_id": CUSTOMER_ID, "items": [{"product_id": product_id, "qty": 7}]},
+        timeout=10,
+    )
+    assert r.status_code == 200, r.text
+    r = httpx.post(f"{BASE_URL}/orders/{r.json()['id']}/reserve", headers=auth_headers(token), timeout=10)
+    assert r.status_code == 200, r.text
+
+    r = httpx.get(f"{BASE_URL}/admin/products/{product_id}/stock", headers=auth_headers(token), timeout=10)
+    assert r.json()["stock_qty"] == 3
+
+    r = httpx.put(
+        f"{BASE_URL}/admin/products/{product_id}/stock-sharding",
+        headers=auth_headers(token),
+        json={"shards": 0},
+        timeout=10,
+    )
+    assert r.status_code == 200, r.text
+    assert (r.json()["stock_qty"], r.json()["stock_shards"], r.json()["shards"]) == (3, 0, [])
+
+
+def test_concurrent_transitions_apply_once():
+    wait_api()
+    ensure_user_with_role(OP_EMAIL, OP_PASS, "operator")
+    token = login_access_token(OP_EMAIL, OP_PASS)
+
+    r = httpx.post(
+        f"{BASE_URL}/orders",
+        headers=auth_headers(token),
+        json={"customer_id": CUSTOMER_ID, "items": [{"product_id": PRODUCT_ID, "qty": 1}]},
+        timeout=10,
+    )
+    order_id = r.json()["id"]
+    r = httpx.post(f"{BASE_URL}/orders/{order_id}/reserve", headers=auth_headers(token), timeout=10)
+    assert r.status_code == 200, r.text
+
+    def start_pick(_):
+        return httpx.post(f"{BASE_URL}/orders/{order_id}/start-pick", headers=auth_headers(token), timeout=10)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        responses = list(pool.map(start_pick, range(8)))
+    assert all(r.status_code == 200 and r.json()["status"] == "PICKING" for r in responses), [r.text for r in responses]
+
+    db = SessionLocal()
+    try:
+        events = db.scalars(
+            select(OrderEvent.to_status).where(OrderEvent.order_id == order_id).order_by(OrderEvent.id)
+        ).all()
+    finally:
+        db.close()
+    assert events == ["OrderStatus.RESERVED", "OrderStatus.PICKING"], events
+
+
+def test_failed_retry_reserve_is_audited():
+    wait_api()
+    ensure_user_with_role(OP_EMAIL, OP_PASS, "operator")
+    token = login_access_token(OP_EMAIL, OP_PASS)
+
+    r = httpx.post(
+        f"{BASE_URL}/orders",
+        headers=auth_headers(token),
+        json={"customer_id": CUSTOMER_ID, "items": [{"product_id": PRODUCT_ID, "qty": 10**9}]},
+        timeout=10,
+    )
+    order_id = r.json()["id"]
+
+    r = httpx.post(f"{BASE_URL}/orders/{order_id}/reserve", headers=auth_headers(token), timeout=10)
+    assert r.status_code == 409, r.text
+    r = httpx.post(f"{BASE_URL}/orders/{order_id}/retry-reserve", headers=auth_headers(token), timeout=10)
+    assert r.status_code == 409, r.text
+    assert "Insufficient stock" in r.json()["detail"]
+
+    db = SessionLocal()
+    try:
+        events = db.execute(
+            select(OrderEvent.from_status, OrderEvent.to_status)
+            .where(OrderEvent.order_id == order_id)
+            .order_by(OrderEvent.id)
+        ).all()
+    finally:
+        db.close()
+    assert [tuple(e) for e in events] == [
+        ("OrderStatus.NEW", "OrderStatus.FAILED_RESERVATION"),
+        ("OrderStatus.FAILED_RESERVATION", "OrderStatus.FAILED_RESERVATION"),
+    ], events
+
+
+def test_bulk_transitions_report_per_order_outcome():
+    wait_api()
+    ensure_user_with_role(OP_EMAIL, OP_PASS, "operator")
+    token = login_access_token(OP_EMAIL, OP_PASS)
+
+    order_ids = []
+    for _ in range(3):
+        r = httpx.post(
+            f"{BASE_URL}/orders",
+            headers=auth_headers(token),
+            json={"customer_id": CUSTOMER_ID, "items": [{"product_id": PRODUCT_ID, "qty": 1}]},
+            timeout=10,
+        )
+        order_ids.append(r.json()["id"])
+    for order_id in order_ids[:2]:
+        r = httpx.post(f"{BASE_URL}/orders/{order_id}/reserve", headers=auth_headers(token), timeout=10)
+        assert r.status_code == 200, r.text
+
+    # Two RESERVED, one still NEW, one unknown
+    r = httpx.post(
+        f"{BASE_URL}/orders/transitions",
+        headers=auth_headers(token),
+        json={"to_status": "PICKING", "order_ids": order_ids + [987654321]},
+        timeout=10,
+    )
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert (body["applied"], body["failed"]) == (2, 2), body
+    assert [(res["ok"], res["status"]) for res in body["results"]] == [
+        (True, "PICKING"),
+        (True, "PICKING"),
+        (False, "NEW"),
+        (False, None),
+    ]
+
+    r = httpx.post(
+        f"{BASE_URL}/orders/transitions",
+        headers=auth_headers(token),
+        json={"to_status": "CANCELLED", "order_ids": order_ids},
+        timeout=10,
+    )
+    assert r.status_code == 400, r.text
+
+
+def test_claim_next_hands_out_each_order_once():
+    wait_api()
+    ensure_user_with_role(OP_EMAIL, OP_PASS, "operator")
+    token = login_access_token(OP_EMAIL, OP_PASS)
+
+    # Outrank RESERVED orders left behind by other tests (and earlier runs)
+    base = int(time.time())
+    order_ids = []
+    for i in range(6):
+        r = httpx.post(
+            f"{BASE_URL}/orders",
+            headers=auth_headers(token),
+            json={"customer_id": CUSTOMER_ID, "priority": base + i, "items": [{"product_id": PRODUCT_ID, "qty": 1}]},
+            timeout=10,
+        )
+        assert r.status_code == 200, r.text
+        order_ids.append(r.json()["id"])
+        r = httpx.post(f"{BASE_URL}/orders/{order_ids[-1]}/reserve", headers=auth_headers(token), timeout=10)
+        assert r.status_code == 200, r.text
+
+    # Highest priority first
+    r = httpx.post(f"{BASE_URL}/orders/claim-next?limit=2", headers=auth_headers(token), timeout=10)
+    assert r.status_code == 200, r.text
+    assert [o["id"] for o in r.json()] == [order_ids[5], order_ids[4]]
+    assert all(o["status"] == "PICKING" for o in r.json())
+
+    def claim(_):
+        return httpx.post(f"{BASE_URL}/orders/claim-next", headers=auth_headers(token), timeout=10)
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        responses = list(pool.map(claim, range(4)))
+    assert all(r.status_code == 200 and len(r.json()) == 1 for r in responses), [r.text for r in responses]
+    assert sorted(r.json()[0]["id"] for r in responses) == sorted(order_ids[:4])
+
+    db = SessionLocal()
+    try:
+        picks = db.scalars(
+            select(OrderEvent.order_id).where(
+                OrderEvent.order_id.in_(order_ids), OrderEvent.to_status == "OrderStatus.PICKING"
+            )
+        ).all()
+    finally:
+        db.close()
+    assert sorted(picks) == sorted(order_ids)
+
+    r = httpx.post(f"{BASE_URL}/orders/claim-next?limit=100000", headers=auth_headers(token), timeout=10)
+    assert r.status_code == 413, r.text
+
+
+def test_list_orders_filters_and_keyset_pages():
+    wait_api()
+    ensure_user_with_role(OP_EMAIL, OP_PASS, "operator")
+    token = login_access_token(OP_EMAIL, OP_PASS)
+
+    reference = f"LIST-{uuid.uuid4().hex[:8]}"
+    order_ids = []
+    for _ in range(5):
+        r = httpx.post(
+            f"{BASE_URL}/orders",
+            headers=auth_headers(token),
+            json={"customer_id": CUSTOMER_ID, "reference": reference, "items": [{"product_id": PRODUCT_ID, "qty": 1}]},
+            timeout=10,
+        )
+        assert r.status_code == 200, r.text
+        order_ids.append(r.json()["id"])
+    r = httpx.post(f"{BASE_URL}/orders/{order_ids[0]}/cancel", headers=auth_headers(token), timeout=10)
+    assert r.status_code == 200, r.text
+
+    seen = []
+    after = None
+    while True:
+        params = {"reference": reference, "limit": 2}
+        if after is not None:
+            params["after"] = after
+        r = httpx.get(f"{BASE_URL}/orders", headers=auth_headers(token), params=params, timeout=10)
+        assert r.status_code == 200, r.text
+        page = r.json()
+        assert len(page["items"]) <= 2
+        seen += [o["id"] for o in page["items"]]
+        after = page["next_after"]
+        if after is None:
+            break
+    assert seen == order_ids
+
+    r = httpx.get(
+        f"{BASE_URL}/orders",
+        headers=auth_headers(token),
+        params={"reference": reference, "status": "CANCELLED", "customer_id": CUSTOMER_ID},
+        timeout=10,
+    )
+    assert r.status_code == 200, r.text
+    assert [o["id"] for o in r.json()["items"]] == [order_ids[0]]
+    assert r.json()["next_after"] is None
+
+
+def test_export_streams_orders_with_items():
+    wait_api()
+    ensure_user_with_role(OP_EMAIL, OP_PASS, "operator")
+    token = login_access_token(OP_EMAIL, OP_PASS)
+
+    order_ids = []
+    for items in (
+        [{"product_id": PRODUCT_ID, "qty": 1}],
+        [{"product_id": PRODUCT_ID, "qty": 2}, {"product_id": 2, "qty": 3}],
+    ):
+        r = httpx.post(
+            f"{BASE_URL}/orders",
+            headers=auth_headers(token),
+            json={"customer_id": CUSTOMER_ID, "items": items},
+            timeout=10,
+        )
+        assert r.status_code == 200, r.text
+        order_ids.append(r.json()["id"])
+    r = httpx.post(f"{BASE_URL}/orders/{order_ids[0]}/cancel", headers=auth_headers(token), timeout=10)
+    assert r.status_code == 200, r.text
+
+    params = {"min_id": order_ids[0], "max_id": order_ids[1]}
+    r = httpx.get(f"{BASE_URL}/orders/export", headers=auth_headers(token), params=params, timeout=10)
+    assert r.status_code == 200, r.text
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    orders = [json.loads(line) for line in r.text.splitlines()]
+    assert [o["id"] for o in orders] == order_ids
+    assert orders[0]["status"] == "CANCELLED"
+    assert [(i["product_id"], i["qty"]) for i in orders[1]["items"]] == [(PRODUCT_ID, 2), (2, 3)]
+
+    r = httpx.get(
+        f"{BASE_URL}/orders/export",
+        headers=auth_headers(token),
+        params={**params, "format": "csv", "status": "NEW"},
+        timeout=10,
+    )
+    assert r.status_code == 200, r.text
+    rows = list(csv.DictReader(io.StringIO(r.text)))
+    assert [(int(row["order_id"]), int(row["qty"])) for row in rows] == [(order_ids[1], 2), (order_ids[1], 3)]
+
+
+def test_audit_trail_pages_and_correlates_by_request_id():
+    wait_api()
+    ensure_user_with_role(OP_EMAIL, OP_PASS, "operator")
+    token = login_access_token(OP_EMAIL, OP_PASS)
+
+    r = httpx.post(
+        f"{BASE_URL}/orders",
+        headers=auth_headers(token),
+        json={"customer_id": CUSTOMER_ID, "items": [{"product_id": PRODUCT_ID, "qty": 1}]},
+        timeout=10,
+    )
+    order_id = r.json()["id"]
+    rid = f"test-{uuid.uuid4()}"
+    for action, request_id in (("reserve", None), ("cancel", rid)):
+        headers = auth_headers(token) | ({"X-Request-ID": request_id} if request_id else {})
+        r = httpx.post(f"{BASE_URL}/orders/{order_id}/{action}", headers=headers, timeout=10)
+        assert r.status_code == 200, r.text
+
+    events = []
+    cursor = None
+    while True:
+        params = {"limit": 1} | ({"cursor": cursor} if cursor else {})
+        r = httpx.get(f"{BASE_URL}/orders/{order_id}/events", headers=auth_headers(token), params=params, timeout=10)
+        assert r.status_code == 200, r.text
+        events += r.json()["items"]
+        cursor = r.json()["next_cursor"]
+        if cursor is None:
+            break
+    assert [e["to_status"] for e in events] == ["OrderStatus.RESERVED", "OrderStatus.CANCELLED"]
+
+    r = httpx.get(f"{BASE_URL}/events", headers=auth_headers(token), params={"request_id": rid}, timeout=10)
+    assert r.status_code == 200, r.text
+    assert [(e["order_id"], e["to_status"]) for e in r.json()["items"]] == [(order_id, "OrderStatus.CANCELLED")]
+
+    r = httpx.get(
+        f"{BASE_URL}/events",
+        headers=auth_headers(token),
+        params={"since": events[0]["created_at"], "format": "ndjson"},
+        timeout=10,
+    )
+    assert r.status_code == 200, r.text
+    streamed = [json.loads(line) for line in r.text.splitlines()]
+    assert {e["id"] for e in events} <= {e["id"] for e in streamed}
+
+    r = httpx.get(f"{BASE_URL}/events", headers=auth_headers(token), params={"cursor": "nope"}, timeout=10)
+    assert r.status_code == 400, r.text
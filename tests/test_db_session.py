@@ -0,0 +1,434 @@
+import os
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from fastapi import HTTPException
+from sqlalchemy import create_engine, event, exc, func, insert, make_url, select, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import app.api.deps as deps
+import app.api.orders as orders_api
+import app.db.replica as replica
+import app.services.stock_shards as stock_shards
+from app.core.config import settings
+from app.db.pipeline import pipeline_supported
+from app.db.pool import InstrumentedQueuePool
+from app.db.session import AsyncSessionLocal, SessionLocal, async_engine, engine
+from app.main import app
+from app.models.order import Order, OrderStatus
+from app.models.order_event import OrderEvent
+from app.models.order_item import OrderItem
+from app.models.product import Product
+from app.models.product_stock_shard import ProductStockShard
+from app.models.user import User
+from app.services.auth import create_access_token
+from app.services.orders_service import (
+    apply_reservation,
+    get_order,
+    reserve_stock_for_order,
+    restock_for_order,
+    transition,
+)
+from app.services.state_machine import TRANSITIONS, apply_transition
+
+PRODUCT_ID = int(os.getenv("TEST_PRODUCT_ID", "1"))
+CUSTOMER_ID = int(os.getenv("TEST_CUSTOMER_ID", "1"))
+
+OP_EMAIL = os.getenv("TEST_OPERATOR_EMAIL", "op_test@example.com")
+OP_PASS = os.getenv("TEST_OPERATOR_PASS", "pass1234")
+
+client = TestClient(app)
+
+# The pool request handlers check out from (the AsyncEngine's with DB_ASYNC)
+request_engine = async_engine.sync_engine if async_engine is not None else engine
+
+
+def set_user_role(email: str, role: str):
+    db = SessionLocal()
+    try:
+        user = db.scalar(select(User).where(User.email == email))
+        assert user is not None, f"user not found in DB after register: {email}"
+        user.role = role
+        db.commit()
+    finally:
+        db.close()
+
+
+def _token(email: str, password: str) -> str:
+    r = client.post("/auth/register", json={"email": email, "password": password})
+    assert r.status_code in (201, 409), r.text
+    set_user_role(email, "operator")
+
+    r = client.post("/auth/login", json={"email": email, "password": password})
+    assert r.status_code == 200, r.text
+    return r.json()["access_token"]
+
+
+def test_authenticated_request_uses_one_pooled_connection():
+    # Entering the client runs every request on one event loop (asyncpg connections are per loop)
+    with client:
+        token = _token(OP_EMAIL, OP_PASS)
+        headers = {"Authorization": f"Bearer {token}"}
+
+        r = client.post(
+            "/orders",
+            headers=headers,
+            json={
+                "customer_id": CUSTOMER_ID,
+                "reference": f"NL-ORDER-TEST-{uuid.uuid4().hex[:8]}",
+                "items": [{"product_id": PRODUCT_ID, "qty": 1}],
+            },
+        )
+        assert r.status_code == 200, r.text
+        order_id = r.json()["id"]
+
+        checkouts = []
+
+        def on_checkout(dbapi_conn, conn_record, conn_proxy):
+            checkouts.append(conn_record)
+
+        event.listen(request_engine, "checkout", on_checkout)
+        try:
+            # get_current_user, require_roles and the endpoint all share one session
+            r = client.get(f"/orders/{order_id}", headers=headers)
+        finally:
+            event.remove(request_engine, "checkout", on_checkout)
+
+        assert r.status_code == 200, r.text
+        assert len(checkouts) == 1, f"expected 1 pool checkout, got {len(checkouts)}"
+
+
+def _sample(name: str, pool: str = "sync") -> float:
+    return REGISTRY.get_sample_value(name, {"pool": pool}) or 0.0
+
+
+def test_pool_metrics_track_checkouts_waits_and_timeouts():
+    before = _sample("app_db_pool_checked_out")
+    with engine.connect():
+        assert _sample("app_db_pool_checked_out") == before + 1
+    assert _sample("app_db_pool_checked_out") == before
+
+    # A detached connection leaves the pool without a checkin
+    raw = engine.raw_connection()
+    raw.detach()
+    raw.close()
+    assert _sample("app_db_pool_checked_out") == before
+
+    # A one-connection pool with no overflow: the second checkout times out
+    tiny = create_engine(
+        settings.database_url, poolclass=InstrumentedQueuePool, pool_size=1, max_overflow=0, pool_timeout=0.2
+    )
+    waits = _sample("app_db_pool_checkout_wait_seconds_count")
+    timeouts = _sample("app_db_pool_checkout_timeouts_total")
+    try:
+        with tiny.connect():
+            with pytest.raises(exc.TimeoutError):
+                tiny.connect()
+    finally:
+        tiny.dispose()
+
+    assert _sample("app_db_pool_checkout_timeouts_total") == timeouts + 1
+    assert _sample("app_db_pool_checkout_wait_seconds_count") == waits + 2
+
+
+def _routed(target: str, reason: str) -> float:
+    return REGISTRY.get_sample_value("app_db_reads_routed_total", {"target": target, "reason": reason}) or 0.0
+
+
+def _operator_token(email: str) -> str:
+    # Issued directly: the app's lifespan (and its password-hash executor) runs once per process
+    with SessionLocal() as db:
+        user = db.scalar(select(User).where(User.email == email))
+        if user is None:
+            user = User(email=email, hashed_password="!", role="operator")
+            db.add(user)
+            db.commit()
+        return create_access_token(user.email, user.id, user.role)
+
+
+def test_reads_route_to_replica_unless_stale_or_asked_not_to(monkeypatch):
+    # The primary stands in for the replica (lag check: not in recovery -> 0)
+    monkeypatch.setattr(replica, "replica_engine", engine)
+    monkeypatch.setattr(deps, "ReplicaSessionLocal", SessionLocal)
+    monkeypatch.setattr(deps, "AsyncReplicaSessionLocal", AsyncSessionLocal)
+
+    with client:
+        headers = {"Authorization": f"Bearer {_operator_token('replica_test@example.com')}"}
+        r = client.post(
+            "/orders",
+            headers=headers,
+            json={"customer_id": CUSTOMER_ID, "items": [{"product_id": PRODUCT_ID, "qty": 1}]},
+        )
+        assert r.status_code == 200, r.text
+        order_id = r.json()["id"]
+
+        replica.check_replica()
+        assert REGISTRY.get_sample_value("app_db_replica_up") == 1
+
+        def read(expected_target: str, expected_reason: str, **kwargs):
+            before = _routed(expected_target, expected_reason)
+            r = client.get(f"/orders/{order_id}", headers={**headers, **kwargs.get("extra", {})})
+            assert r.status_code == 200, r.text
+            assert r.json()["id"] == order_id
+            assert _routed(expected_target, expected_reason) == before + 1
+
+        # The caller just wrote: read-your-writes keeps them on the primary
+        read("primary", "recent_write")
+
+        replica.recent_writers.clear()
+        read("replica", "replica")
+        read("primary", "header", extra={"X-Read-Primary": "true"})
+
+        replica.mark_replica_down()
+        read("primary", "replica_unhealthy")
+        replica.check_replica()
+        read("replica", "replica")
+
+
+def test_failed_replica_reads_fall_back_to_the_primary(monkeypatch):
+    # A replica nobody listens on
+    dead = create_engine("postgresql+psycopg2://postgres@127.0.0.1:1/app", pool_pre_ping=False)
+    dead_async = create_async_engine("postgresql+asyncpg://postgres@127.0.0.1:1/app") if async_engine else None
+    primary_in_use = []
+
+    def dead_replica(*args, **kwargs):
+        # Connections the request holds on the primary while it reads from the replica
+        primary_in_use.append(request_engine.pool.checkedout())
+        return sessionmaker(bind=dead)(*args, **kwargs)
+
+    def dead_async_replica(*args, **kwargs):
+        primary_in_use.append(request_engine.pool.checkedout())
+        return async_sessionmaker(dead_async)(*args, **kwargs)
+
+    monkeypatch.setattr(replica, "replica_engine", engine)
+    monkeypatch.setattr(deps, "ReplicaSessionLocal", dead_replica)
+    monkeypatch.setattr(deps, "AsyncReplicaSessionLocal", dead_async_replica if dead_async else None)
+    monkeypatch.setattr(orders_api, "ReplicaSessionLocal", dead_replica)
+
+    try:
+        with client:
+            headers = {"Authorization": f"Bearer {_operator_token('replica_down_test@example.com')}"}
+            r = client.post(
+                "/orders",
+                headers=headers,
+                json={"customer_id": CUSTOMER_ID, "items": [{"product_id": PRODUCT_ID, "qty": 1}]},
+            )
+            assert r.status_code == 200, r.text
+            order_id = r.json()["id"]
+
+            def routed_to_dead_replica(path: str):
+                replica.check_replica()  # healthy (the primary answers the lag check)
+                replica.recent_writers.clear()
+                before = _routed("replica", "replica")
+                r = client.get(path, headers=headers)
+                assert _routed("replica", "replica") == before + 1
+                assert REGISTRY.get_sample_value("app_db_replica_up") == 0
+                return r
+
+            r = routed_to_dead_replica(f"/orders/{order_id}")
+            assert r.status_code == 200, r.text
+            assert r.json()["id"] == order_id
+            assert primary_in_use == [0]
+
+            r = routed_to_dead_replica(f"/orders/export?format=csv&min_id={order_id}&max_id={order_id}")
+            assert r.status_code == 200, r.text
+            assert r.text.splitlines()[0].startswith("order_id,") and f"\n{order_id}," in r.text
+    finally:
+        dead.dispose()
+        replica.check_replica()
+
+
+def test_pipelined_transitions_on_psycopg3():
+    pytest.importorskip("psycopg")
+    pg3 = create_engine(make_url(settings.database_url).set(drivername="postgresql+psycopg"))
+    Pg3Session = sessionmaker(bind=pg3, autoflush=False)
+
+    def new_order(stock: int, qty: int) -> tuple[int, int]:
+        with SessionLocal() as db:
+            product = Product(sku=f"PIPE-{uuid.uuid4().hex[:12]}", name="pipeline test", stock_qty=stock)
+            db.add(product)
+            db.flush()
+            order_id = db.scalar(
+                insert(Order).returning(Order.id), {"customer_id": CUSTOMER_ID, "status": OrderStatus.NEW}
+            )
+            db.execute(insert(OrderItem), {"order_id": order_id, "product_id": product.id, "qty": qty})
+            db.commit()
+            return order_id, product.id
+
+    def state(order_id: int, product_id: int) -> tuple[OrderStatus, int, int]:
+        with SessionLocal() as db:
+            return (
+                db.scalar(select(Order.status).where(Order.id == order_id)),
+                db.scalar(select(Product.stock_qty).where(Product.id == product_id)),
+                db.scalar(select(func.count()).select_from(OrderEvent).where(OrderEvent.order_id == order_id)),
+            )
+
+    try:
+        with Pg3Session() as db:
+            assert pipeline_supported(db)
+
+        # Status change + stock reservation in one statement, committed by the caller
+        order_id, product_id = new_order(stock=5, qty=2)
+        with Pg3Session() as db:
+            order = apply_reservation(db, TRANSITIONS["reserve"], order_id, request_id="pipe-reserve")
+            assert (order.id, order.status, order.from_status) == (order_id, OrderStatus.RESERVED, OrderStatus.NEW)
+            db.commit()
+        assert state(order_id, product_id) == (OrderStatus.RESERVED, 3, 1)
+
+        # The compare-and-swap misses: the products are neither locked nor changed
+        with Pg3Session() as db:
+            assert apply_reservation(db, TRANSITIONS["reserve"], order_id) is None
+            with SessionLocal() as other:
+                other.execute(select(Product.id).where(Product.id == product_id).with_for_update(nowait=True))
+        assert state(order_id, product_id) == (OrderStatus.RESERVED, 3, 1)
+
+        # Compare-and-swap and COMMIT in one pipeline, from an idle connection
+        with Pg3Session() as db:
+            order = apply_transition(db, TRANSITIONS["start-pick"], order_id, commit=True)
+            assert order.status == OrderStatus.PICKING
+        assert state(order_id, product_id) == (OrderStatus.PICKING, 3, 2)
+
+        # ORM transition(): UPDATE + audit INSERT + COMMIT, inside the transaction get_order opened
+        with Pg3Session() as db:
+            order = get_order(db, order_id, for_update=True)
+            transition(db, order, OrderStatus.PICKED, request_id="pipe-confirm", commit=True)
+            assert order.status == OrderStatus.PICKED
+        assert state(order_id, product_id) == (OrderStatus.PICKED, 3, 3)
+        with SessionLocal() as db:
+            event = db.scalar(select(OrderEvent).where(OrderEvent.request_id == "pipe-confirm"))
+            assert (event.from_status, event.to_status) == (str(OrderStatus.PICKING), str(OrderStatus.PICKED))
+
+        # Not enough stock: 409, and the caller's rollback undoes the status change
+        order_id, product_id = new_order(stock=1, qty=2)
+        with Pg3Session() as db:
+            with pytest.raises(HTTPException) as e:
+                apply_reservation(db, TRANSITIONS["reserve"], order_id)
+            assert e.value.status_code == 409
+            db.rollback()
+        assert state(order_id, product_id) == (OrderStatus.NEW, 1, 0)
+    finally:
+        pg3.dispose()
+
+
+def test_shard_deadlock_falls_through_to_ordered_locking_on_psycopg3(monkeypatch):
+    pytest.importorskip("psycopg")
+    pg3 = create_engine(make_url(settings.database_url).set(drivername="postgresql+psycopg"))
+    Pg3Session = sessionmaker(bind=pg3, autoflush=False)
+    monkeypatch.setattr(stock_shards, "random", SimpleNamespace(randrange=lambda n: 0))
+
+    with SessionLocal() as db:
+        product = Product(sku=f"DEADLOCK-{uuid.uuid4().hex[:12]}", name="shard deadlock test", stock_qty=10)
+        db.add(product)
+        db.flush()
+        stock_shards.set_stock_shards(db, product.id, 2)
+        db.commit()
+        product_id = product.id
+    lock_product = select(Product.id).where(Product.id == product_id).with_for_update()
+
+    holding, waiting = threading.Event(), threading.Event()
+    holder_errors = []
+
+    def holder():
+        # Holds every shard, then waits for the product row the reservation holds
+        with Pg3Session() as db:
+            db.execute(
+                select(ProductStockShard.shard).where(ProductStockShard.product_id == product_id).with_for_update()
+            ).all()
+            holding.set()
+            waiting.wait()
+            time.sleep(0.2)  # the reservation waits first, so its deadlock check runs first
+            try:
+                db.execute(lock_product)
+            except exc.OperationalError as e:
+                holder_errors.append(e)  # the second cycle, with the reservation in step 3
+
+    thread = threading.Thread(target=holder)
+    try:
+        with Pg3Session() as db:
+            db.execute(lock_product)
+            thread.start()
+            holding.wait()
+            waiting.set()
+            # Step 1 skips both shards, step 2 waits for shard 0 and is the deadlock victim,
+            # step 3 waits for all shards in order
+            assert stock_shards.take_from_shards(db, product_id, 2, 3)
+            db.commit()
+        thread.join()
+        assert len(holder_errors) == 1
+        with SessionLocal() as db:
+            assert stock_shards.product_stock(db, product_id) == 7
+    finally:
+        waiting.set()
+        thread.join()
+        pg3.dispose()
+
+
+def test_stock_change_follows_a_reshard_it_waited_for():
+    with SessionLocal() as db:
+        product = Product(sku=f"RESHARD-{uuid.uuid4().hex[:12]}", name="reshard race test", stock_qty=10)
+        db.add(product)
+        db.flush()
+        order_id = db.scalar(insert(Order).returning(Order.id), {"customer_id": CUSTOMER_ID, "status": OrderStatus.NEW})
+        db.execute(insert(OrderItem), {"order_id": order_id, "product_id": product.id, "qty": 3})
+        db.commit()
+        product_id = product.id
+
+    def while_resharding(shards: int, change) -> None:
+        # `change` starts while set_stock_shards holds the product row and runs after it commits
+        errors = []
+
+        def run():
+            with SessionLocal() as db:
+                try:
+                    change(db, order_id)
+                    db.commit()
+                except Exception as e:
+                    errors.append(e)
+
+        with SessionLocal() as db:
+            stock_shards.set_stock_shards(db, product_id, shards)
+            thread = threading.Thread(target=run)
+            thread.start()
+            time.sleep(0.3)
+            db.commit()
+        thread.join()
+        assert errors == []
+
+    def stock() -> tuple[int, int]:
+        with SessionLocal() as db:
+            return (
+                db.scalar(select(Product.stock_qty).where(Product.id == product_id)),
+                stock_shards.product_stock(db, product_id),
+            )
+
+    while_resharding(2, reserve_stock_for_order)  # 0 -> 2: taken from the shards
+    assert stock() == (0, 7)
+    while_resharding(0, restock_for_order)  # 2 -> 0: back on stock_qty
+    assert stock() == (10, 10)
+    while_resharding(4, restock_for_order)
+    assert stock() == (0, 13)
+    while_resharding(0, reserve_stock_for_order)
+    assert stock() == (10, 10)
+
+
+def test_event_timestamps_share_one_clock_across_write_paths():
+    # ORM transition() and the compare-and-swap statement, in a non-UTC session
+    with SessionLocal() as db:
+        db.execute(text("SET LOCAL TIME ZONE 'America/New_York'"))
+        orm_order, cas_order = Order(customer_id=CUSTOMER_ID), Order(customer_id=CUSTOMER_ID)
+        db.add_all([orm_order, cas_order])
+        db.flush()
+        transition(db, orm_order, OrderStatus.CANCELLED, request_id="clock-orm")
+        db.flush()
+        apply_transition(db, TRANSITIONS["fail-reservation"], cas_order.id, request_id="clock-cas")
+        stamps = db.scalars(
+            select(OrderEvent.created_at).where(OrderEvent.request_id.in_(["clock-orm", "clock-cas"]))
+        ).all()
+        db.rollback()
+    assert len(stamps) == 2 and stamps[0] == stamps[1]
@@ -0,0 +1,91 @@
+import logging
+import queue
+import threading
+import time
+
+from prometheus_client import REGISTRY
+
+import app.core.logging as app_logging
+from app.core.logging import AccessLogSampler, BoundedQueueHandler
+
+
+def _dropped(reason: str) -> float:
+    return REGISTRY.get_sample_value("app_log_records_dropped_total", {"reason": reason}) or 0.0
+
+
+def _record(msg: str, *args, **extra) -> logging.LogRecord:
+    record = logging.LogRecord("app", logging.INFO, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def _fill(policy: str, block_timeout: float = 0.0) -> tuple[BoundedQueueHandler, queue.Queue]:
+    q: queue.Queue = queue.Queue(maxsize=2)
+    handler = BoundedQueueHandler(q, policy, block_timeout)
+    handler.handle(_record("first"))
+    handler.handle(_record("second"))
+    return handler, q
+
+
+def _queued(q: queue.Queue) -> list[str]:
+    messages = []
+    while not q.empty():
+        messages.append(q.get_nowait().getMessage())
+    return messages
+
+
+def test_drop_new_discards_the_incoming_record():
+    handler, q = _fill("drop_new")
+    before = _dropped("queue_full")
+    handler.handle(_record("third"))
+    assert _queued(q) == ["first", "second"]
+    assert _dropped("queue_full") == before + 1
+
+
+def test_drop_oldest_makes_room_for_the_incoming_record():
+    handler, q = _fill("drop_oldest")
+    before = _dropped("queue_full")
+    handler.handle(_record("third"))
+    assert _queued(q) == ["second", "third"]
+    assert _dropped("queue_full") == before + 1
+
+
+def test_block_waits_for_room_then_gives_up():
+    handler, q = _fill("block", block_timeout=0.2)
+    before = _dropped("queue_full")
+
+    start = time.monotonic()
+    handler.handle(_record("third"))
+    assert time.monotonic() - start >= 0.2
+    assert _dropped("queue_full") == before + 1
+
+    # Room frees up while it waits: nothing is dropped
+    threading.Timer(0.05, q.get_nowait).start()
+    handler.handle(_record("fourth"))
+    assert _queued(q) == ["second", "fourth"]
+    assert _dropped("queue_full") == before + 1
+
+
+def test_message_is_formatted_when_logged():
+    q: queue.Queue = queue.Queue()
+    handler = BoundedQueueHandler(q, "drop_new", 0.0)
+    items = ["a"]
+    handler.handle(_record("items %s", items))
+    items.append("b")  # after the call, before the listener thread gets to it
+    assert q.get_nowait().getMessage() == "items ['a']"
+
+
+def test_access_log_sampler_samples_only_2xx_request_records(monkeypatch):
+    sampler = AccessLogSampler(rate=0.25)
+    before = _dropped("sampled")
+
+    monkeypatch.setattr(app_logging.random, "random", lambda: 0.5)
+    assert not sampler.filter(_record("request", status_code=200))
+    assert sampler.filter(_record("request", status_code=500))
+    assert sampler.filter(_record("request", status_code=404))
+    assert sampler.filter(_record("order_created", status_code=200))
+    monkeypatch.setattr(app_logging.random, "random", lambda: 0.1)
+    assert sampler.filter(_record("request", status_code=204))
+    assert _dropped("sampled") == before + 1
+
+    assert AccessLogSampler(rate=1.0).filter(_record("request", status_code=200))
@@ -0,0 +1,103 @@
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+from sqlalchemy import delete, select
+
+import app.services.auth as auth
+from app.core.config import settings
+from app.db.session import SessionLocal, get_db
+from app.main import app
+from app.models.bcrypt_calibration import BcryptCalibration
+from app.models.user import User
+
+
+class _FakeDB:
+    """Stands in for the request session: the saturation check runs before any write."""
+
+    def __init__(self, user=None):
+        self.user = user
+
+    async def scalar(self, *args, **kwargs):
+        return self.user
+
+
+class _RefusingExecutor:
+    def submit(self, *args, **kwargs):
+        raise AssertionError("a saturated hashing executor must not take more work")
+
+
+def test_saturated_hashing_executor_answers_503_with_retry_after(monkeypatch):
+    monkeypatch.setattr(auth, "_hash_executor", _RefusingExecutor())
+    monkeypatch.setattr(
+        auth, "_hash_inflight", settings.password_hash_workers + settings.password_hash_max_queue
+    )
+    user = SimpleNamespace(email="saturated@example.com", hashed_password="$2b$12$unused", id=1, role="operator")
+    client = TestClient(app)  # no lifespan: nothing here touches the database
+    try:
+        app.dependency_overrides[get_db] = lambda: _FakeDB()
+        r = client.post("/auth/register", json={"email": "saturated@example.com", "password": "pass1234"})
+        assert r.status_code == 503, r.text
+        assert r.headers["Retry-After"] == str(settings.password_hash_retry_after_seconds)
+
+        app.dependency_overrides[get_db] = lambda: _FakeDB(user)
+        r = client.post("/auth/login", json={"email": "saturated@example.com", "password": "pass1234"})
+        assert r.status_code == 503, r.text
+        assert r.headers["Retry-After"] == str(settings.password_hash_retry_after_seconds)
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+
+    # Rejected calls don't count towards the queue
+    assert auth._hash_inflight == settings.password_hash_workers + settings.password_hash_max_queue
+
+
+def _rounds(hashed: str) -> int:
+    return int(hashed.split("$")[2])
+
+
+def test_login_rehashes_weaker_hashes_and_keeps_stronger_ones(monkeypatch):
+    monkeypatch.setattr(settings, "bcrypt_autotune", False)
+    monkeypatch.setattr(settings, "bcrypt_rounds", 5)
+    # An earlier lifespan shut the module's executor down; this one shuts down the patched one
+    monkeypatch.setattr(auth, "_hash_executor", ThreadPoolExecutor(max_workers=1))
+    bcrypt = auth.pwd_context.handler("bcrypt")
+    try:
+        with TestClient(app) as client:  # the lifespan applies BCRYPT_ROUNDS=5
+            for stored, expected in ((4, 5), (5, 5), (6, 6)):
+                email = f"rehash-{uuid.uuid4().hex[:8]}@example.com"
+                with SessionLocal() as db:
+                    hashed = bcrypt.using(rounds=stored).hash("pass1234")
+                    db.add(User(email=email, hashed_password=hashed, role="operator"))
+                    db.commit()
+
+                r = client.post("/auth/login", json={"email": email, "password": "pass1234"})
+                assert r.status_code == 200, r.text
+                with SessionLocal() as db:
+                    hashed = db.scalar(select(User.hashed_password).where(User.email == email))
+                assert _rounds(hashed) == expected
+                assert auth.pwd_context.verify("pass1234", hashed)
+    finally:
+        monkeypatch.undo()
+        auth.configure_password_hashing()
+
+
+def test_autotune_calibrates_once_per_deployment(monkeypatch):
+    monkeypatch.setattr(settings, "bcrypt_autotune", True)
+    calibrations = iter([11, 13])
+    monkeypatch.setattr(auth, "calibrate_bcrypt_rounds", lambda *args: next(calibrations))
+    with SessionLocal() as db:
+        db.execute(delete(BcryptCalibration))
+        db.commit()
+    try:
+        # The first process calibrates and stores the cost; the next one (another
+        # worker, whose own timing would say 13) uses the stored cost
+        assert auth.configure_password_hashing() == 11
+        assert auth.configure_password_hashing() == 11
+        assert next(calibrations) == 13
+    finally:
+        with SessionLocal() as db:
+            db.execute(delete(BcryptCalibration))
+            db.commit()
+        monkeypatch.undo()
+        auth.configure_password_hashing()
@@ -0,0 +1,117 @@
+import threading
+import time
+
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+import app.core.cache as cache_module
+import app.services.principal_cache as pc
+from app.core.cache import TTLCache
+from app.db.session import SessionLocal
+from app.main import app
+from app.models.user import User
+from app.services.auth import create_access_token
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_ttl_cache_evicts_least_recently_used_and_expired(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(cache_module.time, "monotonic", clock)
+    cache = TTLCache("test_lru_ttl", maxsize=2, ttl_seconds=10)
+
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" is now the least recently used
+    cache.set("c", 3)
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+
+    # A shorter per-entry ttl wins; a longer one is capped at the cache's
+    cache.set("short", 4, ttl_seconds=1)
+    cache.set("long", 5, ttl_seconds=60)
+    clock.now += 5
+    assert cache.get("short") is None
+    assert cache.get("long") == 5
+    clock.now += 6
+    assert cache.get("long") is None
+    assert len(cache) == 0
+
+
+def test_ttl_cache_drops_loads_that_raced_an_invalidation():
+    cache = TTLCache("test_epoch", maxsize=10, ttl_seconds=10)
+
+    epoch = cache.epoch
+    cache.invalidate("user@example.com")  # e.g. a role change committed while we were loading
+    cache.set("user@example.com", "stale", epoch=epoch)
+    assert cache.get("user@example.com") is None
+
+    epoch = cache.epoch
+    cache.set("user@example.com", "fresh", epoch=epoch)
+    assert cache.get("user@example.com") == "fresh"
+
+    epoch = cache.epoch
+    cache.clear()
+    cache.set("other@example.com", "stale", epoch=epoch)
+    assert cache.get("other@example.com") is None
+
+
+def test_disabled_ttl_cache_stores_nothing():
+    cache = TTLCache("test_disabled", maxsize=0, ttl_seconds=10)
+    cache.set("a", 1)
+    assert not cache.enabled
+    assert cache.get("a") is None
+
+
+def test_role_change_reaches_the_cache_through_notify(monkeypatch):
+    email = "principal_cache_test@example.com"
+    with SessionLocal() as db:
+        user = db.scalar(select(User).where(User.email == email))
+        if user is None:
+            user = User(email=email, hashed_password="!")
+            db.add(user)
+        user.role = "operator"
+        db.commit()
+        headers = {"Authorization": f"Bearer {create_access_token(email, user.id, 'operator')}"}
+
+    # Invalidations applied by the listener thread, i.e. received as NOTIFYs
+    notified = []
+    invalidate = pc.invalidate_principal
+
+    def recording_invalidate(key):
+        if threading.current_thread().name == "principal-invalidation":
+            notified.append(key)
+        invalidate(key)
+
+    monkeypatch.setattr(pc, "invalidate_principal", recording_invalidate)
+
+    client = TestClient(app)
+    with client:
+        monkeypatch.setattr(pc.principal_cache, "maxsize", 100)
+        listener = pc.InvalidationListener(poll_seconds=0.1, retry_seconds=0.1)
+        listener.start()
+        try:
+            time.sleep(0.5)  # LISTEN is in place (the listener clears the cache once it is)
+
+            # Past the role check (no such order)
+            assert client.get("/orders/0", headers=headers).status_code == 404
+            assert pc.principal_cache.get(email).role == "operator"
+
+            with SessionLocal() as db:
+                db.scalar(select(User).where(User.email == email)).role = "service"
+                db.commit()
+
+            deadline = time.monotonic() + 5
+            while email not in notified and time.monotonic() < deadline:
+                time.sleep(0.05)
+            assert email in notified
+
+            # Demoted: no longer allowed on /orders
+            assert client.get("/orders/0", headers=headers).status_code == 403
+        finally:
+            listener.stop()
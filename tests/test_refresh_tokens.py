@@ -0,0 +1,135 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select, text
+
+import app.services.refresh_tokens as refresh_tokens
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.refresh_token import RefreshToken
+from app.models.user import User
+from app.services.refresh_tokens import (
+    maintain_refresh_token_partitions,
+    run_refresh_token_retention,
+    sweep_refresh_tokens,
+)
+
+
+def _partitioned_schema(db) -> None:
+    # A partitioned refresh_tokens (as the opt-in migration builds it) in a schema
+    # of its own, first on the search path; the caller's rollback drops it all
+    schema = f"test_partitions_{uuid.uuid4().hex[:8]}"
+    db.execute(text(f"CREATE SCHEMA {schema}"))
+    db.execute(text(f"SET LOCAL search_path TO {schema}, public"))
+    db.execute(
+        text(
+            """
+            CREATE TABLE refresh_tokens (
+                id serial,
+                user_id integer NOT NULL,
+                token_hash varchar(64) NOT NULL,
+                created_at timestamptz NOT NULL,
+                expires_at timestamptz NOT NULL,
+                revoked_at timestamptz,
+                PRIMARY KEY (id, expires_at)
+            ) PARTITION BY RANGE (expires_at)
+            """
+        )
+    )
+    db.execute(text("CREATE TABLE refresh_tokens_default PARTITION OF refresh_tokens DEFAULT"))
+
+
+def _partitions(db) -> dict[str, int]:
+    names = db.scalars(
+        text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = 'refresh_tokens'::regclass ORDER BY c.relname"
+        )
+    ).all()
+    return {name: db.scalar(text(f'SELECT count(*) FROM "{name}"')) for name in names}
+
+
+def _token(user_id: int, expires_at: datetime, revoked_at: datetime | None = None) -> RefreshToken:
+    return RefreshToken(
+        user_id=user_id,
+        token_hash=uuid.uuid4().hex,
+        created_at=expires_at - timedelta(days=settings.refresh_token_ttl_days),
+        expires_at=expires_at,
+        revoked_at=revoked_at,
+    )
+
+
+def test_partition_maintenance_moves_stray_rows_out_of_the_default_partition():
+    now = datetime.now(timezone.utc)
+    this_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    next_month = (this_month + timedelta(days=32)).replace(day=1)
+    old_month = (this_month - timedelta(days=95)).replace(day=1)
+
+    with SessionLocal() as db:
+        _partitioned_schema(db)
+        old_end = (old_month + timedelta(days=32)).replace(day=1)
+        db.execute(
+            text(
+                f"CREATE TABLE refresh_tokens_p{old_month:%Y%m} PARTITION OF refresh_tokens "
+                f"FOR VALUES FROM ('{old_month.isoformat()}') TO ('{old_end.isoformat()}')"
+            )
+        )
+        # The sweeper was down: tokens expiring this month and next ended up in the default partition
+        db.add_all([_token(1, this_month + timedelta(days=1)), _token(1, next_month + timedelta(days=1))])
+        db.flush()
+        assert _partitions(db)["refresh_tokens_default"] == 2
+
+        dropped = maintain_refresh_token_partitions(db, cutoff=now - timedelta(days=7), until=next_month)
+
+        assert dropped == [f"refresh_tokens_p{old_month:%Y%m}"]
+        assert _partitions(db) == {
+            "refresh_tokens_default": 0,
+            f"refresh_tokens_p{this_month:%Y%m}": 1,
+            f"refresh_tokens_p{next_month:%Y%m}": 1,
+        }
+        assert db.scalar(select(func.count()).select_from(RefreshToken)) == 2
+
+        # Nothing left to do on the next pass
+        assert maintain_refresh_token_partitions(db, cutoff=now - timedelta(days=7), until=next_month) == []
+        db.rollback()
+
+
+def test_sweep_deletes_expired_and_revoked_tokens_in_batches():
+    now = datetime.now(timezone.utc)
+    cutoff = now - timedelta(days=7)
+
+    with SessionLocal() as db:
+        _partitioned_schema(db)  # an empty refresh_tokens of the test's own
+        db.add_all(
+            [_token(1, cutoff - timedelta(days=1)) for _ in range(3)]
+            + [_token(1, now + timedelta(days=1), revoked_at=cutoff - timedelta(hours=1)) for _ in range(2)]
+            + [_token(1, now + timedelta(days=1), revoked_at=now), _token(1, cutoff + timedelta(hours=1))]
+        )
+        db.flush()
+
+        assert [sweep_refresh_tokens(db, cutoff, batch_size=2) for _ in range(4)] == [2, 2, 1, 0]
+        assert db.scalar(select(func.count()).select_from(RefreshToken)) == 2
+        db.rollback()
+
+
+def test_failed_partition_maintenance_does_not_block_the_sweep(monkeypatch):
+    email = f"sweep-{uuid.uuid4().hex[:8]}@example.com"
+    expired = datetime.now(timezone.utc) - timedelta(days=settings.refresh_token_retention_days + 1)
+    with SessionLocal() as db:
+        user = User(email=email, hashed_password="!", role="operator")
+        db.add(user)
+        db.flush()
+        user_id = user.id
+        db.add_all([_token(user_id, expired) for _ in range(3)])
+        db.commit()
+
+    def fail(db, cutoff, until):
+        db.execute(text("SELECT 1 FROM refresh_tokens_no_such_partition"))
+
+    monkeypatch.setattr(refresh_tokens, "_is_partitioned", lambda db: True)
+    monkeypatch.setattr(refresh_tokens, "maintain_refresh_token_partitions", fail)
+    monkeypatch.setattr(settings, "refresh_token_sweep_batch_size", 2)
+
+    assert run_refresh_token_retention() >= 3
+    with SessionLocal() as db:
+        assert db.scalar(select(func.count()).select_from(RefreshToken).where(RefreshToken.user_id == user_id)) == 0
@@ -0,0 +1,100 @@
+import asyncio
+import uuid
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select
+
+from app.db.session import SessionLocal
+from app.models.order import Order, OrderStatus
+from app.models.order_event import OrderEvent
+from app.models.order_item import OrderItem
+from app.models.product import Product
+import app.services.reservation_batcher as batcher
+from app.core.config import settings
+from app.services.reservation_batcher import ReservationCoordinator, _PendingReservation, process_reservation_batch
+
+
+def _order_with_item(db, product_id: int, qty: int) -> int:
+    order = Order(customer_id=1, reference=f"NL-BATCH-TEST-{uuid.uuid4().hex[:8]}", status=OrderStatus.NEW)
+    db.add(order)
+    db.flush()
+    db.add(OrderItem(order_id=order.id, product_id=product_id, qty=qty))
+    return order.id
+
+
+def test_batch_allocates_in_order_id_order_and_audits_each_order():
+    db = SessionLocal()
+    try:
+        product = Product(sku=f"BATCH-TEST-{uuid.uuid4().hex[:8]}", name="batch test SKU", stock_qty=3)
+        db.add(product)
+        db.flush()
+        first = _order_with_item(db, product.id, 2)
+        second = _order_with_item(db, product.id, 2)
+        third = _order_with_item(db, product.id, 1)
+        db.commit()
+        product_id = product.id
+    finally:
+        db.close()
+
+    batch = [
+        _PendingReservation(order_id, OrderStatus.NEW, None, f"rid-{order_id}")
+        for order_id in (third, second, first, first)
+    ]
+    outcomes = process_reservation_batch(batch)
+
+    assert outcomes[first] == OrderStatus.RESERVED
+    assert outcomes[third] == OrderStatus.RESERVED
+    assert isinstance(outcomes[second], HTTPException) and outcomes[second].status_code == 409
+
+    db = SessionLocal()
+    try:
+        assert db.scalar(select(Product.stock_qty).where(Product.id == product_id)) == 0
+        statuses = dict(db.execute(select(Order.id, Order.status).where(Order.id.in_([first, second, third]))).all())
+        assert statuses == {
+            first: OrderStatus.RESERVED,
+            second: OrderStatus.FAILED_RESERVATION,
+            third: OrderStatus.RESERVED,
+        }
+        events = db.execute(
+            select(OrderEvent.order_id, OrderEvent.request_id).where(OrderEvent.order_id.in_([first, second, third]))
+        ).all()
+        assert sorted(events) == sorted([(first, f"rid-{first}"), (second, f"rid-{second}"), (third, f"rid-{third}")])
+    finally:
+        db.close()
+
+
+def test_timeout_answers_503_with_retry_after(monkeypatch):
+    # Never started: nothing resolves the request
+    monkeypatch.setattr(settings, "reservation_batch_timeout_seconds", 0.05)
+    coordinator = ReservationCoordinator(enabled=True, window_ms=5, max_batch=10)
+
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(coordinator.reserve(1, OrderStatus.NEW))
+    assert e.value.status_code == 503
+    assert e.value.headers["Retry-After"] == str(settings.reservation_batch_retry_after_seconds)
+
+
+def test_failed_batch_is_retried_one_order_at_a_time(monkeypatch):
+    calls = []
+
+    def process(batch):
+        order_ids = sorted({p.order_id for p in batch})
+        calls.append(order_ids)
+        if len(order_ids) > 1 or order_ids == [3]:
+            raise RuntimeError("deadlock detected")
+        return {order_ids[0]: OrderStatus.RESERVED}
+
+    monkeypatch.setattr(batcher, "process_reservation_batch", process)
+    coordinator = ReservationCoordinator(enabled=True, window_ms=50, max_batch=10)
+    pending = [_PendingReservation(order_id, OrderStatus.NEW, None, None) for order_id in (1, 2, 3, 3)]
+    for p in pending:
+        coordinator._queue.put(p)
+    coordinator.start()
+    coordinator.stop()
+
+    assert calls == [[1, 2, 3], [1], [2], [3]]
+    assert [p.future.result() for p in pending[:2]] == [OrderStatus.RESERVED, OrderStatus.RESERVED]
+    errors = [p.future.exception() for p in pending[2:]]
+    assert [e.status_code for e in errors] == [503, 503]
+    assert errors[0] is not errors[1]